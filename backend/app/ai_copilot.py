@@ -1,44 +1,68 @@
 from .config import get_settings
+from collections import defaultdict
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func, select, update
 from sqlalchemy.orm import Session
 from .models import ReconciliationIssue, Trade, LedgerEntry
-from typing import List, Dict
-import anthropic
+from .copilot_cache import ResponseCache, content_key, normalize_query
+from .copilot_context import SEVERITY_RANK, ContextBuilder
+from .llm import MODEL, get_llm_client
+from . import versions
+from typing import AsyncIterator, List, Dict, Optional, Tuple
+import asyncio
 import os
 
 settings = get_settings()
 
+MAX_BULK_EXPLANATIONS = 500
+
+# Shared across requests: AICopilot itself is built per request
+explanation_cache = ResponseCache(settings.copilot_cache_size, settings.copilot_cache_ttl_seconds)
+query_cache = ResponseCache(settings.copilot_cache_size, settings.copilot_cache_ttl_seconds)
+
 class AICopilot:
+    """Copilot for one request: database work runs in the threadpool, model calls on the event loop.
+
+    The model client is shared process-wide (`llm.get_llm_client`) and is None
+    unless an API key is configured, in which case rule-based answers are used.
+    """
+
     def __init__(self, db: Session):
         self.db = db
-        self.client = None
-        
-        # Only initialize Anthropic client if API key is set and not dummy
-        api_key = settings.anthropic_api_key
-        if api_key and api_key != "dummy_key":
-            self.client = anthropic.Anthropic(api_key=api_key)
+        self.client = get_llm_client()
+    
+    def _context_builder(self) -> ContextBuilder:
+        return ContextBuilder(self.db, settings.copilot_context_tokens, settings.copilot_context_top_n)
     
-    def _get_system_context(self) -> str:
+    def _get_system_context(self, counts: Dict[str, int]) -> str:
         """Build context about current system state"""
-        total_trades = self.db.query(Trade).count()
-        pending_trades = self.db.query(Trade).filter(Trade.status == "pending").count()
-        total_ledger = self.db.query(LedgerEntry).count()
-        open_issues = self.db.query(ReconciliationIssue).filter(
-            ReconciliationIssue.resolved == False
-        ).count()
-        
         context = f"""You are an AI assistant for OpsPilot, an operations reconciliation system.
 
 Current System State:
-- Total Trades: {total_trades}
-- Pending Trades: {pending_trades}
-- Ledger Entries: {total_ledger}
-- Open Reconciliation Issues: {open_issues}
+- Total Trades: {counts['total_trades']}
+- Pending Trades: {counts['pending_trades']}
+- Ledger Entries: {counts['total_ledger']}
+- Open Reconciliation Issues: {counts['open_issues']}
 
 Your role is to help operations teams understand reconciliation issues, explain discrepancies, 
 and provide actionable insights about the system's data quality.
 """
         return context
     
+    def _state_version(self) -> Tuple:
+        """Changes whenever the data behind a query answer may have changed.
+
+        Combines the tables' change counters, which every writing process bumps,
+        with the highest row ids, which also catch rows inserted directly.
+        """
+        fingerprint = self.db.execute(select(
+            *[versions.version_of(table) for table in versions.TABLES],
+            select(func.max(Trade.id)).scalar_subquery(),
+            select(func.max(LedgerEntry.id)).scalar_subquery(),
+            select(func.max(ReconciliationIssue.id)).scalar_subquery()
+        )).one()
+        return tuple(fingerprint)
+    
     def _get_issue_details(self, issue_id: int) -> Dict:
         """Get detailed information about an issue and related data"""
         issue = self.db.query(ReconciliationIssue).filter(
@@ -48,25 +72,47 @@ and provide actionable insights about the system's data quality.
         if not issue:
             return None
         
-        result = {
-            "issue": {
-                "id": issue.id,
-                "type": issue.issue_type,
-                "description": issue.description,
-                "severity": issue.severity,
-                "trade_id": issue.trade_id,
-                "detected_at": str(issue.detected_at),
-            },
-            "trade": None,
-            "ledger_entries": []
-        }
-        
-        # Get related trade
-        if issue.trade_id:
-            trade = self.db.query(Trade).filter(
-                Trade.trade_id == issue.trade_id
-            ).first()
+        return self._load_issue_details([issue])[0]
+    
+    def _get_open_issue_details(self, limit: int, severity: Optional[str] = None) -> List[Dict]:
+        """Details for the most severe, then most recent, open issues"""
+        issues = self.db.query(ReconciliationIssue).filter(ReconciliationIssue.resolved == False)
+        if severity is not None:
+            issues = issues.filter(ReconciliationIssue.severity == severity)
+        issues = issues.order_by(SEVERITY_RANK, ReconciliationIssue.id.desc()).limit(limit).all()
+        return self._load_issue_details(issues)
+    
+    def _load_issue_details(self, issues: List[ReconciliationIssue]) -> List[Dict]:
+        """Issue details with their trades and ledger entries, in one query per table"""
+        trade_ids = {issue.trade_id for issue in issues if issue.trade_id}
+        trades = {}
+        ledger = defaultdict(list)
+        if trade_ids:
+            for trade in self.db.query(Trade).filter(Trade.trade_id.in_(trade_ids)):
+                trades[trade.trade_id] = trade
+            entries = self.db.query(LedgerEntry).filter(
+                LedgerEntry.trade_id.in_(trade_ids)
+            ).order_by(LedgerEntry.id)
+            for entry in entries:
+                ledger[entry.trade_id].append(entry)
+        
+        details = []
+        for issue in issues:
+            result = {
+                "issue": {
+                    "id": issue.id,
+                    "type": issue.issue_type,
+                    "description": issue.description,
+                    "severity": issue.severity,
+                    "trade_id": issue.trade_id,
+                    "detected_at": str(issue.detected_at),
+                },
+                "trade": None,
+                "ledger_entries": [],
+                "stored_explanation": issue.ai_explanation
+            }
             
+            trade = trades.get(issue.trade_id)
             if trade:
                 result["trade"] = {
                     "trade_id": trade.trade_id,
@@ -78,12 +124,6 @@ and provide actionable insights about the system's data quality.
                     "timestamp": str(trade.timestamp),
                     "expected_amount": trade.quantity * trade.price
                 }
-                
-                # Get related ledger entries
-                ledger_entries = self.db.query(LedgerEntry).filter(
-                    LedgerEntry.trade_id == issue.trade_id
-                ).all()
-                
                 result["ledger_entries"] = [
                     {
                         "amount": entry.amount,
@@ -91,14 +131,51 @@ and provide actionable insights about the system's data quality.
                         "entry_type": entry.entry_type,
                         "timestamp": str(entry.timestamp)
                     }
-                    for entry in ledger_entries
+                    for entry in ledger[issue.trade_id]
                 ]
+            details.append(result)
+        
+        return details
+    
+    def _cached_explanation(self, details: Dict) -> Tuple[str, Optional[str]]:
+        """Return (cache key, explanation already on hand or None)"""
+        # Keyed on the issue, trade and ledger snapshot the prompt is built from
+        cache_key = content_key(MODEL, details["issue"], details["trade"], details["ledger_entries"])
+        cached = explanation_cache.get(cache_key)
+        if cached is not None:
+            return cache_key, cached
         
-        return result
+        # Upserting an issue with new details clears its stored explanation
+        if details["stored_explanation"]:
+            explanation_cache.set(cache_key, details["stored_explanation"])
+            return cache_key, details["stored_explanation"]
+        return cache_key, None
     
-    def explain_issue(self, issue_id: int) -> str:
+    async def _read(self, fn, *args):
+        """Run a read in the threadpool, then hand its connection back before any model call.
+
+        Otherwise the session would keep the connection checked out while the
+        model answers, starving writers (SQLite's single writer in particular).
+        """
+        def read():
+            try:
+                return fn(*args)
+            finally:
+                self.db.close()
+        return await run_in_threadpool(read)
+    
+    def _store_explanations(self, explanations: Dict[int, str]):
+        """Persist model explanations on their issues in one transaction"""
+        self.db.execute(update(ReconciliationIssue), [
+            {"id": issue_id, "ai_explanation": explanation}
+            for issue_id, explanation in explanations.items()
+        ])
+        versions.bump(self.db, "issues")
+        self.db.commit()
+    
+    async def explain_issue(self, issue_id: int) -> str:
         """Explain a reconciliation issue using AI"""
-        details = self._get_issue_details(issue_id)
+        details = await self._read(self._get_issue_details, issue_id)
         
         if not details:
             return "Issue not found"
@@ -107,31 +184,62 @@ and provide actionable insights about the system's data quality.
         if not self.client:
             return self._generate_basic_explanation(details)
         
+        cache_key, cached = self._cached_explanation(details)
+        if cached is not None:
+            return cached
+        
         # Generate AI-powered explanation
         try:
-            prompt = self._build_issue_explanation_prompt(details)
-            
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            
-            explanation = message.content[0].text
-            
-            # Store the AI explanation in the database
-            issue = self.db.query(ReconciliationIssue).filter(
-                ReconciliationIssue.id == issue_id
-            ).first()
-            issue.ai_explanation = explanation
-            self.db.commit()
-            
-            return explanation
-            
+            explanation = await self.client.complete(self._build_issue_explanation_prompt(details))
         except Exception as e:
             return f"Error generating AI explanation: {str(e)}\n\n{self._generate_basic_explanation(details)}"
+        
+        # Store the AI explanation in the database
+        await run_in_threadpool(self._store_explanations, {issue_id: explanation})
+        explanation_cache.set(cache_key, explanation)
+        return explanation
+    
+    async def explain_open_issues(self, limit: int = 50, severity: Optional[str] = None) -> List[Dict]:
+        """Explain the most severe open issues, calling the model concurrently for uncached ones.
+
+        Concurrency is bounded by the shared client's semaphore. A failed call
+        falls back to the rule-based explanation for that issue only.
+        """
+        all_details = await self._read(self._get_open_issue_details, limit, severity)
+        results = []
+        pending = []
+        for details in all_details:
+            result = {"issue_id": details["issue"]["id"], "explanation": None, "source": None}
+            results.append(result)
+            if not self.client:
+                result.update(explanation=self._generate_basic_explanation(details), source="basic")
+                continue
+            cache_key, cached = self._cached_explanation(details)
+            if cached is not None:
+                result.update(explanation=cached, source="cache")
+            else:
+                pending.append((result, details, cache_key))
+        
+        outcomes = await asyncio.gather(
+            *[self.client.complete(self._build_issue_explanation_prompt(details)) for _, details, _ in pending],
+            return_exceptions=True
+        )
+        
+        generated = {}
+        for (result, details, cache_key), outcome in zip(pending, outcomes):
+            if isinstance(outcome, Exception):
+                result.update(
+                    explanation=f"Error generating AI explanation: {str(outcome)}\n\n{self._generate_basic_explanation(details)}",
+                    source="error"
+                )
+            else:
+                result.update(explanation=outcome, source="model")
+                generated[result["issue_id"]] = outcome
+                explanation_cache.set(cache_key, outcome)
+        
+        if generated:
+            await run_in_threadpool(self._store_explanations, generated)
+        return results
     
     def _build_issue_explanation_prompt(self, details: Dict) -> str:
         """Build a detailed prompt for issue explanation"""
@@ -209,75 +317,111 @@ Keep the explanation concise but thorough, suitable for both technical and non-t
             explanation += "Impact: Books don't match trade records, indicating a calculation or entry error.\n"
             explanation += "Action: Review the ledger entry calculation and correct the amount.\n"
         
+        elif issue['type'] == 'LEDGER_ID_MISMATCH':
+            explanation += "Problem: The ledger entry for this trade appears to be booked under a mistyped or reformatted trade ID.\n"
+            explanation += "Impact: The trade looks unbooked and the ledger shows an entry with no trade, until the ID is corrected.\n"
+            explanation += "Action: Confirm the pairing in the description and correct the trade ID on the ledger entry.\n"
+        
+        elif issue['type'] == 'ORPHAN_LEDGER_ENTRY':
+            explanation += "Problem: These ledger entries reference a trade ID that does not exist.\n"
+            explanation += "Impact: Money is booked against no known trade, so the books may be overstated.\n"
+            explanation += "Action: Find the originating trade (it may not be ingested yet) or reverse the entries.\n"
+        
         elif issue['type'] == 'ANOMALOUS_QUANTITY':
             explanation += "Problem: This trade quantity is significantly higher than average.\n"
             explanation += "Impact: Could indicate a fat-finger error, unauthorized trading, or legitimate large trade.\n"
             explanation += "Action: Verify the trade with the trader and their supervisor.\n"
         
+        elif issue['type'] in ('NOTIONAL_OUTLIER', 'TRADER_QUANTITY_OUTLIER'):
+            explanation += "Problem: This trade is far outside the usual range for its instrument or trader.\n"
+            explanation += "Impact: Could indicate a fat-finger error, a booking error, or unusual risk-taking.\n"
+            explanation += "Action: Confirm the size and price with the trader and check it against their limits.\n"
+        
+        elif issue['type'] == 'PRICE_DEVIATION':
+            explanation += "Problem: The trade price deviates from the instrument's recent volume-weighted average price.\n"
+            explanation += "Impact: Could indicate an off-market price, a stale quote, or a mistyped price.\n"
+            explanation += "Action: Compare the price with market data at the trade time and amend if it was mis-keyed.\n"
+        
         explanation += "\n[Configure ANTHROPIC_API_KEY in .env for AI-powered explanations]"
         
         return explanation
     
-    def answer_query(self, query: str) -> str:
-        """Answer natural language questions about the system"""
-        # Get current system state
-        issues = self.db.query(ReconciliationIssue).filter(
-            ReconciliationIssue.resolved == False
-        ).all()
+    def _prepare_query(self, query: str) -> Dict:
+        """Everything an answer needs from the database, gathered before any model call"""
+        prepared = {"cache_key": None, "cached": None, "system": None}
+        if self.client:
+            prepared["cache_key"] = content_key(MODEL, normalize_query(query), self._state_version())
+            prepared["cached"] = query_cache.get(prepared["cache_key"])
+            if prepared["cached"] is not None:
+                return prepared
         
-        trades = self.db.query(Trade).all()
-        total_trades = len(trades)
-        pending_trades = len([t for t in trades if t.status == "pending"])
+        # Aggregates and bounded samples only: never load whole tables
+        builder = self._context_builder()
+        counts = builder.counts()
+        retrieval = builder.retrieve(query)
+        issues = retrieval["issues"][:5] or [
+            {"issue_type": issue.issue_type, "description": issue.description} for issue in builder.top_issues(5)
+        ]
+        prepared["fallback"] = self._generate_basic_query_response(query, counts, issues)
+        if self.client:
+            prepared["system"] = self._get_system_context(counts) + builder.build(retrieval)
+        return prepared
+    
+    async def answer_query(self, query: str) -> str:
+        """Answer natural language questions about the system"""
+        prepared = await self._read(self._prepare_query, query)
+        if prepared["cached"] is not None:
+            return prepared["cached"]
         
         # If no API client, return basic response
         if not self.client:
-            return self._generate_basic_query_response(query, issues, total_trades, pending_trades)
+            return prepared["fallback"]
         
         # Generate AI-powered response
         try:
-            system_context = self._get_system_context()
-            
-            # Build detailed context about issues
-            issues_context = ""
-            if issues:
-                issues_context = "\n\nCurrent Open Issues:\n"
-                for issue in issues:
-                    issues_context += f"- {issue.issue_type} (Severity: {issue.severity}): {issue.description}\n"
-                    if issue.trade_id:
-                        issues_context += f"  Trade ID: {issue.trade_id}\n"
-            
-            # Build context about trades
-            trades_context = "\n\nRecent Trades:\n"
-            for trade in trades[-5:]:  # Last 5 trades
-                trades_context += f"- {trade.trade_id}: {trade.trader} - {trade.instrument} ({trade.side}) - {trade.quantity}@${trade.price}\n"
-            
-            full_context = system_context + issues_context + trades_context
-            
-            message = self.client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=1000,
-                system=full_context,
-                messages=[
-                    {"role": "user", "content": query}
-                ]
-            )
-            
-            return message.content[0].text
-            
+            answer = await self.client.complete(query, system=prepared["system"])
         except Exception as e:
-            return f"Error generating AI response: {str(e)}\n\n{self._generate_basic_query_response(query, issues, total_trades, pending_trades)}"
+            return f"Error generating AI response: {str(e)}\n\n{prepared['fallback']}"
+        
+        query_cache.set(prepared["cache_key"], answer)
+        return answer
+    
+    async def stream_query(self, query: str) -> AsyncIterator[str]:
+        """Like `answer_query`, as text chunks; the database is only used before this returns"""
+        prepared = await self._read(self._prepare_query, query)
+        return self._stream_answer(query, prepared)
+    
+    async def _stream_answer(self, query: str, prepared: Dict) -> AsyncIterator[str]:
+        if prepared["cached"] is not None:
+            yield prepared["cached"]
+            return
+        if not self.client:
+            yield prepared["fallback"]
+            return
+        
+        parts = []
+        try:
+            async for text in self.client.stream(query, system=prepared["system"]):
+                parts.append(text)
+                yield text
+        except Exception as e:
+            yield f"\n\nError generating AI response: {str(e)}\n\n{prepared['fallback']}"
+            return
+        
+        # Only complete answers are cached; a disconnect closes the generator before this
+        query_cache.set(prepared["cache_key"], "".join(parts))
     
-    def _generate_basic_query_response(self, query: str, issues: List, total_trades: int, pending_trades: int) -> str:
+    def _generate_basic_query_response(self, query: str, counts: Dict[str, int], issues: List) -> str:
         """Generate a basic response when AI is not available"""
         response = f"System Status:\n"
-        response += f"- Total Trades: {total_trades}\n"
-        response += f"- Pending Trades: {pending_trades}\n"
-        response += f"- Open Issues: {len(issues)}\n\n"
+        response += f"- Total Trades: {counts['total_trades']}\n"
+        response += f"- Pending Trades: {counts['pending_trades']}\n"
+        response += f"- Open Issues: {counts['open_issues']}\n\n"
         
         if issues:
-            response += "Recent Issues:\n"
-            for issue in issues[:5]:
-                response += f"- {issue.issue_type}: {issue.description}\n"
+            response += "Top Issues:\n"
+            for issue in issues:
+                response += f"- {issue['issue_type']}: {issue['description']}\n"
         else:
             response += "No open issues - system is healthy! ✅\n"
         
@@ -0,0 +1,289 @@
+"""Cold tier: settled rows moved out of the live tables into Parquet.
+
+    python -m backend.app.archive run --older-than-days 90
+    python -m backend.app.archive query trades --trade-id T000123
+    python -m backend.app.archive query issues --since 2025-01-01 --until 2025-02-01 --fields issue_type,trade_id
+
+A run moves, oldest first and `batch_size` rows per transaction:
+
+- reconciled trades older than the retention age that have no open issue and
+  no unreconciled ledger row, together with their ledger rows
+- resolved issues detected before the retention age
+
+Rows are written to `<archive_dir>/<table>/date=YYYY-MM-DD/part-*.parquet`
+(zstd, partitioned on the row's own timestamp, sorted by trade_id so row-group
+statistics skip most of a file on a trade lookup), then deleted from the live
+table in the same transaction that takes them out of the summary counters.
+The newest row of each table is never archived, so SQLite cannot hand its id
+out again and the reconciliation watermarks stay valid.
+
+`query` reads the archive through memory-mapped files, opening only the date
+partitions and columns a query asks for.
+"""
+import argparse
+import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import Boolean, DateTime, Float, Integer, String, delete, func, or_, select
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .events import event_bus
+from .listing import parse_fields
+from .models import LedgerEntry, ReconciliationIssue, Trade
+from .summary import LEDGER, SummaryDelta
+from . import versions
+
+DEFAULT_BATCH_SIZE = 20000
+DEFAULT_QUERY_LIMIT = 1000
+LOOKUP_CHUNK_SIZE = 500  # ids per IN (...) when reading and deleting a batch
+UNDATED = "undated"  # partition for rows without a timestamp
+
+ARCHIVED = {
+    "trades": {"model": Trade, "time": "timestamp"},
+    "ledger": {"model": LedgerEntry, "time": "timestamp"},
+    "issues": {"model": ReconciliationIssue, "time": "detected_at"},
+}
+
+def _arrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.fs as pafs
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("The Parquet archive requires pyarrow (pip install pyarrow)") from e
+    return pa, ds, pafs, pq
+
+def fields(table: str) -> List[str]:
+    return [column.key for column in ARCHIVED[table]["model"].__table__.columns]
+
+def arrow_schema(table: str):
+    pa = _arrow()[0]
+    types = {Integer: pa.int64(), Float: pa.float64(), String: pa.string(),
+             DateTime: pa.timestamp("us"), Boolean: pa.bool_()}
+    columns = ARCHIVED[table]["model"].__table__.columns
+    return pa.schema([(column.key, types[type(column.type)]) for column in columns])
+
+def _partition(value: Optional[datetime]) -> str:
+    return value.date().isoformat() if value is not None else UNDATED
+
+class ArchiveWriter:
+    """Moves one batch of rows at a time from the live tables into Parquet files"""
+
+    def __init__(self, db: Session, root: str, cutoff: datetime, batch_size: int = DEFAULT_BATCH_SIZE):
+        self.db = db
+        self.root = root
+        self.cutoff = cutoff
+        self.batch_size = batch_size
+        self.run_id = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+        self.batches = 0
+        self.written: List[str] = []  # files of the batch in progress, removed if it fails
+        self.report = {"trades": 0, "ledger": 0, "issues": 0, "files": 0, "bytes": 0}
+        self.max_ids = {
+            table: db.execute(select(func.max(spec["model"].id))).scalar() or 0
+            for table, spec in ARCHIVED.items()
+        }
+
+    def trade_batch(self) -> int:
+        """Archive the next batch of settled trades with their ledger rows; returns the trades moved"""
+        open_issue = select(ReconciliationIssue.id).where(
+            ReconciliationIssue.trade_id == Trade.trade_id, ReconciliationIssue.resolved == False
+        ).exists()
+        # A trade stays while any of its ledger rows must: unreconciled, or the newest ledger row
+        held_ledger = select(LedgerEntry.id).where(
+            LedgerEntry.trade_id == Trade.trade_id,
+            or_(LedgerEntry.reconciled.is_not(True), LedgerEntry.id >= self.max_ids["ledger"]),
+        ).exists()
+        trades = [dict(row) for row in self.db.execute(
+            select(*Trade.__table__.columns)
+            .where(Trade.status == "reconciled", Trade.timestamp < self.cutoff,
+                   Trade.id < self.max_ids["trades"], ~open_issue, ~held_ledger)
+            .order_by(Trade.timestamp, Trade.id)
+            .limit(self.batch_size)
+        ).mappings()]
+        if not trades:
+            return 0
+
+        ledger = []
+        trade_ids = [trade["trade_id"] for trade in trades]
+        for start in range(0, len(trade_ids), LOOKUP_CHUNK_SIZE):
+            ledger.extend(dict(row) for row in self.db.execute(
+                select(*LedgerEntry.__table__.columns)
+                .where(LedgerEntry.trade_id.in_(trade_ids[start:start + LOOKUP_CHUNK_SIZE]))
+            ).mappings())
+
+        delta = SummaryDelta()
+        for trade in trades:
+            delta.add_trade(trade, -1)
+        delta.add(LEDGER, "reconciled", -len(ledger))
+        self._move({"trades": trades, "ledger": ledger}, delta)
+        return len(trades)
+
+    def issue_batch(self) -> int:
+        """Archive the next batch of resolved issues; returns the issues moved"""
+        issues = [dict(row) for row in self.db.execute(
+            select(*ReconciliationIssue.__table__.columns)
+            .where(ReconciliationIssue.resolved == True, ReconciliationIssue.detected_at < self.cutoff,
+                   ReconciliationIssue.id < self.max_ids["issues"])
+            .order_by(ReconciliationIssue.id)
+            .limit(self.batch_size)
+        ).mappings()]
+        if issues:
+            self._move({"issues": issues}, SummaryDelta())
+        return len(issues)
+
+    def _move(self, rows: Dict[str, List[Dict]], delta: SummaryDelta):
+        """Write the rows out, delete them and commit; a failure removes the batch's files again"""
+        self.batches += 1
+        try:
+            for table, table_rows in rows.items():
+                self._write(table, table_rows)
+                model = ARCHIVED[table]["model"]
+                ids = [row["id"] for row in table_rows]
+                for start in range(0, len(ids), LOOKUP_CHUNK_SIZE):
+                    self.db.execute(delete(model).where(model.id.in_(ids[start:start + LOOKUP_CHUNK_SIZE])))
+            delta.apply(self.db)
+            versions.bump(self.db, *rows)
+            self.db.commit()
+        except BaseException:
+            self.db.rollback()
+            for path in self.written:
+                if os.path.exists(path):
+                    os.remove(path)
+            raise
+        finally:
+            self.written = []
+
+        for table, table_rows in rows.items():
+            self.report[table] += len(table_rows)
+
+    def _write(self, table: str, rows: List[Dict]):
+        if not rows:
+            return
+        pa, _, _, pq = _arrow()
+        schema = arrow_schema(table)
+        by_date = defaultdict(list)
+        for row in rows:
+            by_date[_partition(row[ARCHIVED[table]["time"]])].append(row)
+
+        for date, part in by_date.items():
+            part.sort(key=lambda row: (row["trade_id"] or "", row["id"]))
+            directory = os.path.join(self.root, table, f"date={date}")
+            os.makedirs(directory, exist_ok=True)
+            name = f"part-{self.run_id}-{self.batches:05d}.parquet"
+            path = os.path.join(directory, name)
+            temporary = os.path.join(directory, f"_{name}")  # "_" files are skipped by readers
+            pq.write_table(pa.Table.from_pylist(part, schema=schema), temporary, compression="zstd")
+            os.replace(temporary, path)
+            self.written.append(path)
+            self.report["files"] += 1
+            self.report["bytes"] += os.path.getsize(path)
+
+def archive(db: Session, older_than_days: Optional[int] = None, batch_size: int = DEFAULT_BATCH_SIZE,
+            root: Optional[str] = None, progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Move settled rows older than the retention age into the archive; returns counts moved"""
+    settings = get_settings()
+    days = settings.archive_retention_days if older_than_days is None else older_than_days
+    started = time.perf_counter()
+    writer = ArchiveWriter(db, root or settings.archive_dir, datetime.utcnow() - timedelta(days=days), batch_size)
+
+    while writer.trade_batch():
+        if progress:
+            progress(writer.report)
+    while writer.issue_batch():
+        if progress:
+            progress(writer.report)
+
+    report = dict(writer.report, cutoff=writer.cutoff.isoformat(), seconds=round(time.perf_counter() - started, 3))
+    if report["trades"]:
+        event_bus.publish("trades.changed", {"archived": report["trades"]})
+    if report["ledger"]:
+        event_bus.publish("ledger.changed", {"archived": report["ledger"]})
+    return report
+
+def open_dataset(table: str, root: Optional[str] = None):
+    """The archived rows of `table` as a pyarrow dataset over memory-mapped files, or None if there are none"""
+    pa, ds, pafs, _ = _arrow()
+    path = os.path.abspath(os.path.join(root or get_settings().archive_dir, table))
+    if not os.path.isdir(path):
+        return None
+    return ds.dataset(
+        path, format="parquet", filesystem=pafs.LocalFileSystem(use_mmap=True),
+        partitioning=ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive"),
+    )
+
+def query(table: str, columns: Optional[List[str]] = None, trade_id: Optional[str] = None,
+          since: Optional[datetime] = None, until: Optional[datetime] = None,
+          limit: int = DEFAULT_QUERY_LIMIT, root: Optional[str] = None) -> List[Dict]:
+    """Archived rows matching the filters; `since`/`until` bound the row's timestamp and prune partitions"""
+    dataset = open_dataset(table, root)
+    if dataset is None:
+        return []
+    pa, ds, _, _ = _arrow()
+    stamp = ds.field(ARCHIVED[table]["time"])
+    conditions = []
+    if since is not None:
+        conditions += [ds.field("date") >= since.date().isoformat(), stamp >= pa.scalar(since, pa.timestamp("us"))]
+    if until is not None:
+        conditions += [ds.field("date") <= until.date().isoformat(), stamp < pa.scalar(until, pa.timestamp("us"))]
+    if trade_id is not None:
+        conditions.append(ds.field("trade_id") == trade_id)
+
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    columns = columns or fields(table)
+    return dataset.scanner(columns=columns, filter=expression).head(limit).to_pylist()
+
+def main(argv: Optional[List[str]] = None):
+    from .database import WriteSessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Archive settled rows to Parquet or query the archive")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="move settled rows older than the retention age")
+    run.add_argument("--older-than-days", type=int, default=None,
+                     help="defaults to ARCHIVE_RETENTION_DAYS")
+    run.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    run.add_argument("--vacuum", action="store_true", help="SQLite: give the freed pages back to the filesystem")
+    read = commands.add_parser("query", help="print archived rows as JSON lines")
+    read.add_argument("table", choices=sorted(ARCHIVED))
+    read.add_argument("--trade-id")
+    read.add_argument("--since", type=datetime.fromisoformat)
+    read.add_argument("--until", type=datetime.fromisoformat)
+    read.add_argument("--fields", help="comma-separated columns")
+    read.add_argument("--limit", type=int, default=DEFAULT_QUERY_LIMIT)
+    args = parser.parse_args(argv)
+
+    if args.command == "query":
+        import json
+
+        columns = parse_fields(args.fields, fields(args.table))
+        for row in query(args.table, columns, args.trade_id, args.since, args.until, args.limit):
+            print(json.dumps(row, default=str))
+        return
+
+    def print_progress(report: Dict):
+        print(f"  {report['trades']:,} trades, {report['ledger']:,} ledger rows, "
+              f"{report['issues']:,} issues archived")
+
+    init_db()
+    db = WriteSessionLocal()
+    try:
+        report = archive(db, args.older_than_days, args.batch_size, progress=print_progress)
+        if args.vacuum and db.get_bind().dialect.name == "sqlite":
+            db.close()
+            with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.exec_driver_sql("VACUUM")
+    finally:
+        db.close()
+
+    print(f"Archived {report['trades']:,} trades, {report['ledger']:,} ledger rows and {report['issues']:,} "
+          f"issues older than {report['cutoff']} into {report['files']:,} files "
+          f"({report['bytes']:,} bytes) in {report['seconds']}s")
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,39 @@
 from pydantic_settings import BaseSettings
 from functools import lru_cache
+from typing import Optional
 
 class Settings(BaseSettings):
     database_url: str = "sqlite:///./opspilot.db"
+    db_async: bool = False  # serve read endpoints from an async engine (aiosqlite/asyncpg)
+    async_database_url: Optional[str] = None  # defaults to database_url with the async driver
+    db_pool_size: int = 5  # connections kept open per engine
+    db_max_overflow: int = 10  # extra connections allowed under burst load
+    db_pool_timeout: float = 30.0  # seconds to wait for a free connection
+    db_write_timeout: Optional[float] = None  # seconds a bulk writer waits for the single write connection; unset waits its turn
+    sqlite_profile: str = "default"  # "performance": WAL + tuned pragmas, read-only pool and a single writer
+    sqlite_mmap_size: int = 268435456  # bytes of the database file to memory-map (performance profile)
+    sqlite_cache_size_kb: int = 65536  # page cache per connection (performance profile)
+    sqlite_busy_timeout_ms: int = 5000  # how long a connection waits on a lock before "database is locked"
     anthropic_api_key: str = "dummy_key"
+    anthropic_base_url: Optional[str] = None  # e.g. a local stub server (python -m benchmarks.stub_llm)
+    llm_concurrency: int = 8  # model requests in flight at once, shared by all copilot calls
+    llm_max_retries: int = 3  # SDK retries with exponential backoff on 429/5xx/connection errors
+    llm_timeout_seconds: float = 60.0
     environment: str = "development"
+    profile_dir: Optional[str] = None  # enables X-Profile: 1 request profiling; .prof files are written here
+    reconcile_workers: int = 2  # background reconciliation job threads
+    reconcile_processes: int = 1  # processes per run for partitioned trade/ledger matching
+    copilot_cache_size: int = 1024  # cached copilot answers/explanations (each, LRU)
+    copilot_cache_ttl_seconds: int = 3600
+    page_cache_size: int = 256  # serialized /trades/ and /issues/ pages kept per process (LRU, keyed by ETag)
+    page_cache_ttl_seconds: int = 300
+    copilot_context_tokens: int = 2000  # budget for the aggregated system context in query prompts
+    copilot_context_top_n: int = 5  # rows per ranked section (traders, instruments, mismatches, trades)
+    live_matching: bool = False  # resident matcher: match issues within milliseconds of trade/ledger writes
+    live_match_grace_seconds: float = 300.0  # how long a new trade may wait for a ledger row before MISSING_LEDGER_ENTRY
+    live_match_poll_seconds: float = 1.0  # also pick up rows written by other processes at least this often
+    archive_dir: str = "archive"  # Parquet cold tier written by python -m backend.app.archive
+    archive_retention_days: int = 365  # settled trades, ledger rows and resolved issues older than this are archived
     
     class Config:
         env_file = ".env"
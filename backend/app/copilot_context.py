@@ -0,0 +1,240 @@
+from sqlalchemy import case, desc, func, select
+from sqlalchemy.orm import Session
+from .models import ReconciliationIssue, Trade, LedgerEntry
+from .search_index import issue_index
+from . import summary
+from typing import Dict, List, Optional
+
+CHARS_PER_TOKEN = 4  # rough estimate for English prose and ids
+
+SEVERITY_RANK = case(
+    (ReconciliationIssue.severity == "CRITICAL", 0),
+    (ReconciliationIssue.severity == "HIGH", 1),
+    (ReconciliationIssue.severity == "MEDIUM", 2),
+    else_=3
+)
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+class ContextBuilder:
+    """Summarize system state for the copilot prompt with SQL aggregates.
+
+    Every section is a bounded query (GROUP BY or ORDER BY ... LIMIT), so the
+    cost and size of the context do not grow with the number of trades or
+    open issues. Sections are added in priority order until the token budget
+    is spent. Given the question, the records it names or is about (from
+    `search_index.issue_index`) come first and replace the generic samples.
+    """
+
+    def __init__(self, db: Session, token_budget: int = 2000, top_n: int = 5):
+        self.db = db
+        self.token_budget = token_budget
+        self.top_n = top_n
+
+    def counts(self) -> Dict[str, int]:
+        """Trade, pending trade, ledger and open issue counts from the maintained summary.
+
+        Falls back to counting the tables (one round trip) before the summary is built.
+        """
+        counts = summary.counts(self.db)
+        if counts is not None:
+            return counts
+        row = self.db.execute(select(
+            select(func.count(Trade.id)).scalar_subquery().label("total_trades"),
+            select(func.count(Trade.id)).where(Trade.status == "pending")
+                .scalar_subquery().label("pending_trades"),
+            select(func.count(LedgerEntry.id)).scalar_subquery().label("total_ledger"),
+            select(func.count(ReconciliationIssue.id)).where(ReconciliationIssue.resolved == False)
+                .scalar_subquery().label("open_issues")
+        )).one()
+        return dict(row._mapping)
+
+    def issues_by_type(self) -> List[Dict]:
+        if summary.is_built(self.db):
+            return summary.open_issues_by_type(self.db)
+        rows = self.db.execute(
+            select(ReconciliationIssue.issue_type, ReconciliationIssue.severity,
+                   func.count(ReconciliationIssue.id).label("count"))
+            .where(ReconciliationIssue.resolved == False)
+            .group_by(ReconciliationIssue.issue_type, ReconciliationIssue.severity)
+            .order_by(desc("count"))
+        ).all()
+        return [dict(row._mapping) for row in rows]
+
+    def issues_by(self, column) -> List:
+        """Open issue counts per trader or instrument, largest first"""
+        return self.db.execute(
+            select(column, func.count(ReconciliationIssue.id).label("count"))
+            .join(Trade, Trade.trade_id == ReconciliationIssue.trade_id)
+            .where(ReconciliationIssue.resolved == False)
+            .group_by(column)
+            .order_by(desc("count"))
+            .limit(self.top_n)
+        ).all()
+
+    def largest_mismatches(self) -> List:
+        ledger_totals = (
+            select(LedgerEntry.trade_id, func.sum(LedgerEntry.amount).label("ledger_total"))
+            .group_by(LedgerEntry.trade_id)
+            .subquery()
+        )
+        expected = Trade.quantity * Trade.price
+        difference = func.abs(expected - func.abs(ledger_totals.c.ledger_total))
+        return self.db.execute(
+            select(Trade.trade_id, Trade.trader, Trade.instrument,
+                   expected.label("expected"), ledger_totals.c.ledger_total,
+                   difference.label("difference"))
+            .select_from(ReconciliationIssue)
+            .join(Trade, Trade.trade_id == ReconciliationIssue.trade_id)
+            .join(ledger_totals, ledger_totals.c.trade_id == Trade.trade_id)
+            .where(ReconciliationIssue.resolved == False,
+                   ReconciliationIssue.issue_type == "AMOUNT_MISMATCH")
+            .order_by(difference.desc())
+            .limit(self.top_n)
+        ).all()
+
+    def top_issues(self, limit: int) -> List[ReconciliationIssue]:
+        """Most severe, then most recent, open issues"""
+        return (
+            self.db.query(ReconciliationIssue)
+            .filter(ReconciliationIssue.resolved == False)
+            .order_by(SEVERITY_RANK, ReconciliationIssue.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    def trades_named(self, trade_ids: List[str]) -> List:
+        """The mentioned trades with their ledger totals, through the unique trade_id index"""
+        if not trade_ids:
+            return []
+        ledger_total = (
+            select(func.sum(LedgerEntry.amount)).where(LedgerEntry.trade_id == Trade.trade_id).scalar_subquery()
+        )
+        return self.db.execute(
+            select(Trade.trade_id, Trade.trader, Trade.instrument, Trade.side, Trade.quantity, Trade.price,
+                   Trade.status, ledger_total.label("ledger_total"))
+            .where(Trade.trade_id.in_(trade_ids[:self.top_n]))
+        ).all()
+
+    def issue_history(self, trade_ids: List[str]) -> List[ReconciliationIssue]:
+        """Open and resolved issues on the mentioned trades, newest first"""
+        if not trade_ids:
+            return []
+        return (
+            self.db.query(ReconciliationIssue)
+            .filter(ReconciliationIssue.trade_id.in_(trade_ids[:self.top_n]))
+            .order_by(ReconciliationIssue.id.desc())
+            .limit(self.top_n * 2)
+            .all()
+        )
+
+    def entity_totals(self, metric: str, column, names: List[str]) -> Dict[str, List]:
+        """Trade count and notional per named trader or instrument"""
+        if not names:
+            return {}
+        if summary.is_built(self.db):
+            table = summary.summary_table
+            rows = self.db.execute(
+                select(table.c.key, table.c.count, table.c.amount)
+                .where(table.c.metric == metric, table.c.key.in_(names))
+            )
+        else:
+            rows = self.db.execute(
+                select(column, func.count(Trade.id), func.sum(Trade.quantity * Trade.price))
+                .where(column.in_(names))
+                .group_by(column)
+            )
+        return {name: [count, amount or 0.0] for name, count, amount in rows}
+
+    def relevant_sections(self, retrieval: Dict) -> List:
+        entities = retrieval["entities"]
+        sections = [
+            ("Trades Mentioned", [
+                f"- {row.trade_id}: {row.trader} - {row.instrument} ({row.side}) - {row.quantity}@${row.price}, "
+                f"status {row.status}, ledger total "
+                + (f"{row.ledger_total:.2f}" if row.ledger_total is not None else "none")
+                for row in self.trades_named(entities["trade_ids"])
+            ]),
+            ("Issue History of Mentioned Trades", [
+                f"- {issue.trade_id}: {issue.issue_type} (Severity: {issue.severity}, "
+                f"{'resolved' if issue.resolved else 'open'}): {issue.description}"
+                for issue in self.issue_history(entities["trade_ids"])
+            ]),
+        ]
+        for title, metric, column, names in (
+            ("Traders Mentioned", summary.TRADES_BY_TRADER, Trade.trader, entities["traders"]),
+            ("Instruments Mentioned", summary.TRADES_BY_INSTRUMENT, Trade.instrument, entities["instruments"]),
+        ):
+            totals = self.entity_totals(metric, column, names)
+            sections.append((title, [
+                f"- {name}: {totals.get(name, [0, 0.0])[0]} trades, notional {totals.get(name, [0, 0.0])[1]:.2f}, "
+                f"{retrieval['open_issues'].get(name, 0)} open issues"
+                for name in names[:self.top_n]
+            ]))
+        sections.append((f"Open Issues Relevant to the Question ({retrieval['matched']} matched)", [
+            f"- {issue['issue_type']} (Severity: {issue['severity']}): {issue['description']}"
+            + (f" [Trade ID: {issue['trade_id']}]" if issue["trade_id"] else "")
+            for issue in retrieval["issues"]
+        ]))
+        return sections
+
+    def recent_trades(self) -> List:
+        return self.db.execute(
+            select(Trade.trade_id, Trade.trader, Trade.instrument, Trade.side,
+                   Trade.quantity, Trade.price)
+            .order_by(Trade.timestamp.desc())
+            .limit(self.top_n)
+        ).all()
+
+    def retrieve(self, query: str) -> Dict:
+        return issue_index.search(self.db, query, self.top_n * 2)
+
+    def build(self, retrieval: Optional[Dict] = None) -> str:
+        """Render the sections that fit in the token budget, those relevant to the question first"""
+        relevant = self.relevant_sections(retrieval) if retrieval else []
+        named = retrieval and any(retrieval["entities"].values())
+        sections = relevant + [
+            ("Open Issues by Type", [
+                f"- {row['issue_type']} ({row['severity']}): {row['count']}" for row in self.issues_by_type()
+            ]),
+            ("Largest Amount Mismatches", [
+                f"- {row.trade_id} ({row.trader}, {row.instrument}): expected {row.expected:.2f}, "
+                f"ledger {row.ledger_total:.2f}, off by {row.difference:.2f}"
+                for row in self.largest_mismatches()
+            ]),
+            ("Traders with Most Open Issues", [
+                f"- {row.trader}: {row.count}" for row in self.issues_by(Trade.trader)
+            ]),
+            ("Instruments with Most Open Issues", [
+                f"- {row.instrument}: {row.count}" for row in self.issues_by(Trade.instrument)
+            ]),
+            ("Most Severe Open Issues", [] if retrieval and retrieval["issues"] else [
+                f"- {issue.issue_type} (Severity: {issue.severity}): {issue.description}"
+                + (f" [Trade ID: {issue.trade_id}]" if issue.trade_id else "")
+                for issue in self.top_issues(self.top_n * 2)
+            ]),
+            ("Recent Trades", [] if named else [
+                f"- {row.trade_id}: {row.trader} - {row.instrument} ({row.side}) - {row.quantity}@${row.price}"
+                for row in self.recent_trades()
+            ]),
+        ]
+
+        remaining = self.token_budget
+        parts = []
+        for title, lines in sections:
+            if not lines:
+                continue
+            header = f"\n\n{title}:\n"
+            if estimate_tokens(header) + estimate_tokens(lines[0]) > remaining:
+                break
+            remaining -= estimate_tokens(header)
+            kept = []
+            for line in lines:
+                cost = estimate_tokens(line)
+                if cost > remaining:
+                    break
+                kept.append(line)
+                remaining -= cost
+            parts.append(header + "\n".join(kept) + "\n")
+        return "".join(parts)
@@ -1,16 +1,87 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, literal
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from .config import get_settings
+from typing import Dict
 
 settings = get_settings()
 
-engine = create_engine(
-    settings.database_url,
-    connect_args={"check_same_thread": False} if "sqlite" in settings.database_url else {}
-)
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "sqlite+pysqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgresql+psycopg2": "postgresql+asyncpg",
+}
+
+def pool_options(url: str) -> Dict:
+    """Pool sizing from settings; in-memory SQLite uses a single shared connection instead"""
+    parsed = make_url(url)
+    if parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:"):
+        return {}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+    }
+
+def sqlite_tuned(url: str) -> bool:
+    """Whether the SQLite performance profile applies to `url` (file databases only)"""
+    parsed = make_url(url)
+    return (settings.sqlite_profile == "performance" and parsed.get_backend_name() == "sqlite"
+            and parsed.database not in (None, "", ":memory:"))
+
+def tune_sqlite(engine, read_only: bool = False):
+    """Set the performance profile's pragmas on every new connection of `engine`.
+
+    WAL lets readers run alongside the writer; synchronous=NORMAL is durable
+    in WAL mode except across power loss. query_only makes read connections
+    refuse writes outright.
+    """
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.sqlite_mmap_size)}")
+        cursor.execute(f"PRAGMA cache_size=-{int(settings.sqlite_cache_size_kb)}")
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.sqlite_busy_timeout_ms)}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only=ON")
+        cursor.close()
+    
+    event.listen(engine, "connect", on_connect)
+
+def async_database_url(url: str) -> str:
+    """The same database addressed through its async driver"""
+    parsed = make_url(url)
+    return parsed.set(drivername=ASYNC_DRIVERS.get(parsed.drivername, parsed.drivername)) \
+        .render_as_string(hide_password=False)
+
+connect_args = {"check_same_thread": False} if "sqlite" in settings.database_url else {}
+
+engine = create_engine(settings.database_url, connect_args=connect_args,
+                       **pool_options(settings.database_url))
+
+if sqlite_tuned(settings.database_url):
+    tune_sqlite(engine)
+    # GET endpoints read through their own pool of read-only connections
+    read_engine = create_engine(settings.database_url, connect_args=connect_args,
+                                **pool_options(settings.database_url))
+    tune_sqlite(read_engine, read_only=True)
+    # Bulk writers (reconcile, ingest) queue for one connection instead of
+    # contending for SQLite's file lock; short request writes keep `engine`.
+    # A reconcile can hold it for minutes, so by default the queue has no timeout
+    write_engine = create_engine(settings.database_url, connect_args=connect_args,
+                                 pool_size=1, max_overflow=0, pool_timeout=settings.db_write_timeout)
+    tune_sqlite(write_engine)
+else:
+    read_engine = engine
+    write_engine = engine
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=write_engine)
 Base = declarative_base()
 
 def get_db():
@@ -18,4 +89,76 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+def get_write_db():
+    """Session for bulk writers (reconcile, ingest): the single writer under the SQLite profile"""
+    db = WriteSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+# Created on first use so the async driver stays an optional dependency
+async_engine = None
+AsyncSessionLocal = None
+
+def get_async_sessionmaker():
+    global async_engine, AsyncSessionLocal
+    if AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        
+        url = settings.async_database_url or async_database_url(settings.database_url)
+        try:
+            async_engine = create_async_engine(url, **pool_options(url))
+        except ImportError as e:
+            raise RuntimeError(f"DB_ASYNC needs the async driver for {url} "
+                               "(pip install aiosqlite, or asyncpg for PostgreSQL)") from e
+        if sqlite_tuned(url):
+            tune_sqlite(async_engine.sync_engine, read_only=True)
+        AsyncSessionLocal = async_sessionmaker(async_engine, expire_on_commit=False)
+    return AsyncSessionLocal
+
+async def get_read_db():
+    """Session for read-only endpoints: async when DB_ASYNC is set, otherwise from the read pool"""
+    if settings.db_async:
+        async with get_async_sessionmaker()() as db:
+            yield db
+    else:
+        db = ReadSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+def add_missing_columns(bind):
+    """ALTER TABLE ... ADD COLUMN for model columns that a table created by an older version lacks"""
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column.type.compile(dialect=bind.dialect)}"
+                if column.default is not None and column.default.is_scalar:
+                    value = literal(column.default.arg).compile(dialect=bind.dialect, compile_kwargs={"literal_binds": True})
+                    ddl += f" DEFAULT {value}"
+                connection.exec_driver_sql(ddl)
+
+def init_db(bind=engine):
+    """Create missing tables, plus columns and indexes added to tables that already exist"""
+    from . import models  # noqa: F401 - registers the tables on Base.metadata
+    from .issue_store import collapse_duplicate_open_issues
+    from .summary import ensure_built
+    from .versions import ensure_counters
+    
+    Base.metadata.create_all(bind=bind)
+    add_missing_columns(bind)
+    ensure_counters(bind)
+    collapse_duplicate_open_issues(bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    with Session(bind=bind) as db:
+        ensure_built(db)
\ No newline at end of file
@@ -0,0 +1,115 @@
+"""In-process change events pushed to dashboards over server-sent events.
+
+Write paths publish after they commit: a created trade, upserted or resolved
+issues, bulk table changes, and reconciliation job progress. Each event is
+serialized once and shared by every subscriber, so the cost of a change does
+not depend on how many dashboards are watching, and watching costs the
+database nothing. Events are per process; a deployment with several API
+workers needs a shared broker (e.g. Redis pub/sub) in their place.
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, List, Optional, Set, Tuple
+
+HISTORY_SIZE = 1000  # recent events kept so reconnecting clients can catch up
+QUEUE_SIZE = 1000  # events buffered per subscriber before it is told to resync
+KEEPALIVE_SECONDS = 15
+MAX_DELTA_EVENTS = 200  # larger issue change sets are announced as one summary event
+
+Event = Tuple[int, str]  # (id, SSE-formatted message)
+
+class Subscription:
+    """One connected client: an asyncio queue fed from any thread"""
+
+    def __init__(self, bus: "EventBus", loop: asyncio.AbstractEventLoop):
+        self._bus = bus
+        self._loop = loop
+        self._queue: "asyncio.Queue[Event]" = asyncio.Queue(QUEUE_SIZE)
+
+    def push(self, event: Event):
+        try:
+            self._loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            # The subscriber's loop has closed; it unsubscribes as it unwinds
+            pass
+
+    def _put(self, event: Event):
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client this far behind is cheaper to reload than to catch up
+            while not self._queue.empty():
+                self._queue.get_nowait()
+            self._queue.put_nowait((event[0], format_event(event[0], "resync", {})))
+
+    async def stream(self) -> AsyncIterator[str]:
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    _, message = await asyncio.wait_for(self._queue.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield message
+        finally:
+            self._bus.unsubscribe(self)
+
+class EventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_id = 1
+        self._history: Deque[Event] = deque(maxlen=HISTORY_SIZE)
+        self._subscribers: Set[Subscription] = set()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def publish(self, event_type: str, data: Dict) -> int:
+        """Send an event to every subscriber; safe to call from any thread"""
+        with self._lock:
+            event_id = self._next_id
+            self._next_id += 1
+            event = (event_id, format_event(event_id, event_type, data))
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            subscription.push(event)
+        return event_id
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Subscription:
+        """Register a client on the running loop, replaying what it missed since `last_event_id`"""
+        subscription = Subscription(self, asyncio.get_running_loop())
+        with self._lock:
+            if last_event_id is not None:
+                missed = [event for event in self._history if event[0] > last_event_id]
+                oldest = self._history[0][0] if self._history else self._next_id
+                # Too far behind, or an id from before a server restart
+                if not oldest - 1 <= last_event_id < self._next_id or len(missed) >= QUEUE_SIZE:
+                    missed = [(self._next_id - 1, format_event(self._next_id - 1, "resync", {}))]
+                for event in missed:
+                    subscription._queue.put_nowait(event)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+def format_event(event_id: int, event_type: str, data: Dict) -> str:
+    return f"id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data, default=str)}\n\n"
+
+event_bus = EventBus()
+
+def publish_issue_changes(upserted: List[Dict], resolved: List[int]):
+    """Issue deltas for a committed write, or a summary when there are too many to stream"""
+    if len(upserted) + len(resolved) > MAX_DELTA_EVENTS:
+        event_bus.publish("issues.changed", {"upserted": len(upserted), "resolved": len(resolved)})
+        return
+    for row in upserted:
+        event_bus.publish("issue.upserted", row)
+    if resolved:
+        event_bus.publish("issue.resolved", {"ids": resolved})
@@ -0,0 +1,128 @@
+"""Streaming bulk export of trades, ledger rows and issues as CSV, NDJSON or Parquet.
+
+Rows are read from a server-side cursor `BATCH_SIZE` at a time
+(`yield_per`) and each batch is encoded and sent as one chunk of the
+response, so an export holds one batch in memory however many rows it returns.
+Parquet is written one row group per batch; the footer goes out with the last
+chunk.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Dict, Iterator, List, Sequence
+
+from sqlalchemy import DateTime, select
+
+from .archive import arrow_schema
+from .database import read_engine
+from .models import LedgerEntry, ReconciliationIssue, Trade
+from . import metrics
+
+BATCH_SIZE = 5000
+
+MODELS = {"trades": Trade, "ledger": LedgerEntry, "issues": ReconciliationIssue}
+
+FORMATS = {
+    "csv": {"media_type": "text/csv", "extension": "csv"},
+    "ndjson": {"media_type": "application/x-ndjson", "extension": "ndjson"},
+    "parquet": {"media_type": "application/vnd.apache.parquet", "extension": "parquet"},
+}
+
+class _Sink(io.RawIOBase):
+    """A write-only file that hands out what was written since the last `drain`"""
+
+    def __init__(self):
+        self.chunks: List[bytes] = []
+        self.position = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+def _isoformat(rows: Sequence, positions: List[int]) -> Sequence:
+    """The rows with their datetime columns (at `positions`) as ISO 8601 strings"""
+    if not positions:
+        return rows
+    converted = []
+    for row in rows:
+        row = list(row)
+        for position in positions:
+            if row[position] is not None:
+                row[position] = row[position].isoformat()
+        converted.append(row)
+    return converted
+
+def _csv(columns: List[str], batches: Iterator[Sequence], stamps: List[int]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in batches:
+        writer.writerows(_isoformat(rows, stamps))
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+def _ndjson(columns: List[str], batches: Iterator[Sequence], stamps: List[int]) -> Iterator[bytes]:
+    for rows in batches:
+        yield "".join(
+            json.dumps(dict(zip(columns, row))) + "\n" for row in _isoformat(rows, stamps)
+        ).encode()
+
+def _parquet(table: str, columns: List[str], batches: Iterator[Sequence]) -> Iterator[bytes]:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)") from e
+    full = arrow_schema(table)
+    schema = pa.schema([full.field(name) for name in columns])
+    sink = _Sink()
+    with pq.ParquetWriter(sink, schema, compression="zstd") as writer:
+        for rows in batches:
+            arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+def stream(table: str, columns: List[str], filters: List, file_format: str = "csv",
+           batch_size: int = BATCH_SIZE) -> Iterator[bytes]:
+    """Encoded chunks of the rows of `table` matching `filters`, in id order"""
+    model = MODELS[table]
+    stamps = [position for position, name in enumerate(columns)
+              if isinstance(getattr(model, name).type, DateTime)]
+
+    def batches() -> Iterator[Sequence]:
+        with read_engine.connect() as connection:
+            result = connection.execution_options(yield_per=batch_size).execute(
+                select(*[getattr(model, name) for name in columns]).where(*filters).order_by(model.id)
+            )
+            for rows in result.partitions():
+                metrics.record_rows(len(rows))
+                yield rows
+
+    if file_format == "csv":
+        return _csv(columns, batches(), stamps)
+    if file_format == "ndjson":
+        return _ndjson(columns, batches(), stamps)
+    if file_format == "parquet":
+        return _parquet(table, columns, batches())
+    raise ValueError(f"Unsupported export format: {file_format}")
+
+def headers(table: str, file_format: str) -> Dict[str, str]:
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    return {"Content-Disposition": f'attachment; filename="{table}-{stamp}.{FORMATS[file_format]["extension"]}"'}
@@ -0,0 +1,124 @@
+import difflib
+import heapq
+import re
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from .models import Trade, LedgerEntry
+from typing import Dict, List, Optional, Tuple
+
+NON_ALPHANUMERIC = re.compile(r"[^0-9A-Z]")
+
+def normalize_id(value: Optional[str]) -> str:
+    """Upper-case and drop separators, so "t-000123" and "T000123" compare equal"""
+    return NON_ALPHANUMERIC.sub("", (value or "").upper())
+
+def id_similarity(a: Optional[str], b: Optional[str]) -> float:
+    a, b = normalize_id(a), normalize_id(b)
+    if a == b:
+        return 1.0
+    return difflib.SequenceMatcher(None, a, b, autojunk=False).ratio()
+
+class FuzzyMatcher:
+    """Pair trades that have no ledger rows with ledger rows whose trade_id matches no trade.
+
+    Orphan ledger rows are grouped by (trade_id, currency); trades carry no
+    currency, so a group is one booking in one currency. A group pairs with a
+    trade when the amounts agree within tolerance, the first ledger row falls
+    within `time_window` of the trade, and the ids are similar enough (typos,
+    separators, case). Unmatched trades are sorted by expected amount and each
+    group binary-searches its tolerance band, so the pass costs O((n + m) log n)
+    plus the few candidates in each band rather than n * m comparisons. Pairs
+    are then assigned greedily, best id similarity first. The groups left
+    unpaired are reported once per trade_id, listing their currencies.
+    """
+
+    def __init__(self, db: Session, amount_tolerance: float = 0.01, relative_tolerance: float = 0.0005,
+                 time_window: timedelta = timedelta(days=3), min_similarity: float = 0.8,
+                 max_candidates: int = 50):
+        self.db = db
+        self.amount_tolerance = amount_tolerance
+        self.relative_tolerance = relative_tolerance
+        self.time_window = time_window
+        self.min_similarity = min_similarity
+        self.max_candidates = max_candidates  # closest-amount trades inspected per group
+
+    def load_unmatched_trades(self) -> List:
+        has_ledger = select(LedgerEntry.id).where(LedgerEntry.trade_id == Trade.trade_id).exists()
+        return self.db.execute(
+            select(Trade.trade_id, (Trade.quantity * Trade.price).label("expected"), Trade.timestamp)
+            .where(Trade.status == "pending", ~has_ledger)
+        ).all()
+
+    def load_orphan_groups(self) -> List:
+        has_trade = select(Trade.id).where(Trade.trade_id == LedgerEntry.trade_id).exists()
+        return self.db.execute(
+            select(LedgerEntry.trade_id, LedgerEntry.currency,
+                   func.sum(LedgerEntry.amount).label("amount"),
+                   func.count(LedgerEntry.id).label("entries"),
+                   func.min(LedgerEntry.timestamp).label("first_timestamp"))
+            .where(LedgerEntry.reconciled == False, ~has_trade)
+            .group_by(LedgerEntry.trade_id, LedgerEntry.currency)
+            .order_by(LedgerEntry.trade_id, LedgerEntry.currency)
+        ).all()
+
+    def _candidates(self, trades: List, amounts: List[float], orphan) -> List[int]:
+        target = abs(orphan.amount or 0.0)
+        tolerance = max(self.amount_tolerance, target * self.relative_tolerance)
+        lo = bisect_left(amounts, target - tolerance)
+        hi = bisect_right(amounts, target + tolerance)
+        if hi - lo > self.max_candidates:
+            return heapq.nsmallest(self.max_candidates, range(lo, hi), key=lambda i: abs(amounts[i] - target))
+        return range(lo, hi)
+
+    def run(self) -> Tuple[List[Dict], List[Dict]]:
+        """Return (pairs, unpaired orphan rows per trade_id) as plain dicts"""
+        trades = sorted(self.load_unmatched_trades(), key=lambda trade: abs(trade.expected or 0.0))
+        orphans = self.load_orphan_groups()
+        amounts = [abs(trade.expected or 0.0) for trade in trades]
+
+        scored = []
+        for orphan_index, orphan in enumerate(orphans):
+            for trade_index in self._candidates(trades, amounts, orphan):
+                trade = trades[trade_index]
+                if trade.timestamp and orphan.first_timestamp:
+                    gap = abs(orphan.first_timestamp - trade.timestamp)
+                    if gap > self.time_window:
+                        continue
+                else:
+                    gap = self.time_window
+                similarity = id_similarity(trade.trade_id, orphan.trade_id)
+                if similarity < self.min_similarity:
+                    continue
+                difference = abs(amounts[trade_index] - abs(orphan.amount or 0.0))
+                scored.append((-similarity, difference, gap, orphan_index, trade_index))
+
+        pairs, paired_orphans, paired_trades = [], set(), set()
+        for negative_similarity, difference, gap, orphan_index, trade_index in sorted(scored):
+            if orphan_index in paired_orphans or trade_index in paired_trades:
+                continue
+            paired_orphans.add(orphan_index)
+            paired_trades.add(trade_index)
+            orphan, trade = orphans[orphan_index], trades[trade_index]
+            pairs.append({
+                "trade_id": trade.trade_id,
+                "ledger_trade_id": orphan.trade_id,
+                "currency": orphan.currency,
+                "expected": trade.expected,
+                "amount": orphan.amount,
+                "entries": orphan.entries,
+                "similarity": round(-negative_similarity, 3),
+            })
+
+        unpaired: Dict[Optional[str], Dict] = {}
+        for index, orphan in enumerate(orphans):
+            if index in paired_orphans:
+                continue
+            group = unpaired.setdefault(orphan.trade_id, {"trade_id": orphan.trade_id, "currencies": [],
+                                                          "amounts": [], "entries": 0})
+            group["currencies"].append(orphan.currency)
+            group["amounts"].append(orphan.amount)
+            group["entries"] += orphan.entries
+        pairs.sort(key=lambda pair: pair["trade_id"])
+        return pairs, list(unpaired.values())
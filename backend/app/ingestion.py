@@ -0,0 +1,421 @@
+"""Streaming bulk ingestion of trade and ledger files.
+
+    python -m backend.app.ingestion trades data/sample_trades.csv
+    python -m backend.app.ingestion ledger data/sample_ledger.parquet --chunk-size 200000
+
+Files are read in chunks (CSV via pandas, Parquet via pyarrow record batches),
+validated column-wise, and written with one executemany statement per chunk.
+Trades are upserted on trade_id; ledger rows are appended. `TradeBatch` applies
+the same validation to trades submitted through the API, insert-only.
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+import pandas as pd
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .models import Trade, LedgerEntry, TradeRewrite
+from .events import event_bus
+from .summary import LEDGER, IssueDelta, SummaryDelta
+from . import live_matching, versions
+
+DEFAULT_CHUNK_SIZE = 50000
+MAX_REPORTED_ERRORS = 20
+BATCH_CHUNK_SIZE = 5000  # submitted trades validated and inserted per chunk
+MAX_REPORTED_DUPLICATES = 10000
+
+SCHEMAS = {
+    "trades": {
+        "model": Trade,
+        "strings": ["trade_id", "trader", "instrument", "side"],
+        "floats": ["quantity", "price"],
+        "choices": {"side": {"BUY", "SELL"}},
+    },
+    "ledger": {
+        "model": LedgerEntry,
+        "strings": ["trade_id", "currency", "entry_type"],
+        "floats": ["amount"],
+        "choices": {"entry_type": {"DEBIT", "CREDIT"}},
+    },
+}
+
+Source = Union[str, BinaryIO]
+
+def read_chunks(source: Source, file_format: str = "csv",
+                chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """Yield the file as DataFrames of at most `chunk_size` rows"""
+    if file_format == "csv":
+        yield from pd.read_csv(source, chunksize=chunk_size, dtype=str, keep_default_na=False)
+    elif file_format == "parquet":
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet ingestion requires pyarrow (pip install pyarrow)") from e
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_size):
+            yield batch.to_pandas()
+    else:
+        raise ValueError(f"Unsupported file format: {file_format}")
+
+def validate_chunk(kind: str, chunk: pd.DataFrame, first_row: int, errors: List[str]) -> pd.DataFrame:
+    """Coerce a raw chunk to the table's types and drop invalid rows.
+
+    Problems are appended to `errors` as "row N: reason", where N is
+    `first_row` plus the row's index label (file readers pass a chunk indexed
+    from 0, so rows are numbered from 1 across the whole file, header excluded).
+    """
+    schema = SCHEMAS[kind]
+    required = schema["strings"] + schema["floats"]
+    missing = [name for name in required if name not in chunk.columns]
+    if missing:
+        raise ValueError(f"Missing required columns for {kind}: {', '.join(missing)}")
+
+    clean = pd.DataFrame(index=chunk.index)
+    invalid = pd.Series("", index=chunk.index)
+
+    for name in schema["strings"]:
+        values = chunk[name].astype("string").str.strip()
+        if name in schema["choices"]:
+            values = values.str.upper()
+            bad = ~values.isin(schema["choices"][name])
+            invalid = invalid.mask(bad & (invalid == ""), f"{name} must be one of {sorted(schema['choices'][name])}")
+        bad = values.isna() | (values == "")
+        invalid = invalid.mask(bad & (invalid == ""), f"{name} is required")
+        clean[name] = values
+
+    for name in schema["floats"]:
+        values = pd.to_numeric(chunk[name], errors="coerce")
+        invalid = invalid.mask(values.isna() & (invalid == ""), f"{name} is not a number")
+        clean[name] = values.astype("float64")
+
+    if "timestamp" in chunk.columns:
+        raw = chunk["timestamp"]
+        timestamps = pd.to_datetime(raw, errors="coerce", format="ISO8601")
+        blank = raw.isna() | (raw.astype("string").str.strip() == "")
+        invalid = invalid.mask(timestamps.isna() & ~blank & (invalid == ""), "timestamp is not ISO 8601")
+        clean["timestamp"] = timestamps.where(~blank, pd.Timestamp(datetime.utcnow()))
+    else:
+        clean["timestamp"] = pd.Timestamp(datetime.utcnow())
+
+    bad_rows = invalid != ""
+    if bad_rows.any():
+        for label, reason in invalid[bad_rows].items():
+            if len(errors) >= MAX_REPORTED_ERRORS:
+                break
+            errors.append(f"row {first_row + label}: {reason}")
+
+    return clean[~bad_rows]
+
+def _records(frame: pd.DataFrame) -> List[Dict]:
+    columns = list(frame.columns)
+    values = [frame[name].tolist() for name in columns if name != "timestamp"]
+    values.append(list(frame["timestamp"].array.to_pydatetime()))
+    names = [name for name in columns if name != "timestamp"] + ["timestamp"]
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+TRADE_FIELDS = ["trader", "instrument", "quantity", "price", "side", "timestamp"]
+LOOKUP_CHUNK_SIZE = 500  # trade ids per IN (...) when reading the rows a chunk replaces
+
+def _existing_trades(db: Session, trade_ids: List[str]) -> Dict[str, Dict]:
+    table = Trade.__table__
+    existing = {}
+    for start in range(0, len(trade_ids), LOOKUP_CHUNK_SIZE):
+        rows = db.execute(
+            select(table.c.trade_id, table.c.status, *[table.c[name] for name in TRADE_FIELDS])
+            .where(table.c.trade_id.in_(trade_ids[start:start + LOOKUP_CHUNK_SIZE]))
+        ).mappings()
+        existing.update((row["trade_id"], row) for row in rows)
+    return existing
+
+def _trade_delta(records: List[Dict], existing: Dict[str, Dict],
+                 replace_all: bool) -> Tuple[SummaryDelta, List[str]]:
+    """Summary changes for writing `records` over the `existing` rows with the same trade_id,
+    and the trade_ids of the existing rows that are rewritten.
+
+    The upsert only rewrites a row when a field differs, compared as SQL does
+    (a NULL on either side is not a difference); `replace_all` is for the
+    delete-and-insert fallback, which rewrites every existing row.
+    """
+    delta, rewritten = SummaryDelta(), []
+    for record in records:
+        old = existing.get(record["trade_id"])
+        if old is not None:
+            changed = replace_all or any(
+                old[name] is not None and record[name] is not None and old[name] != record[name]
+                for name in TRADE_FIELDS
+            )
+            if not changed:
+                continue
+            delta.add_trade(old, sign=-1)
+            rewritten.append(record["trade_id"])
+        delta.add_trade(dict(record, status="pending"))
+    return delta, rewritten
+
+def _mark_rewritten(db: Session, trade_ids: List[str], delta: SummaryDelta):
+    """Log rewritten trades for the next incremental run and take their ledger rows out of reconciled"""
+    if not trade_ids:
+        return
+    db.execute(insert(TradeRewrite.__table__), [{"trade_id": trade_id} for trade_id in trade_ids])
+    for start in range(0, len(trade_ids), LOOKUP_CHUNK_SIZE):
+        unmarked = db.query(LedgerEntry).filter(
+            LedgerEntry.trade_id.in_(trade_ids[start:start + LOOKUP_CHUNK_SIZE]), LedgerEntry.reconciled == True
+        ).update({LedgerEntry.reconciled: False}, synchronize_session=False)
+        delta.move_ledger(False, unmarked)
+
+def _write_trades(db: Session, records: List[Dict]) -> List[str]:
+    """Upsert trades on trade_id; a changed trade goes back to pending. Returns the rewritten trade_ids"""
+    table = Trade.__table__
+    dialect = db.get_bind().dialect.name
+    trade_ids = [record["trade_id"] for record in records]
+    existing = _existing_trades(db, trade_ids)
+    if dialect not in ("sqlite", "postgresql"):
+        # No portable upsert: replace the conflicting rows
+        delta, rewritten = _trade_delta(records, existing, replace_all=True)
+        counters = IssueDelta(db, trade_ids=rewritten)
+        db.query(Trade).filter(Trade.trade_id.in_(trade_ids)).delete(synchronize_session=False)
+        db.execute(insert(table), [dict(record, status="pending") for record in records])
+        _mark_rewritten(db, rewritten, delta)
+        delta.apply(db)
+        counters.apply()
+        return rewritten
+
+    stmt = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table)
+    changed = None
+    for name in TRADE_FIELDS:
+        clause = table.c[name] != stmt.excluded[name]
+        changed = clause if changed is None else changed | clause
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c.trade_id],
+        set_=dict({name: stmt.excluded[name] for name in TRADE_FIELDS}, status="pending"),
+        where=changed,
+    )
+    delta, rewritten = _trade_delta(records, existing, replace_all=False)
+    # Rewritten prices change the money at stake in open mismatches
+    counters = IssueDelta(db, trade_ids=rewritten)
+    db.execute(stmt, [dict(record, status="pending") for record in records])
+    _mark_rewritten(db, rewritten, delta)
+    delta.apply(db)
+    counters.apply()
+    return rewritten
+
+def _write_ledger(db: Session, records: List[Dict]) -> List[str]:
+    # New ledger rows change the ledger side of open mismatches
+    counters = IssueDelta(db, trade_ids=[record["trade_id"] for record in records])
+    db.execute(insert(LedgerEntry.__table__), [dict(record, reconciled=False) for record in records])
+    delta = SummaryDelta()
+    delta.add(LEDGER, "unreconciled", len(records))
+    delta.apply(db)
+    counters.apply()
+    return []
+
+INVALID_JSON = object()  # stands in for an NDJSON line that does not parse
+
+class TradeBatch:
+    """Insert-only trade submission in one transaction (POST /trades/batch).
+
+    Parsed rows are added in chunks, validated column-wise like ingested files
+    and inserted with one multi-row statement per chunk. An existing trade_id
+    is never overwritten: that row, like a trade_id repeated within the batch
+    (the first occurrence wins), is reported as a duplicate and the rest of the
+    batch goes on. Nothing is visible until `commit`.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+        self.errors: List[str] = []
+        self.duplicates: List[Dict] = []
+        self.report = {
+            "rows_received": 0,
+            "rows_inserted": 0,
+            "rows_rejected": 0,
+            "rows_duplicate": 0,
+            "seconds": 0.0,
+            "rows_per_second": 0.0,
+            "errors": self.errors,
+            "duplicates": self.duplicates,
+        }
+        self._seen = set()
+        self._summary = SummaryDelta()
+        self._start = time.perf_counter()
+
+    def add(self, rows: List):
+        """Validate and insert parsed rows (one dict per trade), numbered after those already added"""
+        for start in range(0, len(rows), BATCH_CHUNK_SIZE):
+            self._add_chunk(rows[start:start + BATCH_CHUNK_SIZE])
+
+    def add_ndjson(self, lines: List[bytes]):
+        rows = []
+        for line in lines:
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                rows.append(INVALID_JSON)
+        self.add(rows)
+
+    def _add_chunk(self, rows: List):
+        first_row = self.report["rows_received"] + 1
+        self.report["rows_received"] += len(rows)
+
+        objects = {}
+        for position, row in enumerate(rows):
+            if isinstance(row, dict):
+                objects[position] = row
+            else:
+                self._reject(first_row + position, "invalid JSON" if row is INVALID_JSON else "not a JSON object")
+        if not objects:
+            return
+        schema = SCHEMAS["trades"]
+        frame = pd.DataFrame(list(objects.values()), index=list(objects),
+                             columns=schema["strings"] + schema["floats"] + ["timestamp"])
+        clean = validate_chunk("trades", frame, first_row, self.errors)
+        self.report["rows_rejected"] += len(frame) - len(clean)
+        if clean.empty:
+            return
+
+        fresh, positions = [], []
+        for position, record in zip(clean.index, _records(clean)):
+            if record["trade_id"] in self._seen:
+                self._duplicate(first_row + position, record["trade_id"])
+            else:
+                self._seen.add(record["trade_id"])
+                fresh.append(record)
+                positions.append(position)
+        inserted = self._insert(fresh)
+        for position, record in zip(positions, fresh):
+            if record["trade_id"] in inserted:
+                self._summary.add_trade(dict(record, status="pending"))
+            else:
+                self._duplicate(first_row + position, record["trade_id"])
+        self.report["rows_inserted"] += len(inserted)
+
+    def _insert(self, records: List[Dict]) -> set:
+        """Insert the records whose trade_id is new; returns the trade_ids inserted"""
+        if not records:
+            return set()
+        table = Trade.__table__
+        rows = [dict(record, status="pending") for record in records]
+        dialect = self.db.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            stmt = (
+                (sqlite.insert if dialect == "sqlite" else postgresql.insert)(table)
+                .on_conflict_do_nothing(index_elements=[table.c.trade_id])
+                .returning(table.c.trade_id)
+            )
+            return set(self.db.execute(stmt, rows).scalars())
+
+        existing = _existing_trades(self.db, [row["trade_id"] for row in rows])
+        rows = [row for row in rows if row["trade_id"] not in existing]
+        if rows:
+            self.db.execute(insert(table), rows)
+        return {row["trade_id"] for row in rows}
+
+    def _reject(self, row: int, reason: str):
+        self.report["rows_rejected"] += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"row {row}: {reason}")
+
+    def _duplicate(self, row: int, trade_id: str):
+        self.report["rows_duplicate"] += 1
+        if len(self.duplicates) < MAX_REPORTED_DUPLICATES:
+            self.duplicates.append({"row": row, "trade_id": trade_id})
+
+    def commit(self) -> Dict:
+        """Commit every inserted trade at once and return the report"""
+        self._summary.apply(self.db)
+        if self.report["rows_inserted"]:
+            versions.bump(self.db, "trades")
+        self.db.commit()
+        if self.report["rows_inserted"]:
+            event_bus.publish("trades.changed", {"rows": self.report["rows_inserted"]})
+            live_matching.notify()
+        self.report["seconds"] = round(time.perf_counter() - self._start, 3)
+        self.report["rows_per_second"] = round(self.report["rows_received"] / max(self.report["seconds"], 1e-9), 1)
+        return self.report
+
+def ingest(db: Session, kind: str, source: Source, file_format: str = "csv",
+           chunk_size: int = DEFAULT_CHUNK_SIZE,
+           on_progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+    """Stream `source` into the `kind` table ("trades" or "ledger"), committing per chunk.
+
+    Returns a report with row counts, throughput and a sample of validation
+    errors; `on_progress` receives the running report after every chunk.
+    """
+    if kind not in SCHEMAS:
+        raise ValueError(f"Unknown ingestion target: {kind}")
+    write = _write_trades if kind == "trades" else _write_ledger
+
+    errors: List[str] = []
+    report = {
+        "kind": kind,
+        "chunks": 0,
+        "rows_read": 0,
+        "rows_written": 0,
+        "rows_rejected": 0,
+        "rows_duplicate": 0,
+        "seconds": 0.0,
+        "rows_per_second": 0.0,
+        "errors": errors,
+    }
+    start = time.perf_counter()
+
+    for chunk in read_chunks(source, file_format, chunk_size):
+        clean = validate_chunk(kind, chunk.reset_index(drop=True), report["rows_read"] + 1, errors)
+        valid = len(clean)
+        if kind == "trades":
+            # The last occurrence of a trade_id wins, as it does across chunks
+            clean = clean.drop_duplicates(subset="trade_id", keep="last")
+        if not clean.empty:
+            rewritten = write(db, _records(clean))
+            # Rewritten trades also had their ledger rows unreconciled
+            versions.bump(db, *([kind, "ledger"] if rewritten else [kind]))
+            db.commit()
+            event_bus.publish(f"{kind}.changed", {"rows": len(clean)})
+            live_matching.notify(rewritten)
+
+        report["chunks"] += 1
+        report["rows_read"] += len(chunk)
+        report["rows_written"] += len(clean)
+        report["rows_rejected"] += len(chunk) - valid
+        report["rows_duplicate"] += valid - len(clean)
+        report["seconds"] = round(time.perf_counter() - start, 3)
+        report["rows_per_second"] = round(report["rows_read"] / max(report["seconds"], 1e-9), 1)
+        if on_progress:
+            on_progress(report)
+
+    return report
+
+def main(argv: Optional[List[str]] = None):
+    from .database import WriteSessionLocal, init_db
+
+    parser = argparse.ArgumentParser(description="Bulk-load trades or ledger entries")
+    parser.add_argument("kind", choices=sorted(SCHEMAS))
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["csv", "parquet"], default=None,
+                        help="defaults to the file extension")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    file_format = args.format or ("parquet" if args.path.endswith(".parquet") else "csv")
+
+    def print_progress(report: Dict):
+        print(f"  chunk {report['chunks']}: {report['rows_read']:,} rows read, "
+              f"{report['rows_rejected']:,} rejected, {report['rows_per_second']:,.0f} rows/s")
+
+    init_db()
+    db = WriteSessionLocal()
+    try:
+        report = ingest(db, args.kind, args.path, file_format, args.chunk_size, print_progress)
+    finally:
+        db.close()
+
+    print(f"Loaded {report['rows_written']:,} {args.kind} rows in {report['seconds']}s "
+          f"({report['rows_rejected']:,} rejected)")
+    for error in report["errors"]:
+        print(f"  {error}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+from sqlalchemy import func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .models import ReconciliationIssue
+from .summary import IssueDelta
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+CHUNK_SIZE = 500  # keeps IN (...) lists under SQLite's bound-parameter limit
+
+issues_table = ReconciliationIssue.__table__
+changed_columns = (issues_table.c.id, issues_table.c.issue_type, issues_table.c.description,
+                   issues_table.c.severity, issues_table.c.trade_id)
+
+def issue_key(row: Dict) -> Tuple[str, str]:
+    """Natural key of an open issue"""
+    return row["issue_type"], row["trade_id"]
+
+def upsert_issues(db: Session, rows: List[Dict]) -> List[Dict]:
+    """Insert new open issues and refresh changed ones in one batched statement.
+
+    Each row needs issue_type, trade_id, description and severity. An open
+    issue with the same (issue_type, trade_id) is updated in place instead of
+    duplicated; its detected_at is kept and a stale AI explanation is cleared.
+    The summary's issue counters move with the rows written.
+    Returns the issues that were inserted or actually changed, with their ids.
+    """
+    if not rows:
+        return []
+    # One statement can't touch the same conflict target twice; the last row for a key wins
+    rows = list({issue_key(row): row for row in rows}.values())
+    counters = IssueDelta(db, trade_ids=[row["trade_id"] for row in rows])
+
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        stmt = sqlite.insert(issues_table)
+    elif dialect == "postgresql":
+        stmt = postgresql.insert(issues_table)
+    else:
+        changed = _upsert_issues_generic(db, rows)
+        counters.apply()
+        return changed
+
+    changed = (
+        (issues_table.c.description != stmt.excluded.description)
+        | (issues_table.c.severity != stmt.excluded.severity)
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[issues_table.c.issue_type, issues_table.c.trade_id],
+        index_where=issues_table.c.resolved == False,
+        set_={
+            "description": stmt.excluded.description,
+            "severity": stmt.excluded.severity,
+            "ai_explanation": None,
+            "updated_at": stmt.excluded.updated_at,
+        },
+        where=changed,
+    ).returning(*changed_columns)
+    now = datetime.utcnow()
+    changed = [
+        dict(row) for row in db.execute(stmt, [dict(row, resolved=False, updated_at=now) for row in rows]).mappings()
+    ]
+    counters.apply()
+    return changed
+
+def _upsert_issues_generic(db: Session, rows: List[Dict]) -> List[Dict]:
+    """Fallback for dialects without ON CONFLICT: look up open keys, then insert or update"""
+    by_key = {issue_key(row): row for row in rows}
+    trade_ids = list({row["trade_id"] for row in rows})
+    existing = _open_issue_ids(db, trade_ids)
+
+    changed = []
+    new_rows = [dict(row, resolved=False) for key, row in by_key.items() if key not in existing]
+    if new_rows:
+        db.execute(insert(issues_table), new_rows)
+        inserted = _open_issue_ids(db, list({row["trade_id"] for row in new_rows}))
+        changed.extend(_changed_row(inserted[issue_key(row)], row) for row in new_rows)
+    for key, issue_id in existing.items():
+        if key in by_key:
+            row = by_key[key]
+            result = db.execute(
+                update(issues_table)
+                .where(issues_table.c.id == issue_id,
+                       (issues_table.c.description != row["description"])
+                       | (issues_table.c.severity != row["severity"]))
+                .values(description=row["description"], severity=row["severity"],
+                        ai_explanation=None)
+            )
+            if result.rowcount:
+                changed.append(_changed_row(issue_id, row))
+    return changed
+
+def _open_issue_ids(db: Session, trade_ids: List[str]) -> Dict[Tuple[str, str], int]:
+    ids = {}
+    for start in range(0, len(trade_ids), CHUNK_SIZE):
+        result = db.execute(
+            select(issues_table.c.id, issues_table.c.issue_type, issues_table.c.trade_id)
+            .where(issues_table.c.resolved == False,
+                   issues_table.c.trade_id.in_(trade_ids[start:start + CHUNK_SIZE]))
+        )
+        for issue_id, issue_type, trade_id in result:
+            ids[(issue_type, trade_id)] = issue_id
+    return ids
+
+def _changed_row(issue_id: int, row: Dict) -> Dict:
+    return dict({column.name: row[column.name] for column in changed_columns[1:]}, id=issue_id)
+
+def close_stale_issues(db: Session, issue_types: Iterable[str], found: Set[Tuple[str, str]],
+                       trade_ids: Optional[List[str]] = None) -> List[int]:
+    """Resolve open issues of `issue_types` that the latest run did not reproduce.
+
+    With `trade_ids` only issues for those trades are considered (the scope of
+    an incremental run); otherwise every open issue of those types is.
+    The resolved issues are taken out of the summary's issue counters.
+    Returns the ids of the resolved issues.
+    """
+    issue_types = list(issue_types)
+    base = select(issues_table.c.id, issues_table.c.issue_type, issues_table.c.trade_id).where(
+        issues_table.c.resolved == False, issues_table.c.issue_type.in_(issue_types)
+    )
+
+    if trade_ids is None:
+        batches = [base]
+    else:
+        batches = [
+            base.where(issues_table.c.trade_id.in_(trade_ids[start:start + CHUNK_SIZE]))
+            for start in range(0, len(trade_ids), CHUNK_SIZE)
+        ]
+
+    stale = []
+    for query in batches:
+        for issue_id, issue_type, trade_id in db.execute(query):
+            if (issue_type, trade_id) not in found:
+                stale.append(issue_id)
+
+    counters = IssueDelta(db, issue_ids=stale)
+    for start in range(0, len(stale), CHUNK_SIZE):
+        db.execute(
+            update(issues_table)
+            .where(issues_table.c.id.in_(stale[start:start + CHUNK_SIZE]))
+            .values(resolved=True)
+        )
+    counters.apply()
+    return stale
+
+def collapse_duplicate_open_issues(engine: Engine) -> int:
+    """Resolve all but the newest open issue per natural key.
+
+    Databases written before issues were upserted can hold several open rows
+    for the same (issue_type, trade_id); they must be collapsed before the
+    unique open-issue index can be built.
+    """
+    newest = (
+        select(func.max(issues_table.c.id))
+        .where(issues_table.c.resolved == False, issues_table.c.trade_id.isnot(None))
+        .group_by(issues_table.c.issue_type, issues_table.c.trade_id)
+    )
+    with engine.begin() as conn:
+        result = conn.execute(
+            update(issues_table)
+            .where(issues_table.c.resolved == False,
+                   issues_table.c.trade_id.isnot(None),
+                   issues_table.c.id.not_in(newest))
+            .values(resolved=True)
+        )
+    return result.rowcount
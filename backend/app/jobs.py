@@ -0,0 +1,222 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import WriteSessionLocal
+from .events import event_bus
+from . import metrics
+from .reconciliation import ReconciliationEngine
+
+MAX_FINISHED_JOBS = 100  # finished jobs kept for status/result lookups
+
+class JobCancelled(Exception):
+    pass
+
+class ReconciliationJob:
+    """One submitted reconciliation run and its live progress"""
+
+    def __init__(self, incremental: bool, scope: str, profile_path: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.incremental = incremental
+        self.scope = scope
+        self.profile_path = profile_path  # write cProfile stats for the run here
+        self.status = "queued"  # queued -> running -> succeeded | partial | failed | cancelled
+        self.stage: Optional[str] = None
+        self.rows_processed = 0
+        self.issues_found = 0
+        self.submitted_at = datetime.utcnow()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self._started = 0.0
+        self._cancel = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("succeeded", "partial", "failed", "cancelled")
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job has finished; False if `timeout` ran out first"""
+        return self._done.wait(timeout)
+
+    def report_progress(self, progress: Dict):
+        """Engine progress hook; raising here aborts the run at a batch boundary"""
+        if self._cancel.is_set():
+            raise JobCancelled()
+        self.stage = progress["stage"]
+        self.rows_processed = progress["rows_processed"]
+        self.issues_found = progress["issues_found"]
+        event_bus.publish("reconcile.progress", dict(progress, job_id=self.id))
+
+    def to_dict(self) -> Dict:
+        if self.started_at is None:
+            elapsed = None
+        elif self.finished:
+            elapsed = (self.finished_at - self.started_at).total_seconds()
+        else:
+            elapsed = time.perf_counter() - self._started
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "incremental": self.incremental,
+            "scope": self.scope,
+            "stage": self.stage,
+            "rows_processed": self.rows_processed,
+            "issues_found": self.issues_found,
+            "rows_per_second": round(self.rows_processed / elapsed, 1) if elapsed else None,
+            "sql_statements": self.sql_statements,
+            "sql_seconds": round(self.sql_seconds, 3),
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "profile": self.profile_path,
+        }
+
+class ReconciliationJobManager:
+    """Run reconciliations on a worker pool, one at a time per scope.
+
+    A submission matching a queued or running job (same scope and mode)
+    returns that job instead of starting another, so concurrent callers
+    coalesce. A full run requested while an incremental one is in flight (or
+    the reverse) is queued behind it, so two runs never advance the same
+    watermark at once. Jobs live in this process only.
+    """
+
+    def __init__(self, max_workers: int = 2,
+                 session_factory: Callable[[], Session] = WriteSessionLocal):
+        self.session_factory = session_factory
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="reconcile")
+        self._lock = threading.Lock()
+        self._jobs: "OrderedDict[str, ReconciliationJob]" = OrderedDict()
+        # Queued or running jobs by (scope, incremental), which callers coalesce into
+        self._active: Dict[Tuple[str, bool], ReconciliationJob] = {}
+        # Scopes with a job on the executor, and the job of the other mode waiting for it to finish
+        self._busy: Set[str] = set()
+        self._waiting: Dict[str, ReconciliationJob] = {}
+
+    def submit(self, incremental: bool = False, scope: str = "default",
+               profile_path: Optional[str] = None) -> Tuple[ReconciliationJob, bool]:
+        """Return (job, coalesced)"""
+        with self._lock:
+            active = self._active.get((scope, incremental))
+            if active is not None:
+                return active, True
+            job = ReconciliationJob(incremental, scope, profile_path)
+            self._jobs[job.id] = job
+            self._active[(scope, incremental)] = job
+            self._prune()
+            if scope in self._busy:
+                self._waiting[scope] = job
+                return job, False
+            self._busy.add(scope)
+        self._executor.submit(self._run, job)
+        return job, False
+
+    def get(self, job_id: str) -> Optional[ReconciliationJob]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[ReconciliationJob]:
+        return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[ReconciliationJob]:
+        job = self._jobs.get(job_id)
+        if job is not None and not job.finished:
+            job._cancel.set()
+        return job
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _run(self, job: ReconciliationJob):
+        db = self.session_factory()
+        status = "failed"
+        profile = None
+        waiting = None
+        with metrics.track() as stats:
+            try:
+                if job._cancel.is_set():
+                    raise JobCancelled()
+                job.status = "running"
+                job.started_at = datetime.utcnow()
+                job._started = time.perf_counter()
+                event_bus.publish("reconcile.job", job.to_dict())
+                if job.profile_path:
+                    profile = metrics.start_profile()
+                    if profile is None:
+                        # Another request or job is being profiled; this one runs unprofiled
+                        job.profile_path = None
+
+                engine = ReconciliationEngine(db, incremental=job.incremental, scope=job.scope,
+                                              progress=job.report_progress,
+                                              workers=get_settings().reconcile_processes)
+                issues = engine.check_trade_ledger_match()
+                # Matching has committed: a cancel from here on stops the run but cannot undo it
+                job.result = {
+                    "issues": issues,
+                    "anomalies": [],
+                    "total": len(issues),
+                    "incremental": job.incremental,
+                    "watermark": None
+                }
+                anomalies = engine.detect_anomalies()
+                watermark = engine.advance_watermark()
+                job.result = {
+                    "issues": issues,
+                    "anomalies": anomalies,
+                    "total": len(issues) + len(anomalies),
+                    "incremental": job.incremental,
+                    "watermark": watermark
+                }
+                status = "succeeded"
+            except JobCancelled:
+                db.rollback()
+                # After matching committed, its results stand; the watermark stays where it was,
+                # so the next incremental run covers the same rows again
+                status = "partial" if job.result is not None else "cancelled"
+            except Exception as e:
+                db.rollback()
+                job.error = str(e)
+            finally:
+                db.close()
+                if profile is not None:
+                    metrics.stop_profile(profile)
+                    profile.dump_stats(job.profile_path)
+                job.sql_statements = stats.sql_statements
+                job.sql_seconds = stats.sql_seconds
+                job.finished_at = datetime.utcnow()
+                job.status = status
+                with self._lock:
+                    if self._active.get((job.scope, job.incremental)) is job:
+                        del self._active[(job.scope, job.incremental)]
+                    waiting = self._waiting.pop(job.scope, None)
+                    if waiting is None:
+                        self._busy.discard(job.scope)
+        metrics.JOB_SECONDS.observe((job.finished_at - (job.started_at or job.submitted_at)).total_seconds(), status)
+        job._done.set()
+        event_bus.publish("reconcile.job", job.to_dict())
+        if waiting is not None:
+            self._executor.submit(self._run, waiting)
+
+_manager: Optional[ReconciliationJobManager] = None
+_manager_lock = threading.Lock()
+
+def get_job_manager() -> ReconciliationJobManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = ReconciliationJobManager(max_workers=get_settings().reconcile_workers)
+        return _manager
@@ -0,0 +1,116 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from .models import Trade, LedgerEntry, ReconciliationIssue
+from . import metrics
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple, Union
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+TRADE_FIELDS = [column.key for column in Trade.__table__.columns]
+LEDGER_FIELDS = [column.key for column in LedgerEntry.__table__.columns]
+ISSUE_FIELDS = [column.key for column in ReconciliationIssue.__table__.columns]
+
+def parse_fields(fields: Optional[str], allowed: List[str]) -> List[str]:
+    """Turn a comma-separated projection into column names; `id` is always included for the cursor"""
+    if not fields:
+        return list(allowed)
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return ["id"] + [name for name in requested if name != "id"]
+
+def trade_filters(status: Optional[str] = None, trader: Optional[str] = None,
+                  instrument: Optional[str] = None, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> List:
+    filters = []
+    if status is not None:
+        filters.append(Trade.status == status)
+    if trader is not None:
+        filters.append(Trade.trader == trader)
+    if instrument is not None:
+        filters.append(Trade.instrument == instrument)
+    if since is not None:
+        filters.append(Trade.timestamp >= since)
+    if until is not None:
+        filters.append(Trade.timestamp < until)
+    return filters
+
+def ledger_filters(reconciled: Optional[bool] = None, trade_id: Optional[str] = None,
+                   since: Optional[datetime] = None, until: Optional[datetime] = None) -> List:
+    filters = []
+    if reconciled is not None:
+        filters.append(LedgerEntry.reconciled == reconciled)
+    if trade_id is not None:
+        filters.append(LedgerEntry.trade_id == trade_id)
+    if since is not None:
+        filters.append(LedgerEntry.timestamp >= since)
+    if until is not None:
+        filters.append(LedgerEntry.timestamp < until)
+    return filters
+
+def issue_filters(resolved: Optional[bool] = False, severity: Optional[str] = None,
+                  issue_type: Optional[str] = None, trade_id: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None) -> List:
+    filters = []
+    if resolved is not None:
+        filters.append(ReconciliationIssue.resolved == resolved)
+    if severity is not None:
+        filters.append(ReconciliationIssue.severity == severity)
+    if issue_type is not None:
+        filters.append(ReconciliationIssue.issue_type == issue_type)
+    if trade_id is not None:
+        filters.append(ReconciliationIssue.trade_id == trade_id)
+    if since is not None:
+        filters.append(ReconciliationIssue.detected_at >= since)
+    if until is not None:
+        filters.append(ReconciliationIssue.detected_at < until)
+    return filters
+
+def page_statement(model, fields: List[str], filters: List, after: Optional[int] = None,
+                   limit: int = DEFAULT_PAGE_SIZE, order: str = "asc"):
+    """Keyset page over `model.id`: rows strictly after the `after` cursor in `order`.
+
+    Selects one row past `limit` so `to_page` can tell whether another page exists.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    id_column = model.id
+    stmt = select(*[getattr(model, name) for name in fields]).where(*filters)
+    if order == "desc":
+        if after is not None:
+            stmt = stmt.where(id_column < after)
+        stmt = stmt.order_by(id_column.desc())
+    else:
+        if after is not None:
+            stmt = stmt.where(id_column > after)
+        stmt = stmt.order_by(id_column)
+    return stmt.limit(limit + 1)
+
+def to_page(result, limit: int) -> Tuple[List[Dict], Optional[int]]:
+    """Rows as dicts of the projected fields plus the next cursor (None on the last page)"""
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    rows = [dict(row._mapping) for row in result]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = rows[-1]["id"]
+    metrics.record_rows(len(rows))
+    return rows, next_cursor
+
+def fetch_page(db: Session, model, fields: List[str], filters: List, after: Optional[int] = None,
+               limit: int = DEFAULT_PAGE_SIZE, order: str = "asc") -> Tuple[List[Dict], Optional[int]]:
+    stmt = page_statement(model, fields, filters, after, limit, order)
+    return to_page(db.execute(stmt), limit)
+
+async def fetch_page_async(db: Union[Session, AsyncSession], model, fields: List[str], filters: List,
+                           after: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                           order: str = "asc") -> Tuple[List[Dict], Optional[int]]:
+    """`fetch_page` for async handlers: awaits an AsyncSession, or runs a sync Session in the threadpool"""
+    if not isinstance(db, AsyncSession):
+        return await run_in_threadpool(fetch_page, db, model, fields, filters, after, limit, order)
+    stmt = page_statement(model, fields, filters, after, limit, order)
+    return to_page(await db.execute(stmt), limit)
@@ -0,0 +1,348 @@
+"""Resident trade/ledger matcher that raises match issues as rows are written.
+
+With LIVE_MATCHING=true the API process keeps every open trade (one whose
+ledger rows do not yet add up to its notional) in memory with its running
+ledger total. A worker thread warms the index from the database, then tails
+new trade and ledger rows by row id: write paths in this process wake it as
+soon as they commit, and it polls every LIVE_MATCH_POLL_SECONDS for rows
+written by other processes (CLI ingestion, other API workers). On each pass:
+
+- a trade whose total now matches leaves the index and its open match issues
+  are resolved
+- AMOUNT_MISMATCH is raised, or its description updated, as soon as a total
+  is wrong
+- MISSING_LEDGER_ENTRY is raised once a trade has waited
+  LIVE_MATCH_GRACE_SECONDS without a ledger row
+- a ledger row for a trade outside the index (already matched) loads that
+  trade back, so a late row can still break it; a reconciled trade with a new
+  finding goes back to pending with its ledger rows unreconciled
+
+Findings use the batch engine's rules and issue keys, so the two coexist:
+`ReconciliationEngine` remains the authority for reconciling trades, the fuzzy
+pass and anomalies. Like incremental reconciliation, tailing assumes row ids grow
+in commit order.
+"""
+import threading
+import time
+from array import array
+from collections import defaultdict, deque
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .config import get_settings
+from .database import SessionLocal
+from .events import event_bus, publish_issue_changes
+from .issue_store import close_stale_issues, issue_key, upsert_issues
+from .models import LedgerEntry, Trade
+from .matching import evaluate_match
+from .reconciliation import MATCH_ISSUE_TYPES, reopen_trades, to_issue_row
+from .summary import SummaryDelta
+from . import versions
+
+LOOKUP_CHUNK_SIZE = 500  # trade ids per IN (...) when loading trades and their ledger rows
+TAIL_BATCH_SIZE = 50000  # new rows read per query while tailing
+WARM_BATCH_SIZE = 100000
+
+class OpenTrades:
+    """Open trades as parallel typed arrays, one slot per trade_id.
+
+    A slot is 28 bytes of array storage (expected notional, ledger total and
+    grace deadline as doubles, ledger row count); with its dict entry and the
+    trade_id string an open trade costs roughly 150 bytes on CPython, so tens
+    of millions fit in one process. Freed slots are reused.
+    """
+    __slots__ = ("slots", "expected", "total", "rows", "deadline", "_free")
+
+    def __init__(self):
+        self.slots: Dict[str, int] = {}
+        self.expected = array("d")
+        self.total = array("d")
+        self.rows = array("I")
+        self.deadline = array("d")  # monotonic time to report a missing ledger entry; 0 once handled
+        self._free = array("q")
+
+    def __len__(self) -> int:
+        return len(self.slots)
+
+    def __contains__(self, trade_id: str) -> bool:
+        return trade_id in self.slots
+
+    def put(self, trade_id: str, expected: float, total: float, rows: int, deadline: float) -> int:
+        slot = self.slots.get(trade_id)
+        if slot is None and self._free:
+            slot = self._free.pop()
+        if slot is None:
+            slot = len(self.expected)
+            self.expected.append(expected)
+            self.total.append(total)
+            self.rows.append(rows)
+            self.deadline.append(deadline)
+        else:
+            self.expected[slot] = expected
+            self.total[slot] = total
+            self.rows[slot] = rows
+            self.deadline[slot] = deadline
+        self.slots[trade_id] = slot
+        return slot
+
+    def remove(self, trade_id: str):
+        slot = self.slots.pop(trade_id, None)
+        if slot is not None:
+            self.deadline[slot] = 0.0
+            self._free.append(slot)
+
+class LiveMatcher:
+    def __init__(self, grace_seconds: float = 300.0, poll_seconds: float = 1.0,
+                 session_factory=SessionLocal):
+        self.grace_seconds = grace_seconds
+        self.poll_seconds = poll_seconds
+        self.session_factory = session_factory
+        self.open = OpenTrades()
+        self._due: deque = deque()  # (deadline, trade_id) in deadline order: the grace period is fixed
+        self._touched: Set[str] = set()
+        self._trade_mark = 0
+        self._ledger_mark = 0
+        self._reload: Set[str] = set()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.ready = False
+        self.passes = 0
+        self.issues_raised = 0
+        self.issues_resolved = 0
+        self.last_pass_ms = 0.0
+        self.error: Optional[str] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if not self.running:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="live-matcher", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self, changed_trade_ids: Iterable[str] = ()):
+        """Wake the matcher after a commit; `changed_trade_ids` are existing trades that were rewritten"""
+        if self._thread is None:
+            return
+        changed = list(changed_trade_ids)
+        if changed:
+            with self._lock:
+                self._reload.update(changed)
+        self._wake.set()
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "open_trades": len(self.open),
+            "awaiting_ledger": len(self._due),
+            "passes": self.passes,
+            "issues_raised": self.issues_raised,
+            "issues_resolved": self.issues_resolved,
+            "last_pass_ms": round(self.last_pass_ms, 2),
+            "error": self.error,
+        }
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()  # a notify during the pass leaves it set, so the next wait returns at once
+            db = self.session_factory()
+            try:
+                if not self.ready:
+                    self._warm(db)
+                    self.ready = True
+                started = time.perf_counter()
+                self._pass(db)
+                self.passes += 1
+                self.last_pass_ms = (time.perf_counter() - started) * 1000
+                self.error = None
+            except Exception as e:
+                db.rollback()
+                self.error = str(e)
+            finally:
+                db.close()
+            self._wake.wait(self._timeout())
+
+    def _timeout(self) -> float:
+        if self._due:
+            return max(0.0, min(self.poll_seconds, self._due[0][0] - time.monotonic()))
+        return self.poll_seconds
+
+    def _warm(self, db: Session):
+        """Index every pending trade as of the current row ids; the first pass drops those that match"""
+        self.open = OpenTrades()
+        self._due.clear()
+        self._trade_mark = db.scalar(select(func.max(Trade.id))) or 0
+        self._ledger_mark = db.scalar(select(func.max(LedgerEntry.id))) or 0
+        rows = db.execute(
+            select(Trade.id, Trade.trade_id, Trade.quantity, Trade.price, LedgerEntry.amount)
+            .outerjoin(LedgerEntry, (LedgerEntry.trade_id == Trade.trade_id)
+                       & (LedgerEntry.id <= self._ledger_mark))
+            .where(Trade.status == "pending", Trade.id <= self._trade_mark)
+            .order_by(Trade.id, LedgerEntry.id)
+            .execution_options(yield_per=WARM_BATCH_SIZE)
+        )
+        current, amounts = None, []
+        for row_id, trade_id, quantity, price, amount in rows:
+            if row_id != current:
+                if current is not None:
+                    self._index(*trade, amounts)
+                current, trade, amounts = row_id, (trade_id, quantity * price), []
+            if amount is not None:
+                amounts.append(amount)
+        if current is not None:
+            self._index(*trade, amounts)
+        db.commit()
+
+    def _index(self, trade_id: str, expected: float, amounts: Sequence[float]):
+        """(Re)index a trade from its ledger amounts in row id order; it is evaluated on the next pass"""
+        total = 0.0
+        for amount in amounts:
+            total += amount
+        deadline = 0.0
+        if not amounts:
+            deadline = time.monotonic() + self.grace_seconds
+            self._due.append((deadline, trade_id))
+        self.open.put(trade_id, expected, total, len(amounts), deadline)
+        self._touched.add(trade_id)
+
+    def _load(self, db: Session, trades: List[Tuple[str, float, float]]):
+        """Index trades with their ledger rows up to the ledger mark; later rows arrive by tailing"""
+        for start in range(0, len(trades), LOOKUP_CHUNK_SIZE):
+            chunk = trades[start:start + LOOKUP_CHUNK_SIZE]
+            amounts = defaultdict(list)
+            for trade_id, amount in db.execute(
+                select(LedgerEntry.trade_id, LedgerEntry.amount)
+                .where(LedgerEntry.trade_id.in_([trade_id for trade_id, _, _ in chunk]),
+                       LedgerEntry.id <= self._ledger_mark)
+                .order_by(LedgerEntry.id)
+            ):
+                amounts[trade_id].append(amount)
+            for trade_id, quantity, price in chunk:
+                self._index(trade_id, quantity * price, amounts.get(trade_id, ()))
+
+    def _load_ids(self, db: Session, trade_ids: List[str]):
+        trades = []
+        for start in range(0, len(trade_ids), LOOKUP_CHUNK_SIZE):
+            trades.extend(db.execute(
+                select(Trade.trade_id, Trade.quantity, Trade.price)
+                .where(Trade.trade_id.in_(trade_ids[start:start + LOOKUP_CHUNK_SIZE]))
+            ).all())
+        self._load(db, trades)
+
+    def _pass(self, db: Session):
+        # Read the ledger high-water mark first: trades are loaded with rows up
+        # to the previous mark, and every row after it is added exactly once below
+        ledger_mark = db.scalar(select(func.max(LedgerEntry.id))) or 0
+
+        while True:
+            rows = db.execute(
+                select(Trade.id, Trade.trade_id, Trade.quantity, Trade.price)
+                .where(Trade.id > self._trade_mark)
+                .order_by(Trade.id)
+                .limit(TAIL_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            self._trade_mark = rows[-1][0]
+            self._load(db, [(trade_id, quantity, price) for _, trade_id, quantity, price in rows
+                            if trade_id not in self.open])
+
+        with self._lock:
+            reload, self._reload = list(self._reload), set()
+        if reload:
+            self._load_ids(db, reload)
+
+        while self._ledger_mark < ledger_mark:
+            rows = db.execute(
+                select(LedgerEntry.id, LedgerEntry.trade_id, LedgerEntry.amount)
+                .where(LedgerEntry.id > self._ledger_mark, LedgerEntry.id <= ledger_mark)
+                .order_by(LedgerEntry.id)
+                .limit(TAIL_BATCH_SIZE)
+            ).all()
+            if not rows:
+                break
+            # Trades outside the index either matched earlier or do not exist (orphan rows)
+            self._load_ids(db, list({trade_id for _, trade_id, _ in rows if trade_id not in self.open}))
+            open_trades = self.open
+            for _, trade_id, amount in rows:
+                slot = open_trades.slots.get(trade_id)
+                if slot is not None:
+                    open_trades.total[slot] += amount
+                    open_trades.rows[slot] += 1
+                    self._touched.add(trade_id)
+            self._ledger_mark = rows[-1][0]
+        self._ledger_mark = max(self._ledger_mark, ledger_mark)
+
+        self._write_findings(db)
+
+    def _write_findings(self, db: Session):
+        open_trades = self.open
+        issues, found, scope = [], set(), []
+        for trade_id in self._touched:
+            slot = open_trades.slots.get(trade_id)
+            if slot is None or not open_trades.rows[slot]:
+                continue  # no ledger row yet: the grace period decides
+            scope.append(trade_id)
+            finding = evaluate_match(trade_id, open_trades.expected[slot],
+                                     open_trades.total[slot], open_trades.rows[slot])
+            if finding:
+                issues.append(to_issue_row(finding))
+                found.add(issue_key(issues[-1]))
+            else:
+                open_trades.remove(trade_id)
+        self._touched.clear()
+
+        now = time.monotonic()
+        while self._due and self._due[0][0] <= now:
+            deadline, trade_id = self._due.popleft()
+            slot = open_trades.slots.get(trade_id)
+            if slot is None or open_trades.deadline[slot] != deadline:
+                continue  # matched, or re-indexed with a later deadline
+            open_trades.deadline[slot] = 0.0
+            if not open_trades.rows[slot]:
+                issues.append(to_issue_row(evaluate_match(trade_id, open_trades.expected[slot], 0.0, 0)))
+
+        upserted = upsert_issues(db, issues) if issues else []
+        resolved = close_stale_issues(db, MATCH_ISSUE_TYPES, found, scope) if scope else []
+        # A late ledger row can break a trade the batch engine already reconciled
+        delta = SummaryDelta()
+        reopened = reopen_trades(db, [issue["trade_id"] for issue in issues], delta)
+        delta.apply(db)
+        if reopened:
+            versions.bump(db, "trades", "ledger")
+        if upserted or resolved:
+            versions.bump(db, "issues")
+        db.commit()
+        if reopened:
+            event_bus.publish("trades.changed", {"reopened": reopened})
+        if upserted or resolved:
+            publish_issue_changes(upserted, resolved)
+            self.issues_raised += len(upserted)
+            self.issues_resolved += len(resolved)
+
+live_matcher: Optional[LiveMatcher] = None
+
+def get_live_matcher() -> LiveMatcher:
+    global live_matcher
+    if live_matcher is None:
+        settings = get_settings()
+        live_matcher = LiveMatcher(settings.live_match_grace_seconds, settings.live_match_poll_seconds)
+    return live_matcher
+
+def notify(changed_trade_ids: Iterable[str] = ()):
+    """Called by write paths after they commit; a no-op unless the matcher is running"""
+    if live_matcher is not None:
+        live_matcher.notify(changed_trade_ids)
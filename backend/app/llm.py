@@ -0,0 +1,102 @@
+import asyncio
+import time
+from typing import AsyncIterator, Dict, Optional
+
+import anthropic
+import httpx
+
+from .config import get_settings
+from . import metrics
+
+MODEL = "claude-sonnet-4-20250514"
+
+class LLMClient:
+    """Shared async model client: one connection pool, bounded concurrency.
+
+    At most `concurrency` requests are in flight at once; callers beyond that
+    wait on the semaphore instead of opening more connections. Retries with
+    exponential backoff (connection errors, 408/409/429/5xx, honouring
+    retry-after) are done by the SDK, inside the semaphore so a rate-limited
+    backend sees less traffic, not more.
+    """
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None, concurrency: int = 8,
+                 max_retries: int = 3, timeout: float = 60.0):
+        self.concurrency = concurrency
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._client = anthropic.AsyncAnthropic(
+            api_key=api_key,
+            base_url=base_url,
+            max_retries=max_retries,
+            timeout=timeout,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+            ),
+        )
+
+    async def complete(self, prompt: str, system: Optional[str] = None, max_tokens: int = 1000) -> str:
+        async with self._semaphore:
+            started = time.perf_counter()
+            try:
+                message = await self._client.messages.create(**self._request(prompt, system, max_tokens))
+            except BaseException:
+                metrics.record_llm_call("complete", "error", time.perf_counter() - started)
+                raise
+        metrics.record_llm_call("complete", "ok", time.perf_counter() - started, message.usage)
+        return message.content[0].text
+
+    async def stream(self, prompt: str, system: Optional[str] = None,
+                     max_tokens: int = 1000) -> AsyncIterator[str]:
+        """Yield text deltas as the model produces them"""
+        async with self._semaphore:
+            started = time.perf_counter()
+            first_token = None
+            outcome, usage = "error", None
+            try:
+                async with self._client.messages.stream(**self._request(prompt, system, max_tokens)) as stream:
+                    async for text in stream.text_stream:
+                        if first_token is None:
+                            first_token = time.perf_counter() - started
+                            metrics.LLM_FIRST_TOKEN.observe(first_token)
+                        yield text
+                    usage = (await stream.get_final_message()).usage
+                outcome = "ok"
+            finally:
+                metrics.record_llm_call("stream", outcome, time.perf_counter() - started, usage)
+
+    def _request(self, prompt: str, system: Optional[str], max_tokens: int) -> Dict:
+        request = {
+            "model": MODEL,
+            "max_tokens": max_tokens,
+            "messages": [{"role": "user", "content": prompt}],
+        }
+        if system:
+            request["system"] = system
+        return request
+
+    async def close(self):
+        await self._client.close()
+
+# The semaphore and pooled connections belong to one event loop
+_client: Optional[LLMClient] = None
+_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_llm_client() -> Optional[LLMClient]:
+    """The shared client for the running loop, or None when no API key is configured"""
+    global _client, _client_loop
+    settings = get_settings()
+    api_key = settings.anthropic_api_key
+    if not api_key or api_key == "dummy_key":
+        return None
+    loop = asyncio.get_running_loop()
+    if _client is None or _client_loop is not loop:
+        _client = LLMClient(api_key, settings.anthropic_base_url, settings.llm_concurrency,
+                            settings.llm_max_retries, settings.llm_timeout_seconds)
+        _client_loop = loop
+    return _client
+
+async def close_llm_client():
+    global _client, _client_loop
+    if _client is not None and _client_loop is asyncio.get_running_loop():
+        await _client.close()
+    _client, _client_loop = None, None
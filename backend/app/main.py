@@ -1,18 +1,49 @@
-from fastapi import FastAPI, Depends, HTTPException
+from fastapi import FastAPI, Depends, Header, HTTPException, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import Session
-from .database import engine, get_db, Base
+from .config import get_settings
+from .database import get_db, get_read_db, get_write_db, init_db
 from .models import Trade, LedgerEntry, ReconciliationIssue
-from .reconciliation import ReconciliationEngine
-from .ai_copilot import AICopilot
+from .ai_copilot import AICopilot, MAX_BULK_EXPLANATIONS, explanation_cache, query_cache
+from .ingestion import BATCH_CHUNK_SIZE, DEFAULT_CHUNK_SIZE, SCHEMAS, TradeBatch, ingest
+from .jobs import get_job_manager
+from .events import event_bus
+from .summary import SummaryDelta
+from . import archive, export, live_matching, llm, metrics, page_cache, summary, versions
+from .listing import (
+    DEFAULT_PAGE_SIZE, ISSUE_FIELDS, LEDGER_FIELDS, MAX_PAGE_SIZE, TRADE_FIELDS,
+    fetch_page_async, issue_filters, ledger_filters, parse_fields, trade_filters
+)
 from pydantic import BaseModel
-from typing import List
+from typing import AsyncIterator, List, Literal, Optional
+from contextlib import asynccontextmanager
 from datetime import datetime
+import json
+import tempfile
+
+settings = get_settings()
+
+# Create tables and indexes
+init_db()
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # The matcher warms its index in its own thread, so startup does not wait for it
+    matcher = live_matching.get_live_matcher() if settings.live_matching else None
+    if matcher:
+        matcher.start()
+    yield
+    if matcher:
+        matcher.stop()
+    # The shared model client holds a connection pool bound to this event loop
+    await llm.close_llm_client()
 
-app = FastAPI(title="OpsPilot API")
+app = FastAPI(title="OpsPilot API", lifespan=lifespan)
+app.router.route_class = metrics.InstrumentedRoute  # before any route is declared
+metrics.instrument_engines()
 
 # CORS
 app.add_middleware(
@@ -21,7 +52,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Server-Timing", "X-Profile-File"],
 )
+# Outermost, so its timings include the other middleware
+app.add_middleware(metrics.MetricsMiddleware, profile_dir=settings.profile_dir)
+
+POOL_RETRY_AFTER_SECONDS = 5
+
+@app.exception_handler(PoolTimeoutError)
+async def pool_timeout(request: Request, exc: PoolTimeoutError):
+    """No connection came free within the pool's timeout: the database is busy, not broken"""
+    return JSONResponse(status_code=503, content={"detail": "Database busy, retry shortly"},
+                        headers={"Retry-After": str(POOL_RETRY_AFTER_SECONDS)})
 
 # Pydantic models
 class TradeCreate(BaseModel):
@@ -35,6 +77,37 @@ class TradeCreate(BaseModel):
 class CopilotQuery(BaseModel):
     query: str
 
+# List responses: every field but id is optional so `fields=` projections validate
+class TradeOut(BaseModel):
+    id: int
+    trade_id: Optional[str] = None
+    trader: Optional[str] = None
+    instrument: Optional[str] = None
+    quantity: Optional[float] = None
+    price: Optional[float] = None
+    side: Optional[str] = None
+    timestamp: Optional[datetime] = None
+    status: Optional[str] = None
+
+class IssueOut(BaseModel):
+    id: int
+    issue_type: Optional[str] = None
+    description: Optional[str] = None
+    severity: Optional[str] = None
+    trade_id: Optional[str] = None
+    detected_at: Optional[datetime] = None
+    resolved: Optional[bool] = None
+    ai_explanation: Optional[str] = None
+    updated_at: Optional[datetime] = None
+
+class TradePage(BaseModel):
+    items: List[TradeOut]
+    next_cursor: Optional[int] = None
+
+class IssuePage(BaseModel):
+    items: List[IssueOut]
+    next_cursor: Optional[int] = None
+
 @app.get("/")
 def root():
     return {"message": "OpsPilot API - Operations Reconciliation Copilot"}
@@ -43,43 +116,300 @@ def root():
 def create_trade(trade: TradeCreate, db: Session = Depends(get_db)):
     db_trade = Trade(**trade.dict())
     db.add(db_trade)
+    delta = SummaryDelta()
+    delta.add_trade(dict(trade.dict(), status="pending"))
+    delta.apply(db)
+    versions.bump(db, "trades")
     db.commit()
+    live_matching.notify()
     db.refresh(db_trade)
+    event_bus.publish("trade.created", TradeOut.model_validate(db_trade, from_attributes=True).model_dump())
     return db_trade
 
-@app.get("/trades/")
-def get_trades(db: Session = Depends(get_db)):
-    return db.query(Trade).all()
+async def ndjson_chunks(stream: AsyncIterator[bytes], size: int) -> AsyncIterator[List[bytes]]:
+    """Group an NDJSON body into lists of up to `size` non-blank lines as it arrives"""
+    buffer, lines = b"", []
+    async for block in stream:
+        *complete, buffer = (buffer + block).split(b"\n")
+        lines.extend(line for line in complete if line.strip())
+        while len(lines) >= size:
+            yield lines[:size]
+            lines = lines[size:]
+    if buffer.strip():
+        lines.append(buffer)
+    if lines:
+        yield lines
+
+@app.post("/trades/batch")
+async def create_trades_batch(request: Request, db: Session = Depends(get_write_db)):
+    """Insert many trades in one transaction.
+
+    The body is a JSON array of trades, or NDJSON (Content-Type
+    application/x-ndjson, one trade per line) which is validated and inserted
+    in chunks as it streams in. Invalid rows and trade_ids that already exist
+    are reported per row without failing the batch.
+    """
+    batch = TradeBatch(db)
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        async for lines in ndjson_chunks(request.stream(), BATCH_CHUNK_SIZE):
+            await run_in_threadpool(batch.add_ndjson, lines)
+    else:
+        try:
+            rows = json.loads(await request.body())
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Body is not valid JSON")
+        if not isinstance(rows, list):
+            raise HTTPException(status_code=400, detail="Expected a JSON array of trades")
+        await run_in_threadpool(batch.add, rows)
+    return await run_in_threadpool(batch.commit)
+
+@app.get("/trades/", response_model=TradePage, response_model_exclude_unset=True)
+async def get_trades(request: Request, after: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                     order: Literal["asc", "desc"] = "asc", fields: Optional[str] = None,
+                     status: Optional[str] = None, trader: Optional[str] = None,
+                     instrument: Optional[str] = None, since: Optional[datetime] = None,
+                     until: Optional[datetime] = None, db=Depends(get_read_db)):
+    """Keyset-paginated trades; pass the returned next_cursor as `after` for the next page.
+
+    Send the ETag back in If-None-Match to get 304 while the trades table is unchanged.
+    """
+    try:
+        columns = parse_fields(fields, TRADE_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = trade_filters(status, trader, instrument, since, until)
+    
+    async def read():
+        items, next_cursor = await fetch_page_async(db, Trade, columns, filters, after, limit, order)
+        return {"items": items, "next_cursor": next_cursor}
+    
+    return await page_cache.cached_page(request, db, "trades", Trade, TradePage, read)
+
+@app.get("/issues/", response_model=IssuePage, response_model_exclude_unset=True)
+async def get_issues(request: Request, after: Optional[int] = None, limit: int = DEFAULT_PAGE_SIZE,
+                     order: Literal["asc", "desc"] = "asc", fields: Optional[str] = None,
+                     resolved: Optional[bool] = False, severity: Optional[str] = None,
+                     issue_type: Optional[str] = None, trade_id: Optional[str] = None,
+                     since: Optional[datetime] = None, until: Optional[datetime] = None,
+                     db=Depends(get_read_db)):
+    """Keyset-paginated issues, open ones by default; conditional like `GET /trades/`"""
+    try:
+        columns = parse_fields(fields, ISSUE_FIELDS)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filters = issue_filters(resolved, severity, issue_type, trade_id, since, until)
+    
+    async def read():
+        items, next_cursor = await fetch_page_async(db, ReconciliationIssue, columns, filters, after, limit, order)
+        return {"items": items, "next_cursor": next_cursor}
+    
+    return await page_cache.cached_page(request, db, "issues", ReconciliationIssue, IssuePage, read)
+
+@app.get("/summary")
+async def get_summary(top: int = 20, db=Depends(get_read_db)):
+    """Maintained counts and notionals; the cost does not grow with the tables"""
+    if isinstance(db, Session):
+        result = await run_in_threadpool(summary.read, db, top)
+    else:
+        result = await db.run_sync(summary.read, top)
+    if result is None:
+        raise HTTPException(status_code=503, detail="Summary not built yet")
+    return result
+
+ExportFormat = Literal["csv", "ndjson", "parquet"]
+
+def export_response(table: str, fields: Optional[str], allowed: List[str], filters: List,
+                    format: str) -> StreamingResponse:
+    """Stream the matching rows from a server-side cursor, one encoded batch per chunk"""
+    try:
+        columns = parse_fields(fields, allowed)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(export.stream(table, columns, filters, format),
+                             media_type=export.FORMATS[format]["media_type"],
+                             headers=export.headers(table, format))
+
+@app.get("/export/trades")
+def export_trades(format: ExportFormat = "csv", fields: Optional[str] = None,
+                  status: Optional[str] = None, trader: Optional[str] = None,
+                  instrument: Optional[str] = None, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None):
+    filters = trade_filters(status, trader, instrument, since, until)
+    return export_response("trades", fields, TRADE_FIELDS, filters, format)
 
-@app.get("/issues/")
-def get_issues(db: Session = Depends(get_db)):
-    return db.query(ReconciliationIssue).filter(
-        ReconciliationIssue.resolved == False
-    ).all()
+@app.get("/export/ledger")
+def export_ledger(format: ExportFormat = "csv", fields: Optional[str] = None,
+                  reconciled: Optional[bool] = None, trade_id: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None):
+    filters = ledger_filters(reconciled, trade_id, since, until)
+    return export_response("ledger", fields, LEDGER_FIELDS, filters, format)
+
+@app.get("/export/issues")
+def export_issues(format: ExportFormat = "csv", fields: Optional[str] = None,
+                  resolved: Optional[bool] = None, severity: Optional[str] = None,
+                  issue_type: Optional[str] = None, trade_id: Optional[str] = None,
+                  since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """All issues unless `resolved` is given (the list endpoint defaults to open ones)"""
+    filters = issue_filters(resolved, severity, issue_type, trade_id, since, until)
+    return export_response("issues", fields, ISSUE_FIELDS, filters, format)
+
+@app.get("/archive/{table}")
+def get_archived(table: str, trade_id: Optional[str] = None, since: Optional[datetime] = None,
+                 until: Optional[datetime] = None, fields: Optional[str] = None,
+                 limit: int = DEFAULT_PAGE_SIZE):
+    """Rows moved to the Parquet archive; since/until only open the date partitions they cover"""
+    if table not in archive.ARCHIVED:
+        raise HTTPException(status_code=404, detail=f"No archive for {table}")
+    try:
+        columns = parse_fields(fields, archive.fields(table))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    return {"items": archive.query(table, columns, trade_id, since, until, limit)}
 
 @app.post("/reconcile/")
-def run_reconciliation(db: Session = Depends(get_db)):
-    engine = ReconciliationEngine(db)
-    issues = engine.check_trade_ledger_match()
-    anomalies = engine.detect_anomalies()
-    return {
-        "issues": issues,
-        "anomalies": anomalies,
-        "total": len(issues) + len(anomalies)
-    }
+@metrics.profiles_job
+def run_reconciliation(response: Response, incremental: bool = False, x_profile: Optional[str] = Header(None)):
+    """Run reconciliation and wait for it; a queued or running run of the same mode is joined instead.
+
+    With PROFILE_DIR set, `X-Profile: 1` profiles the run; the .prof path is in `X-Profile-File`.
+    """
+    profile_path = None
+    if x_profile and x_profile != "0":
+        profile_path = metrics.profile_path(settings.profile_dir, "reconcile job default")
+    job, coalesced = get_job_manager().submit(incremental=incremental, profile_path=profile_path)
+    job.wait()
+    if job.profile_path:
+        response.headers["X-Profile-File"] = job.profile_path
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=job.error)
+    if job.result is None:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return dict(job.result, job_id=job.id, status=job.status, coalesced=coalesced)
+
+@app.post("/reconcile/jobs", status_code=202)
+@metrics.profiles_job
+def submit_reconciliation_job(incremental: bool = False, scope: str = "default",
+                              x_profile: Optional[str] = Header(None)):
+    """Queue a reconciliation run; returns the queued or running job for the same scope and mode if there is one.
+
+    With PROFILE_DIR set, `X-Profile: 1` profiles the run itself; the job reports the .prof path.
+    """
+    profile_path = None
+    if x_profile and x_profile != "0":
+        profile_path = metrics.profile_path(settings.profile_dir, f"reconcile job {scope}")
+    job, coalesced = get_job_manager().submit(incremental=incremental, scope=scope, profile_path=profile_path)
+    return dict(job.to_dict(), coalesced=coalesced)
+
+@app.get("/reconcile/jobs")
+def list_reconciliation_jobs():
+    return [job.to_dict() for job in get_job_manager().list()]
+
+@app.get("/reconcile/jobs/{job_id}")
+def get_reconciliation_job(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/reconcile/jobs/{job_id}/result")
+def get_reconciliation_job_result(job_id: str):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.result is None or not job.finished:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    return job.result
+
+@app.post("/reconcile/jobs/{job_id}/cancel")
+def cancel_reconciliation_job(job_id: str):
+    job = get_job_manager().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.post("/ingest/")
+async def ingest_file(request: Request, kind: str, format: str = "csv",
+                      chunk_size: int = DEFAULT_CHUNK_SIZE, db: Session = Depends(get_write_db)):
+    """Bulk-load a CSV or Parquet file sent as the raw request body"""
+    if kind not in SCHEMAS:
+        raise HTTPException(status_code=400, detail=f"kind must be one of {sorted(SCHEMAS)}")
+    if format not in ("csv", "parquet"):
+        raise HTTPException(status_code=400, detail="format must be csv or parquet")
+    
+    # Spool the upload to disk past 16MB so large files never sit in memory
+    upload = tempfile.SpooledTemporaryFile(max_size=16 * 1024 * 1024)
+    try:
+        async for block in request.stream():
+            upload.write(block)
+        upload.seek(0)
+        return await run_in_threadpool(ingest, db, kind, upload, format, chunk_size)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        upload.close()
 
 @app.post("/copilot/explain/{issue_id}")
-def explain_issue(issue_id: int, db: Session = Depends(get_db)):
+async def explain_issue(issue_id: int, db: Session = Depends(get_db)):
     copilot = AICopilot(db)
-    explanation = copilot.explain_issue(issue_id)
+    explanation = await copilot.explain_issue(issue_id)
     return {"explanation": explanation}
 
+@app.post("/copilot/explain-all")
+async def explain_open_issues(limit: int = 50, severity: Optional[str] = None,
+                              db: Session = Depends(get_db)):
+    """Explain up to `limit` open issues, most severe first, with concurrent model calls"""
+    copilot = AICopilot(db)
+    explanations = await copilot.explain_open_issues(max(1, min(limit, MAX_BULK_EXPLANATIONS)), severity)
+    return {"explanations": explanations, "total": len(explanations)}
+
 @app.post("/copilot/query")
-def copilot_query(query: CopilotQuery, db: Session = Depends(get_db)):
+async def copilot_query(query: CopilotQuery, db: Session = Depends(get_db)):
     copilot = AICopilot(db)
-    answer = copilot.answer_query(query.query)
+    answer = await copilot.answer_query(query.query)
     return {"answer": answer}
 
+@app.post("/copilot/query/stream")
+async def copilot_query_stream(query: CopilotQuery, db: Session = Depends(get_db)):
+    """Server-sent events: `data: {"text": ...}` per chunk, then `event: done`"""
+    copilot = AICopilot(db)
+    chunks = await copilot.stream_query(query.query)
+    
+    async def events():
+        async for text in chunks:
+            yield f"data: {json.dumps({'text': text})}\n\n"
+        yield "event: done\ndata: {}\n\n"
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/copilot/cache")
+def copilot_cache_stats():
+    return {"explanations": explanation_cache.stats(), "queries": query_cache.stats()}
+
+@app.get("/events")
+async def stream_events(last_event_id: Optional[str] = Header(None)):
+    """Server-sent change events for dashboards; a reconnect resumes after Last-Event-ID.
+
+    Events: trade.created, issue.upserted, issue.resolved, reconcile.progress,
+    reconcile.job, the bulk summaries trades.changed, ledger.changed and
+    issues.changed (refetch the list), and resync (reload everything).
+    """
+    after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    subscription = event_bus.subscribe(after)
+    return StreamingResponse(subscription.stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def prometheus_metrics():
+    """Request, SQL, model and job metrics in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/health")
 def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
\ No newline at end of file
+    health = {"status": "healthy", "timestamp": datetime.utcnow()}
+    if live_matching.live_matcher is not None:
+        health["live_matching"] = live_matching.live_matcher.stats()
+    health["page_cache"] = page_cache.page_cache.stats()
+    return health
\ No newline at end of file
@@ -0,0 +1,319 @@
+"""Process metrics in the Prometheus text format, plus opt-in request profiling.
+
+SQL statements are timed with engine events on every engine in the process,
+model calls in `LLMClient`, and requests in `MetricsMiddleware`, which also
+attributes statements, rows and model time to the request that caused them
+(through a context variable that worker threads inherit). `GET /metrics`
+renders everything; values are per process.
+
+With PROFILE_DIR set, a request carrying `X-Profile: 1` has its endpoint run
+under cProfile and the stats are written to that directory as a .prof file
+(open with `python -m pstats` or snakeviz). Sync endpoints are profiled in the
+worker thread they run on, async ones on the event loop, where the profile also
+sees other requests running at the same time. Only one profiler runs per
+process: a request or job that asks while another is being profiled is simply
+not profiled.
+"""
+import asyncio
+import cProfile
+import os
+import pstats
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from functools import wraps
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from fastapi.routing import APIRoute
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SQL_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 500, 1000, 10000)
+SQL_OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE"}
+PROFILE_HEADER = "x-profile"
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def inc(self, *label_values: str, amount: float = 1.0):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labels, label_values)} {_number(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values: Dict[Tuple[str, ...], List] = {}  # labels -> [bucket counts (+Inf last), sum]
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect_left(self.buckets, value)  # first bucket whose upper bound is >= value
+        with self._lock:
+            counts, _ = entry = self._values.setdefault(label_values, [[0] * (len(self.buckets) + 1), 0.0])
+            counts[index] += 1
+            entry[1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = _labels(self.labels + ("le",), label_values + (_number(bound),))
+                    lines.append(f"{self.name}_bucket{le} {cumulative}")
+                labels = _labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {_number(total)}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+def _labels(names: Tuple[str, ...], values: Tuple[str, ...]) -> str:
+    if not names:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values)
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, escaped)) + "}"
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+REGISTRY: List = []
+
+REQUEST_SECONDS = Histogram("opspilot_http_request_duration_seconds", "Request latency until the response completes",
+                            ("method", "route", "status"))
+REQUEST_SQL = Histogram("opspilot_http_request_sql_statements", "SQL statements executed per request",
+                        ("method", "route"), COUNT_BUCKETS)
+REQUEST_ROWS = Histogram("opspilot_http_request_rows", "Rows returned per list request",
+                         ("method", "route"), COUNT_BUCKETS)
+SQL_SECONDS = Histogram("opspilot_sql_statement_duration_seconds", "SQL statement execution time",
+                        ("operation",), SQL_BUCKETS)
+SQL_ROWS = Counter("opspilot_sql_rows_affected_total", "Rows written by INSERT/UPDATE/DELETE", ("operation",))
+LLM_SECONDS = Histogram("opspilot_llm_request_duration_seconds", "Model call latency, excluding queueing",
+                        ("method", "outcome"))
+LLM_FIRST_TOKEN = Histogram("opspilot_llm_time_to_first_token_seconds", "Streaming model calls: time to first text")
+LLM_TOKENS = Counter("opspilot_llm_tokens_total", "Model tokens used", ("direction",))
+JOB_SECONDS = Histogram("opspilot_reconcile_job_duration_seconds", "Background reconciliation run time", ("status",))
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+class Stats:
+    """What one request (or job) cost; shared with the worker threads it uses"""
+    __slots__ = ("sql_statements", "sql_seconds", "rows", "llm_calls", "llm_seconds")
+
+    def __init__(self):
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows: Optional[int] = None
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+
+    def server_timing(self, total_seconds: float) -> str:
+        timing = [f"app;dur={total_seconds * 1000:.1f}",
+                  f'db;dur={self.sql_seconds * 1000:.1f};desc="{self.sql_statements} statements"']
+        if self.llm_calls:
+            timing.append(f'llm;dur={self.llm_seconds * 1000:.1f};desc="{self.llm_calls} calls"')
+        return ", ".join(timing)
+
+_stats: ContextVar[Optional[Stats]] = ContextVar("opspilot_stats", default=None)
+# Set by MetricsMiddleware on a request that asked to be profiled; its endpoint adds the profile taken
+_request_profiles: ContextVar[Optional[List[cProfile.Profile]]] = ContextVar("opspilot_profiles", default=None)
+# cProfile allows one active profiler per process (from Python 3.12 it claims
+# sys.monitoring's profiler slot and a second enable() raises)
+_profile_lock = threading.Lock()
+
+@contextmanager
+def track() -> Iterator[Stats]:
+    """Attribute SQL, rows and model calls made inside the block to a fresh Stats"""
+    stats = Stats()
+    token = _stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _stats.reset(token)
+
+def record_rows(count: int):
+    stats = _stats.get()
+    if stats is not None:
+        stats.rows = (stats.rows or 0) + count
+
+def record_llm_call(method: str, outcome: str, seconds: float, usage=None):
+    LLM_SECONDS.observe(seconds, method, outcome)
+    if usage is not None:
+        LLM_TOKENS.inc("input", amount=usage.input_tokens or 0)
+        LLM_TOKENS.inc("output", amount=usage.output_tokens or 0)
+    stats = _stats.get()
+    if stats is not None:
+        stats.llm_calls += 1
+        stats.llm_seconds += seconds
+
+def instrument_engines():
+    """Time every statement on every engine in the process, including async engines"""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context._metrics_started = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    operation = statement.lstrip()[:6].upper()
+    operation = operation if operation in SQL_OPERATIONS else "OTHER"
+    SQL_SECONDS.observe(elapsed, operation)
+    if operation != "SELECT" and cursor.rowcount and cursor.rowcount > 0:
+        SQL_ROWS.inc(operation, amount=cursor.rowcount)
+    stats = _stats.get()
+    if stats is not None:
+        stats.sql_statements += 1
+        stats.sql_seconds += elapsed
+
+def profile_path(profile_dir: Optional[str], label: str) -> Optional[str]:
+    """A fresh .prof path under `profile_dir`, or None when profiling is off"""
+    if not profile_dir:
+        return None
+    os.makedirs(profile_dir, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%dT%H%M%S%f")
+    return os.path.join(profile_dir, f"{stamp}-{re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')}.prof")
+
+def start_profile() -> Optional[cProfile.Profile]:
+    """Enable a profiler on the calling thread, or return None while another one is active"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        # Another profiling tool (a debugger, coverage) holds the slot
+        _profile_lock.release()
+        return None
+    return profile
+
+def stop_profile(profile: cProfile.Profile):
+    profile.disable()
+    _profile_lock.release()
+
+def profiled(fn: Callable) -> Callable:
+    """Run an endpoint under a profiler when its request asked for one and none is active"""
+    if asyncio.iscoroutinefunction(fn):
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            profiles = _request_profiles.get()
+            profile = start_profile() if profiles is not None else None
+            if profile is None:
+                return await fn(*args, **kwargs)
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                stop_profile(profile)
+                profiles.append(profile)
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        profiles = _request_profiles.get()
+        profile = start_profile() if profiles is not None else None
+        if profile is None:
+            return fn(*args, **kwargs)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            stop_profile(profile)
+            profiles.append(profile)
+    return wrapper
+
+def profiles_job(fn: Callable) -> Callable:
+    """Mark an endpoint that hands `X-Profile` to a reconciliation job rather than being profiled itself"""
+    fn.profiles_job = True
+    return fn
+
+class InstrumentedRoute(APIRoute):
+    """Route class that profiles endpoints in the thread they run on (worker thread or event loop)"""
+
+    def __init__(self, path: str, endpoint: Callable, **kwargs):
+        if not getattr(endpoint, "profiles_job", False):
+            endpoint = profiled(endpoint)
+        super().__init__(path, endpoint, **kwargs)
+
+class MetricsMiddleware:
+    """Pure ASGI middleware, so streamed responses are timed until their last chunk"""
+
+    def __init__(self, app, profile_dir: Optional[str] = None):
+        self.app = app
+        self.profile_dir = profile_dir
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = 500
+        path = None
+        profiles: List[cProfile.Profile] = []
+        if self.profile_dir and dict(scope["headers"]).get(PROFILE_HEADER.encode()) not in (None, b"0"):
+            path = profile_path(self.profile_dir, f"{scope['method']} {scope['path']}")
+
+        with track() as stats:
+            async def send_with_timing(message):
+                nonlocal status
+                if message["type"] == "http.response.start":
+                    status = message["status"]
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", stats.server_timing(time.perf_counter() - started))
+                    if profiles:
+                        headers.append("X-Profile-File", path)
+                await send(message)
+
+            try:
+                if path:
+                    await self._profile(path, profiles, scope, receive, send_with_timing)
+                else:
+                    await self.app(scope, receive, send_with_timing)
+            finally:
+                route = scope.get("route")
+                route = route.path if route is not None else "unmatched"
+                method = scope["method"]
+                REQUEST_SECONDS.observe(time.perf_counter() - started, method, route, str(status))
+                REQUEST_SQL.observe(stats.sql_statements, method, route)
+                if stats.rows is not None:
+                    REQUEST_ROWS.observe(stats.rows, method, route)
+
+    async def _profile(self, path: str, profiles: List[cProfile.Profile], scope, receive, send):
+        """Run the request with `profiles` set; the endpoint adds its profile unless another is active"""
+        token = _request_profiles.set(profiles)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_profiles.reset(token)
+            if profiles:
+                pstats.Stats(profiles[0]).dump_stats(path)
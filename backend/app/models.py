@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Index
 from datetime import datetime
 from .database import Base
 
@@ -14,6 +14,14 @@ class Trade(Base):
     side = Column(String)  # BUY/SELL
     timestamp = Column(DateTime, default=datetime.utcnow)
     status = Column(String, default="pending")
+    
+    __table_args__ = (
+        # Keyset pagination: each list filter is an equality prefix followed by id
+        Index("ix_trades_status_id", "status", "id"),
+        Index("ix_trades_trader_id", "trader", "id"),
+        Index("ix_trades_instrument_id", "instrument", "id"),
+        Index("ix_trades_timestamp_id", "timestamp", "id"),
+    )
 
 class LedgerEntry(Base):
     __tablename__ = "ledger"
@@ -25,6 +33,11 @@ class LedgerEntry(Base):
     entry_type = Column(String)  # DEBIT/CREDIT
     timestamp = Column(DateTime, default=datetime.utcnow)
     reconciled = Column(Boolean, default=False)
+    
+    __table_args__ = (
+        # Orphan detection scans only unreconciled rows
+        Index("ix_ledger_reconciled_trade_id", "reconciled", "trade_id"),
+    )
 
 class ReconciliationIssue(Base):
     __tablename__ = "issues"
@@ -36,4 +49,62 @@ class ReconciliationIssue(Base):
     trade_id = Column(String, nullable=True)
     detected_at = Column(DateTime, default=datetime.utcnow)
     resolved = Column(Boolean, default=False)
-    ai_explanation = Column(String, nullable=True)
\ No newline at end of file
+    ai_explanation = Column(String, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)  # last upsert or resolution
+    
+    __table_args__ = (
+        # Natural key: at most one open issue per (issue_type, trade_id)
+        Index(
+            "ux_issues_open_key", "issue_type", "trade_id", unique=True,
+            sqlite_where=resolved == False, postgresql_where=resolved == False
+        ),
+        Index("ix_issues_resolved_id", "resolved", "id"),
+        Index("ix_issues_resolved_severity_id", "resolved", "severity", "id"),
+        Index("ix_issues_trade_id", "trade_id"),
+        # The copilot's issue index reads only what changed since its last refresh
+        Index("ix_issues_updated_at", "updated_at"),
+    )
+
+class ReconciliationWatermark(Base):
+    __tablename__ = "reconciliation_watermarks"
+    
+    scope = Column(String, primary_key=True)
+    last_trade_row_id = Column(Integer, default=0)  # highest trades.id already reconciled
+    last_ledger_row_id = Column(Integer, default=0)  # highest ledger.id already reconciled
+    last_rewrite_row_id = Column(Integer, default=0)  # highest trade_rewrites.id already reconciled
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+class TradeRewrite(Base):
+    """A trade rewritten in place by ingestion; it keeps its row id, so incremental runs find it here"""
+    __tablename__ = "trade_rewrites"
+    
+    id = Column(Integer, primary_key=True)
+    trade_id = Column(String)
+    rewritten_at = Column(DateTime, default=datetime.utcnow)
+
+class AnomalyBaseline(Base):
+    """Per-group statistics of one anomaly rule as of the last full run; incremental runs score new trades against them"""
+    __tablename__ = "anomaly_baselines"
+    
+    issue_type = Column(String, primary_key=True)  # the rule's issue type
+    group_key = Column(String, primary_key=True)  # e.g. an instrument or trader; "" for a global statistic
+    count = Column(Integer, default=0)
+    center = Column(Float, nullable=True)  # mean or median
+    spread = Column(Float, nullable=True)  # median absolute deviation, where the rule has one
+    computed_at = Column(DateTime, default=datetime.utcnow)
+
+class TableVersion(Base):
+    """Change counter of one data table, bumped in every transaction that writes it"""
+    __tablename__ = "table_versions"
+    
+    table_name = Column(String, primary_key=True)  # trades, ledger or issues
+    version = Column(Integer, default=0)
+
+class SummaryCounter(Base):
+    """One maintained aggregate: a row count and an amount for `key` within `metric`"""
+    __tablename__ = "summary_counters"
+    
+    metric = Column(String, primary_key=True)  # e.g. trades_by_status, open_issues
+    key = Column(String, primary_key=True)  # e.g. "pending", "AMOUNT_MISMATCH|CRITICAL"
+    count = Column(Integer, default=0)
+    amount = Column(Float, default=0.0)  # notional or money at stake, where the metric has one
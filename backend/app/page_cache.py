@@ -0,0 +1,67 @@
+"""Versioned list pages: ETags, 304 Not Modified and cached serialized bodies.
+
+A page's ETag hashes its path and query string with the version of the table
+it lists: the table's change counter (`versions.py`, stored in the database and
+bumped in the same transaction by trade creation, ingestion, reconciliation,
+live matching, archiving and stored explanations, in any process) and its
+highest id (rows inserted directly). A request whose If-None-Match carries the
+tag gets 304 without a page query or serialization; otherwise the body is looked up by tag,
+and only on a miss is the page read, validated against the route's response
+model (as FastAPI would, so the served body matches the OpenAPI schema) and
+encoded with orjson.
+"""
+import hashlib
+from typing import Awaitable, Callable, Dict, Type
+
+import orjson
+from fastapi import Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import get_settings
+from .copilot_cache import ResponseCache
+from . import versions
+
+settings = get_settings()
+
+HEADERS = {"Cache-Control": "no-cache"}  # clients may keep the body but must revalidate it
+
+page_cache = ResponseCache(settings.page_cache_size, settings.page_cache_ttl_seconds)
+
+async def etag(request: Request, db, table: str, model) -> str:
+    """Tag for this page of `table` in the table's current version"""
+    stmt = select(versions.version_of(table), select(func.max(model.id)).scalar_subquery())
+    if isinstance(db, AsyncSession):
+        version, highest = (await db.execute(stmt)).one()
+    else:
+        version, highest = await run_in_threadpool(lambda: db.execute(stmt).one())
+    query = sorted(request.query_params.multi_items())
+    key = f"{request.url.path}|{query}|{version}|{highest}"
+    return '"' + hashlib.sha1(key.encode()).hexdigest()[:24] + '"'
+
+def not_modified(request: Request, tag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip() for candidate in header.split(",")]
+    return "*" in candidates or tag in candidates or f"W/{tag}" in candidates
+
+async def cached_page(request: Request, db, table: str, model, page_model: Type[BaseModel],
+                      read: Callable[[], Awaitable[Dict]]) -> Response:
+    """304 when the client holds the current page, else the cached or freshly encoded body.
+
+    Fields a `fields=` projection left out stay out of the body, as with
+    response_model_exclude_unset.
+    """
+    tag = await etag(request, db, table, model)
+    headers = dict(HEADERS, ETag=tag)
+    if not_modified(request, tag):
+        return Response(status_code=304, headers=headers)
+    body = page_cache.get(tag)
+    if body is None:
+        page = page_model.model_validate(await read())
+        body = orjson.dumps(page.model_dump(exclude_unset=True))
+        page_cache.set(tag, body)
+    return Response(body, media_type="application/json", headers=headers)
@@ -1,85 +1,344 @@
+from sqlalchemy import func, or_, select
 from sqlalchemy.orm import Session
-from .models import Trade, LedgerEntry, ReconciliationIssue
+from .models import Trade, LedgerEntry, ReconciliationIssue, ReconciliationWatermark, TradeRewrite
+from .issue_store import close_stale_issues, issue_key, upsert_issues
+from .anomaly import AnomalyEngine, AnomalyRule
+from .fuzzy_matching import FuzzyMatcher
+from .matching import Window, evaluate_match, match_partition, match_query, match_rows
+from .events import event_bus, publish_issue_changes
+from .summary import SummaryDelta
+from . import versions
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
 from datetime import datetime
-from typing import List, Dict
+from typing import Callable, List, Dict, Optional, Sequence, Tuple
+
+MATCH_ISSUE_TYPES = ("MISSING_LEDGER_ENTRY", "AMOUNT_MISMATCH")
+FUZZY_ISSUE_TYPES = ("LEDGER_ID_MISMATCH", "ORPHAN_LEDGER_ENTRY")
+UPDATE_CHUNK_SIZE = 500  # keeps IN (...) lists under SQLite's bound-parameter limit
+
+def to_issue_row(finding: Dict) -> Dict:
+    result = finding["result"]
+    return {
+        "issue_type": result["type"],
+        "description": finding["description"],
+        "severity": result["severity"],
+        "trade_id": result["trade_id"]
+    }
+
+def reopen_trades(db: Session, trade_ids: List[str], delta: SummaryDelta) -> int:
+    """Move reconciled trades among `trade_ids` back to pending and unflag their ledger rows.
+
+    The status moves are added to `delta`; returns the number of trades reopened.
+    """
+    reopened = 0
+    for start in range(0, len(trade_ids), UPDATE_CHUNK_SIZE):
+        chunk = trade_ids[start:start + UPDATE_CHUNK_SIZE]
+        trades = db.query(Trade).filter(
+            Trade.trade_id.in_(chunk), Trade.status != "pending"
+        ).update({Trade.status: "pending"}, synchronize_session=False)
+        ledger = db.query(LedgerEntry).filter(
+            LedgerEntry.trade_id.in_(chunk), LedgerEntry.reconciled == True
+        ).update({LedgerEntry.reconciled: False}, synchronize_session=False)
+        delta.move_trades("reconciled", "pending", trades)
+        delta.move_ledger(False, ledger)
+        reopened += trades
+    return reopened
 
 class ReconciliationEngine:
-    def __init__(self, db: Session):
+    def __init__(self, db: Session, batch_size: int = 10000, incremental: bool = False,
+                 scope: str = "default", anomaly_rules: Optional[Sequence[AnomalyRule]] = None,
+                 progress: Optional[Callable[[Dict], None]] = None, workers: int = 1,
+                 partitions: Optional[int] = None, fuzzy: bool = True):
         self.db = db
-    
-    def check_trade_ledger_match(self) -> List[Dict]:
+        self.batch_size = batch_size
+        self.incremental = incremental
+        self.scope = scope
+        self.anomaly_rules = anomaly_rules
+        # Set-based matching fans out over `workers` processes when > 1; the
+        # trade keyspace is cut into `partitions` row-id ranges (default 4 per worker)
+        self.workers = workers
+        self.partitions = partitions or workers * 4
+        # Second pass pairing trades without ledger rows to ledger rows without a trade; it reads
+        # every unmatched trade and orphan row, so it runs on full reconciles only
+        self.fuzzy = fuzzy and not incremental
+        # Called with {"stage", "rows_processed", "issues_found"} after every batch;
+        # it may raise to abort the run before anything from the current stage is written
+        self.progress = progress
+        self._window: Optional[Window] = None
+        # Status moves made by this run, applied to the summary with its commit
+        self._summary = SummaryDelta()
+
+    def _get_window(self) -> Window:
+        """Row-id window (trade_lo, trade_hi, ledger_lo, ledger_hi, rewrite_lo, rewrite_hi) covered by this run.
+
+        The upper bounds are snapshotted once per engine so every check in a run
+        sees the same rows, and rows written while the run is in progress are
+        picked up by the next one.
+        """
+        if self._window is None:
+            watermark = self.db.get(ReconciliationWatermark, self.scope)
+            trade_lo = watermark.last_trade_row_id if watermark else 0
+            ledger_lo = watermark.last_ledger_row_id if watermark else 0
+            rewrite_lo = (watermark.last_rewrite_row_id or 0) if watermark else 0
+            trade_hi = self.db.query(func.max(Trade.id)).scalar() or 0
+            ledger_hi = self.db.query(func.max(LedgerEntry.id)).scalar() or 0
+            rewrite_hi = self.db.query(func.max(TradeRewrite.id)).scalar() or 0
+            self._window = (trade_lo, trade_hi, ledger_lo, ledger_hi, rewrite_lo, rewrite_hi)
+        return self._window
+
+    def advance_watermark(self) -> Dict:
+        """Persist the upper bounds of this run so the next incremental run starts there"""
+        _, trade_hi, _, ledger_hi, _, rewrite_hi = self._get_window()
+        watermark = self.db.get(ReconciliationWatermark, self.scope)
+        if watermark is None:
+            watermark = ReconciliationWatermark(scope=self.scope)
+            self.db.add(watermark)
+        watermark.last_trade_row_id = trade_hi
+        watermark.last_ledger_row_id = ledger_hi
+        watermark.last_rewrite_row_id = rewrite_hi
+        watermark.updated_at = datetime.utcnow()
+        self.db.flush()
+        # Rewrites every scope has seen are no longer needed; a scope without a
+        # watermark re-checks every pending trade, rewritten ones included
+        seen = self.db.query(func.min(func.coalesce(ReconciliationWatermark.last_rewrite_row_id, 0))).scalar()
+        if seen:
+            self.db.query(TradeRewrite).filter(TradeRewrite.id <= seen).delete(synchronize_session=False)
+        self.db.commit()
+        return {"last_trade_row_id": trade_hi, "last_ledger_row_id": ledger_hi, "last_rewrite_row_id": rewrite_hi}
+
+    def _report(self, stage: str, rows_processed: int, issues_found: int):
+        if self.progress:
+            self.progress({"stage": stage, "rows_processed": rows_processed, "issues_found": issues_found})
+
+    def check_trade_ledger_match(self, set_based: bool = True) -> List[Dict]:
         """Check if trades match ledger entries"""
-        issues = []
+        if (self.incremental or set_based) and self._can_parallelize():
+            findings, matched = self._match_parallel()
+        elif self.incremental or set_based:
+            findings, matched = self._match_set_based()
+        else:
+            findings, matched = self._match_per_trade()
+
+        fuzzy_findings, paired = self._match_fuzzy() if self.fuzzy else ([], [])
+        if self.incremental:
+            # Pairings from the last full run stand until the next one re-examines them
+            paired = self._open_pairings([
+                finding["result"]["trade_id"] for finding in findings
+                if finding["result"]["type"] == "MISSING_LEDGER_ENTRY"
+            ])
+        if paired:
+            # A probable pairing explains the missing ledger entry better than the exact pass did
+            paired_set = set(paired)
+            findings = [
+                finding for finding in findings
+                if not (finding["result"]["type"] == "MISSING_LEDGER_ENTRY"
+                        and finding["result"]["trade_id"] in paired_set)
+            ]
+
+        rows = [to_issue_row(finding) for finding in findings]
+        fuzzy_rows = [to_issue_row(finding) for finding in fuzzy_findings]
+        upserted = upsert_issues(self.db, rows + fuzzy_rows)
+        # Close issues that no longer reproduce; an incremental run only speaks for the trades it saw
+        scope = matched + [row["trade_id"] for row in rows] + paired if self.incremental else None
+        resolved = close_stale_issues(self.db, MATCH_ISSUE_TYPES, {issue_key(row) for row in rows}, scope)
+        if self.fuzzy:
+            # The fuzzy pass always looks at every unmatched trade and orphan row
+            resolved += close_stale_issues(self.db, FUZZY_ISSUE_TYPES, {issue_key(row) for row in fuzzy_rows})
+
+        self._mark_reconciled(matched)
+        if self.incremental:
+            # A late ledger row can break a trade that was already reconciled
+            self._reopen([finding["result"]["trade_id"] for finding in findings])
+
+        self._summary.apply(self.db)
+        versions.bump(self.db, "trades", "ledger", "issues")
+        self.db.commit()
+        publish_issue_changes(upserted, resolved)
+        if matched or (self.incremental and findings):
+            # Statuses moved in bulk; dashboards refetch their trade page once
+            event_bus.publish("trades.changed", {"reconciled": len(matched)})
+        return [finding["result"] for finding in findings + fuzzy_findings]
+
+    def _open_pairings(self, trade_ids: List[str]) -> List[str]:
+        """The trades among `trade_ids` with an open LEDGER_ID_MISMATCH"""
+        paired = []
+        for start in range(0, len(trade_ids), UPDATE_CHUNK_SIZE):
+            paired.extend(self.db.execute(
+                select(ReconciliationIssue.trade_id).where(
+                    ReconciliationIssue.trade_id.in_(trade_ids[start:start + UPDATE_CHUNK_SIZE]),
+                    ReconciliationIssue.issue_type == "LEDGER_ID_MISMATCH",
+                    ReconciliationIssue.resolved == False,
+                )
+            ).scalars())
+        return paired
+
+    def _match_fuzzy(self) -> Tuple[List[Dict], List[str]]:
+        """Pair trades without ledger rows to orphan ledger rows; return (findings, paired trade ids).
+
+        A pairing becomes a LEDGER_ID_MISMATCH naming the ledger id to correct.
+        The trade stays pending, so it matches exactly once the id is fixed.
+        Ledger rows left unpaired become ORPHAN_LEDGER_ENTRY.
+        """
+        pairs, orphans = FuzzyMatcher(self.db).run()
+        findings = []
+        for pair in pairs:
+            findings.append({
+                "description": (f"Trade {pair['trade_id']} has no ledger entry, but {pair['entries']} "
+                                f"entr{'y' if pair['entries'] == 1 else 'ies'} booked under "
+                                f"'{pair['ledger_trade_id']}' match its amount {pair['expected']:.2f} "
+                                f"(id similarity {pair['similarity']:.0%})"),
+                "result": dict(pair, type="LEDGER_ID_MISMATCH", severity="MEDIUM")
+            })
+        for orphan in orphans:
+            amounts = ", ".join(f"{currency} {amount or 0:.2f}"
+                                for currency, amount in zip(orphan["currencies"], orphan["amounts"]))
+            findings.append({
+                "description": (f"Ledger entries for '{orphan['trade_id']}' ({orphan['entries']} rows, "
+                                f"{amounts}) match no trade"),
+                "result": dict(orphan, trade_id=orphan["trade_id"] or "", type="ORPHAN_LEDGER_ENTRY",
+                               severity="HIGH")
+            })
+        self._report("fuzzy matching", len(pairs) + len(orphans), len(findings))
+        return findings, [pair["trade_id"] for pair in pairs]
+
+    def _match_per_trade(self) -> Tuple[List[Dict], List[str]]:
+        """Original matching path: one ledger query per pending trade"""
+        findings, matched = [], []
         trades = self.db.query(Trade).filter(Trade.status == "pending").all()
-        
+
         for trade in trades:
             ledger_entries = self.db.query(LedgerEntry).filter(
                 LedgerEntry.trade_id == trade.trade_id
             ).all()
-            
-            if not ledger_entries:
-                issue = ReconciliationIssue(
-                    issue_type="MISSING_LEDGER_ENTRY",
-                    description=f"Trade {trade.trade_id} has no corresponding ledger entry",
-                    severity="HIGH",
-                    trade_id=trade.trade_id
-                )
-                self.db.add(issue)
-                issues.append({
-                    "type": "MISSING_LEDGER_ENTRY",
-                    "trade_id": trade.trade_id,
-                    "severity": "HIGH"
-                })
+
+            finding = self._evaluate_trade(
+                trade.trade_id, trade.quantity, trade.price,
+                [entry.amount for entry in ledger_entries]
+            )
+            if finding:
+                findings.append(finding)
             else:
-                # Check amount matching
-                expected_amount = trade.quantity * trade.price
-                total_ledger = sum(entry.amount for entry in ledger_entries)
-                
-                if abs(expected_amount - abs(total_ledger)) > 0.01:
-                    issue = ReconciliationIssue(
-                        issue_type="AMOUNT_MISMATCH",
-                        description=f"Trade {trade.trade_id}: Expected {expected_amount}, Got {total_ledger}",
-                        severity="CRITICAL",
-                        trade_id=trade.trade_id
-                    )
-                    self.db.add(issue)
-                    issues.append({
-                        "type": "AMOUNT_MISMATCH",
-                        "trade_id": trade.trade_id,
-                        "expected": expected_amount,
-                        "actual": total_ledger,
-                        "severity": "CRITICAL"
-                    })
-        
-        self.db.commit()
-        return issues
-    
+                matched.append(trade.trade_id)
+
+            processed = len(findings) + len(matched)
+            if processed % self.batch_size == 0:
+                self._report("matching", processed, len(findings))
+
+        self._report("matching", len(findings) + len(matched), len(findings))
+        return findings, matched
+
+    def _can_parallelize(self) -> bool:
+        if self.workers <= 1:
+            return False
+        url = self.db.get_bind().url
+        # Private in-memory SQLite databases can't be opened from another process
+        return not (url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"))
+
+    def _partition_ranges(self) -> List[Tuple[int, int]]:
+        """Split the trade row-id space into contiguous half-open ranges"""
+        lo, hi = self.db.query(func.min(Trade.id), func.max(Trade.id)).one()
+        if lo is None:
+            return []
+        step = max(1, -(-(hi - lo + 1) // self.partitions))
+        return [(start, min(start + step, hi + 1)) for start in range(lo, hi + 1, step)]
+
+    def _match_parallel(self) -> Tuple[List[Dict], List[str]]:
+        """Match row-id partitions in a process pool and merge them in range order.
+
+        Each partition's findings are in trade row-id order and partitions are
+        merged in ascending range order, so the result is identical to a
+        single-process run. Workers only read; all writes stay in this process.
+        They are spawned rather than forked, so none inherits this process's
+        pooled connections, locks or threads (the live matcher, the event loop).
+        """
+        window = self._get_window()
+        database_url = self.db.get_bind().url.render_as_string(hide_password=False)
+        ranges = self._partition_ranges()
+        findings, matched = [], []
+
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            futures = [
+                pool.submit(match_partition, database_url, self.batch_size,
+                            self.incremental, window, id_range)
+                for id_range in ranges
+            ]
+            for future in futures:
+                partition_findings, partition_matched = future.result()
+                findings.extend(partition_findings)
+                matched.extend(partition_matched)
+                self._report("matching", len(findings) + len(matched), len(findings))
+
+        return findings, matched
+
+    def _match_set_based(self, id_range: Optional[Tuple[int, int]] = None) -> Tuple[List[Dict], List[str]]:
+        """Match trades with one streamed trade/ledger join (see `matching.match_query`).
+
+        In incremental mode only dirty trades are joined. `id_range` restricts
+        the join to one half-open [lo, hi) partition of trade row ids.
+        """
+        window = self._get_window() if self.incremental else None
+        rows = match_query(self.db, self.incremental, window, id_range).yield_per(self.batch_size)
+        findings, matched = match_rows(
+            rows, self.batch_size, lambda processed, found: self._report("matching", processed, found)
+        )
+        self._report("matching", len(findings) + len(matched), len(findings))
+        return findings, matched
+
+    def _mark_reconciled(self, trade_ids: List[str]):
+        """Flag matched trades and their ledger rows so later runs skip them"""
+        for start in range(0, len(trade_ids), UPDATE_CHUNK_SIZE):
+            chunk = trade_ids[start:start + UPDATE_CHUNK_SIZE]
+            # Only count real moves (an incremental run re-matches reconciled trades);
+            # "!=" keeps SQLite on the trade_id index rather than (status, id)
+            trades = self.db.query(Trade).filter(
+                Trade.trade_id.in_(chunk), Trade.status != "reconciled"
+            ).update({Trade.status: "reconciled"}, synchronize_session=False)
+            ledger = self.db.query(LedgerEntry).filter(
+                LedgerEntry.trade_id.in_(chunk), LedgerEntry.reconciled.is_not(True)
+            ).update({LedgerEntry.reconciled: True}, synchronize_session=False)
+            self._summary.move_trades("pending", "reconciled", trades)
+            self._summary.move_ledger(True, ledger)
+
+    def _reopen(self, trade_ids: List[str]):
+        """Put trades with fresh findings back into the pending set"""
+        reopen_trades(self.db, trade_ids, self._summary)
+
+    def _evaluate_trade(self, trade_id: str, quantity: float, price: float,
+                        amounts: List[float]) -> Optional[Dict]:
+        """Compare one trade against its ledger amounts"""
+        return evaluate_match(trade_id, quantity * price, sum(amounts), len(amounts))
+
     def detect_anomalies(self) -> List[Dict]:
-        """Detect statistical anomalies"""
-        issues = []
-        trades = self.db.query(Trade).all()
-        
-        if not trades:
-            return issues
-        
-        # Simple anomaly: unusually large trade
-        avg_quantity = sum(t.quantity for t in trades) / len(trades)
-        
-        for trade in trades:
-            if trade.quantity > avg_quantity * 5:  # 5x average
-                issue = ReconciliationIssue(
-                    issue_type="ANOMALOUS_QUANTITY",
-                    description=f"Trade {trade.trade_id} has unusually large quantity: {trade.quantity}",
-                    severity="MEDIUM",
-                    trade_id=trade.trade_id
-                )
-                self.db.add(issue)
-                issues.append({
-                    "type": "ANOMALOUS_QUANTITY",
-                    "trade_id": trade.trade_id,
-                    "quantity": trade.quantity,
-                    "severity": "MEDIUM"
-                })
-        
+        """Detect statistical anomalies with the vectorized rule engine.
+
+        An incremental run reads and reports only trades inserted or rewritten
+        since the watermark, scored against the baselines of the last full run.
+        It closes anomalies only for those trades and leaves earlier ones open:
+        it has no new evidence about them.
+        """
+        anomaly_engine = AnomalyEngine(self.db, self.anomaly_rules)
+        self._report("anomalies", 0, 0)
+
+        if self.incremental:
+            trade_lo, trade_hi, _, _, rewrite_lo, rewrite_hi = self._get_window()
+            if trade_hi <= trade_lo and rewrite_hi <= rewrite_lo:
+                return []
+            rewritten = select(TradeRewrite.trade_id).where(TradeRewrite.id > rewrite_lo, TradeRewrite.id <= rewrite_hi)
+            results, rows = anomaly_engine.run(
+                new=or_((Trade.id > trade_lo) & (Trade.id <= trade_hi), Trade.trade_id.in_(rewritten))
+            )
+            self._report("anomalies", anomaly_engine.rows_evaluated, len(rows))
+            upserted = upsert_issues(self.db, rows)
+            resolved = close_stale_issues(self.db, anomaly_engine.issue_types, {issue_key(row) for row in rows},
+                                          anomaly_engine.trade_ids)
+        else:
+            results, rows = anomaly_engine.run()
+            self._report("anomalies", anomaly_engine.rows_evaluated, len(rows))
+            upserted = upsert_issues(self.db, rows)
+            resolved = close_stale_issues(self.db, anomaly_engine.issue_types, {issue_key(row) for row in rows})
+
+        versions.bump(self.db, "issues")
         self.db.commit()
-        return issues
\ No newline at end of file
+        publish_issue_changes(upserted, resolved)
+        return results
@@ -0,0 +1,297 @@
+"""Local retrieval over open issues, so a copilot question gets the records it is about.
+
+`IssueIndex` keeps an inverted index over each open issue's type, severity,
+description and the trader and instrument of its trade, and ranks issues for a
+question with BM25. Before scoring, entities named in the question are
+resolved: trade ids (separators and case ignored, as in fuzzy matching),
+traders and instruments. When the question names any, only issues on those
+entities are candidates (any of the named values of one kind, all kinds named).
+
+The index lives in the process and is brought up to date before each search:
+when the issue version or the open-issue fingerprint has changed it reads only
+the issues added since its last read or updated (`updated_at`) shortly before
+it, re-tokenizes those that were added or changed and drops the resolved ones.
+The read runs without the lock; the new version is published under it, and
+searches score whichever version is current without locking. Trades are not
+copied into memory: mentioned trade ids are looked up through the unique
+trade_id index.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, or_, select
+from sqlalchemy.orm import Session
+
+from .fuzzy_matching import normalize_id
+from .models import ReconciliationIssue, Trade
+from . import summary, versions
+
+WORD = re.compile(r"[a-z0-9]+")
+ID_CANDIDATE = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]*\d[A-Za-z0-9_-]*")
+STOPWORDS = frozenset(
+    "a about all an and any are as at be by can do does for from has have how i in is it me my of on or "
+    "show the their there this to was were what when which who why with".split()
+)
+SEVERITY_ORDER = {"CRITICAL": 0, "HIGH": 1, "MEDIUM": 2, "LOW": 3}
+MAX_ID_CANDIDATES = 20
+MAX_REFRESH_ATTEMPTS = 3
+COMMIT_LAG = timedelta(minutes=5)  # how far back a refresh re-reads issue writes, for late commits
+K1 = 1.2
+B = 0.75
+
+def stem(token: str) -> str:
+    """Fold plurals so "mismatches" finds "mismatch" and "entries" finds "entry" """
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 4 and token.endswith("es") and token[-3] in "sxh":
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    """Lower-cased word stems; stopwords and anything with a digit (amounts, ids) are dropped"""
+    return [stem(token) for token in WORD.findall(text.lower()) if token.isalpha() and token not in STOPWORDS]
+
+class _Version:
+    """One published state of the index; a refresh copies it, applies its changes and publishes the copy.
+
+    Searches read a version without locking, so a published version is never
+    changed again: a refresh copies the top-level dicts (O(open issues) pointer
+    copies, no tokenizing) and each posting or entity set before changing it.
+    """
+
+    def __init__(self, base: Optional["_Version"] = None):
+        self.fields: Dict[int, Tuple] = dict(base.fields) if base else {}  # issue id -> (type, severity, ...)
+        self.terms: Dict[int, Tuple[str, ...]] = dict(base.terms) if base else {}  # issue id -> its distinct terms
+        self.postings: Dict[str, Set[int]] = dict(base.postings) if base else {}
+        self.by_entity: Dict[Tuple[str, str], Set[int]] = dict(base.by_entity) if base else {}
+        self.total_terms = base.total_terms if base else 0
+        self.last_id = base.last_id if base else 0  # highest issue id read
+        self.since: Optional[datetime] = base.since if base else None  # start of the last read
+        self.fingerprint = base.fingerprint if base else None
+        self._copied: Set[Tuple[str, object]] = set()
+
+    def _own(self, name: str, mapping: Dict, key) -> Set[int]:
+        """The set at mapping[key], copied first if it is still shared with the published version"""
+        if (name, key) not in self._copied or key not in mapping:
+            mapping[key] = set(mapping.get(key, ()))
+            self._copied.add((name, key))
+        return mapping[key]
+
+    def _discard(self, name: str, mapping: Dict, key, issue_id: int):
+        if key in mapping:
+            ids = self._own(name, mapping, key)
+            ids.discard(issue_id)
+            if not ids:
+                del mapping[key]
+
+    def add(self, issue_id: int, fields: Tuple):
+        issue_type, severity, description, trade_id, trader, instrument = fields
+        text = " ".join(value for value in (issue_type, severity, description, trader, instrument) if value)
+        terms = tuple(set(tokenize(text)))
+        self.fields[issue_id] = fields
+        self.terms[issue_id] = terms
+        self.total_terms += len(terms)
+        for term in terms:
+            self._own("postings", self.postings, term).add(issue_id)
+        for kind, value in (("trade_id", normalize_id(trade_id)), ("trader", trader), ("instrument", instrument)):
+            if value:
+                self._own("by_entity", self.by_entity, (kind, value)).add(issue_id)
+
+    def remove(self, issue_id: int):
+        fields = self.fields.pop(issue_id, None)
+        if fields is None:
+            return
+        terms = self.terms.pop(issue_id)
+        self.total_terms -= len(terms)
+        for term in terms:
+            self._discard("postings", self.postings, term, issue_id)
+        _, _, _, trade_id, trader, instrument = fields
+        for key in (("trade_id", normalize_id(trade_id)), ("trader", trader), ("instrument", instrument)):
+            self._discard("by_entity", self.by_entity, key, issue_id)
+
+    def candidates(self, entities: Dict[str, List[str]]) -> Optional[Set[int]]:
+        """Issues on the named entities, or None when the question names none"""
+        selected = None
+        for kind, values in (("trade_id", [normalize_id(value) for value in entities["trade_ids"]]),
+                             ("trader", entities["traders"]), ("instrument", entities["instruments"])):
+            if not values:
+                continue
+            ids = set().union(*(self.by_entity.get((kind, value), set()) for value in values))
+            selected = ids if selected is None else selected & ids
+        return selected
+
+    def scores(self, terms: Iterable[str], candidates: Optional[Set[int]]) -> Dict[int, float]:
+        documents = len(self.fields)
+        average = self.total_terms / documents if documents else 0.0
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(terms):
+            postings = self.postings.get(term)
+            if not postings or len(postings) == documents:
+                continue  # absent, or in every issue: tells nothing apart
+            idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+            for issue_id in (postings if candidates is None else postings & candidates):
+                length = len(self.terms[issue_id])
+                scores[issue_id] += idf * (K1 + 1) / (1 + K1 * (1 - B + B * length / average))
+        return scores
+
+class IssueIndex:
+    """Inverted index over open issues, shared by every copilot request in the process.
+
+    Refreshes read the database without holding the lock and only take it to
+    publish the version they built; searches take no lock at all.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = _Version()
+        self._vocabulary: Tuple = (None, {}, {})  # (fingerprint, traders, instruments)
+
+    @property
+    def traders(self) -> Dict[str, str]:
+        """Lower-cased trader name -> stored name"""
+        return self._vocabulary[1]
+
+    @property
+    def instruments(self) -> Dict[str, str]:
+        return self._vocabulary[2]
+
+    def refresh(self, db: Session) -> "_Version":
+        """Apply issues opened, changed or resolved since the last refresh (by any process); returns the version"""
+        fingerprint_row = db.execute(select(
+            select(func.max(ReconciliationIssue.id)).scalar_subquery(),
+            select(func.count(ReconciliationIssue.id)).where(ReconciliationIssue.resolved == False)
+                .scalar_subquery(),
+            select(func.max(ReconciliationIssue.updated_at)).scalar_subquery(),
+            select(func.max(Trade.id)).scalar_subquery(),
+            versions.version_of("issues"),
+            versions.version_of("trades"),
+        )).one()
+        fingerprint = (fingerprint_row[4], tuple(fingerprint_row[:3]))
+        vocabulary_fingerprint = (fingerprint_row[5], fingerprint_row[3])
+
+        if vocabulary_fingerprint != self._vocabulary[0]:
+            self._vocabulary = (
+                vocabulary_fingerprint,
+                {name.lower(): name for name in _distinct(db, summary.TRADES_BY_TRADER, Trade.trader)},
+                {name.lower(): name for name in _distinct(db, summary.TRADES_BY_INSTRUMENT, Trade.instrument)},
+            )
+
+        for _ in range(MAX_REFRESH_ATTEMPTS):
+            base = self._version
+            if fingerprint == base.fingerprint:
+                return base
+            version = self._read(db, base)
+            version.fingerprint = fingerprint
+            with self._lock:
+                if self._version is base:
+                    self._version = version
+                    return version
+            # Another refresh published first: read again on top of its version
+        return self._version
+
+    def _read(self, db: Session, base: "_Version") -> "_Version":
+        """The next version: `base` plus the issues written since it was read"""
+        started = datetime.utcnow()
+        query = (
+            select(ReconciliationIssue.id, ReconciliationIssue.resolved, ReconciliationIssue.issue_type,
+                   ReconciliationIssue.severity, ReconciliationIssue.description, ReconciliationIssue.trade_id,
+                   Trade.trader, Trade.instrument)
+            .outerjoin(Trade, Trade.trade_id == ReconciliationIssue.trade_id)
+        )
+        if base.since is None:
+            query = query.where(ReconciliationIssue.resolved == False)
+        else:
+            # Issues new since the last read, or written since shortly before it: a transaction
+            # that committed after that read may carry an earlier timestamp
+            query = query.where(or_(ReconciliationIssue.id > base.last_id,
+                                    ReconciliationIssue.updated_at >= base.since - COMMIT_LAG))
+
+        version = _Version(base)
+        for issue_id, resolved, *fields in db.execute(query):
+            fields = tuple(fields)
+            version.last_id = max(version.last_id, issue_id)
+            if resolved:
+                version.remove(issue_id)
+            elif version.fields.get(issue_id) != fields:
+                version.remove(issue_id)
+                version.add(issue_id, fields)
+        version.since = started
+        return version
+
+    def resolve(self, db: Session, query: str, version: Optional["_Version"] = None) -> Dict[str, List[str]]:
+        """Trade ids, traders and instruments named in the question"""
+        version = version or self._version
+        lowered = query.lower()
+
+        def named(vocabulary: Dict[str, str]) -> List[str]:
+            return sorted(
+                stored for name, stored in vocabulary.items()
+                if re.search(rf"(?<![a-z0-9]){re.escape(name)}(?![a-z0-9])", lowered)
+            )
+
+        tokens = [token for token in ID_CANDIDATE.findall(query) if len(token) >= 3][:MAX_ID_CANDIDATES]
+        trade_ids = set()
+        if tokens:
+            # As written or with separators and case folded; issues may also name ids no trade has
+            candidates = set(tokens) | {normalize_id(token) for token in tokens}
+            trade_ids.update(db.execute(select(Trade.trade_id).where(Trade.trade_id.in_(candidates))).scalars())
+            trade_ids.update(
+                normalize_id(token) for token in tokens if ("trade_id", normalize_id(token)) in version.by_entity
+            )
+        return {"trade_ids": sorted(trade_ids), "traders": named(self.traders),
+                "instruments": named(self.instruments)}
+
+    def search(self, db: Session, query: str, k: int = 10) -> Dict:
+        """Resolved entities and the k open issues most relevant to the question.
+
+        Issues are ranked by BM25, then severity, then newest. A question that
+        names entities but no matching terms gets those entities' most severe issues;
+        one that names nothing and matches no term gets no issues.
+        """
+        version = self.refresh(db)
+        entities = self.resolve(db, query, version)
+        candidates = version.candidates(entities)
+        # Named entities already select the candidates; their names would only add the same score to each
+        names = set(tokenize(" ".join(entities["traders"] + entities["instruments"])))
+        scores = version.scores([term for term in tokenize(query) if term not in names], candidates)
+        pool = set(scores) if scores or candidates is None else candidates
+
+        def rank(issue_id: int):
+            return (-scores.get(issue_id, 0.0), SEVERITY_ORDER.get(version.fields[issue_id][1], 4), -issue_id)
+
+        issues = []
+        for issue_id in sorted(pool, key=rank)[:k]:
+            issue_type, severity, description, trade_id, trader, instrument = version.fields[issue_id]
+            issues.append({"id": issue_id, "issue_type": issue_type, "severity": severity,
+                           "description": description, "trade_id": trade_id, "trader": trader,
+                           "instrument": instrument})
+        open_issues = {
+            value: len(version.by_entity.get((kind, value), ()))
+            for kind, values in (("trader", entities["traders"]), ("instrument", entities["instruments"]))
+            for value in values
+        }
+        return {"entities": entities, "issues": issues, "matched": len(pool), "open_issues": open_issues}
+
+    def stats(self) -> Dict:
+        version = self._version
+        return {"issues": len(version.fields), "terms": len(version.postings),
+                "traders": len(self.traders), "instruments": len(self.instruments)}
+
+def _distinct(db: Session, metric: str, column) -> List[str]:
+    """Distinct trader or instrument names, from the maintained summary when it is built"""
+    if summary.is_built(db):
+        keys = db.execute(
+            select(summary.summary_table.c.key)
+            .where(summary.summary_table.c.metric == metric, summary.summary_table.c.count > 0)
+        ).scalars()
+    else:
+        keys = db.execute(select(column).distinct()).scalars()
+    return [key for key in keys if key]
+
+issue_index = IssueIndex()
@@ -0,0 +1,327 @@
+"""Maintained reconciliation summary behind GET /summary and the copilot counts.
+
+`summary_counters` holds one row per (metric, key): trades by status, trade
+count and notional per trader and per instrument, ledger rows by reconciled
+flag, open issues by type and severity, and the money at stake in open
+mismatches. Reading it costs the same however large the tables grow.
+
+Every counter is kept current with deltas written in the same transaction as
+the change. Trade and ledger writers (trade creation, ingestion,
+reconciliation status moves) add theirs directly. Issue metrics go through
+`IssueDelta`, which totals the open issues a write can touch (by trade_id or
+issue id) before and after it: issue upserts and resolutions in
+`issue_store`, rewritten trades and new ledger rows under open mismatches.
+A write costs O(issues it touches), never O(open issues), and reads cost nothing.
+`init_db` rebuilds everything when the table is new or its totals have drifted
+from the tables (e.g. rows loaded by a script that bypasses these paths):
+
+    python -m backend.app.summary --rebuild
+"""
+import argparse
+from collections import defaultdict
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+from sqlalchemy import case, delete, func, insert, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from .models import LedgerEntry, ReconciliationIssue, SummaryCounter, Trade
+
+TRADES_BY_STATUS = "trades_by_status"
+TRADES_BY_TRADER = "trades_by_trader"
+TRADES_BY_INSTRUMENT = "trades_by_instrument"
+LEDGER = "ledger"  # keys: reconciled, unreconciled
+OPEN_ISSUES = "open_issues"  # key: "<issue_type>|<severity>"
+MISMATCHES = "mismatches"  # key: issue type; amount: money at stake
+MISMATCH_TYPES = ("AMOUNT_MISMATCH", "MISSING_LEDGER_ENTRY")
+META = "meta"  # key "built": present once the summary has been built
+
+summary_table = SummaryCounter.__table__
+CHUNK_SIZE = 500  # keeps IN (...) lists under SQLite's bound-parameter limit
+
+class SummaryDelta:
+    """Counter changes collected by a writer and applied before it commits"""
+
+    def __init__(self):
+        self._changes: Dict = defaultdict(lambda: [0, 0.0])
+
+    def add(self, metric: str, key: Optional[str], count: int = 1, amount: float = 0.0):
+        change = self._changes[(metric, _key(key))]
+        change[0] += count
+        change[1] += amount
+
+    def add_trade(self, trade: Mapping, sign: int = 1):
+        """Count a trade in (sign=1) or out of (sign=-1) the trade metrics"""
+        notional = (trade["quantity"] or 0.0) * (trade["price"] or 0.0)
+        self.add(TRADES_BY_STATUS, trade["status"] or "pending", sign)
+        self.add(TRADES_BY_TRADER, trade["trader"], sign, sign * notional)
+        self.add(TRADES_BY_INSTRUMENT, trade["instrument"], sign, sign * notional)
+
+    def move_trades(self, from_status: str, to_status: str, count: int):
+        if count:
+            self.add(TRADES_BY_STATUS, from_status, -count)
+            self.add(TRADES_BY_STATUS, to_status, count)
+
+    def move_ledger(self, reconciled: bool, count: int):
+        """`count` ledger rows changed their reconciled flag to `reconciled`"""
+        if count:
+            self.add(LEDGER, "reconciled", count if reconciled else -count)
+            self.add(LEDGER, "unreconciled", -count if reconciled else count)
+
+    def apply(self, db: Session):
+        """Add the changes to the stored counters; a summary not yet built is left alone"""
+        rows = [
+            {"metric": metric, "key": key, "count": count, "amount": amount}
+            for (metric, key), (count, amount) in self._changes.items() if count or amount
+        ]
+        self._changes.clear()
+        if not rows or not is_built(db):
+            return
+
+        dialect = db.get_bind().dialect.name
+        if dialect in ("sqlite", "postgresql"):
+            stmt = (sqlite.insert if dialect == "sqlite" else postgresql.insert)(summary_table)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[summary_table.c.metric, summary_table.c.key],
+                set_={
+                    "count": summary_table.c.count + stmt.excluded.count,
+                    "amount": summary_table.c.amount + stmt.excluded.amount,
+                },
+            )
+            db.execute(stmt, rows)
+            return
+
+        for row in rows:
+            result = db.execute(
+                update(summary_table)
+                .where(summary_table.c.metric == row["metric"], summary_table.c.key == row["key"])
+                .values(count=summary_table.c.count + row["count"],
+                        amount=summary_table.c.amount + row["amount"])
+            )
+            if not result.rowcount:
+                db.execute(insert(summary_table), [row])
+
+def _key(value) -> str:
+    return "" if value is None else str(value)
+
+def is_built(db: Session) -> bool:
+    return db.execute(
+        select(summary_table.c.count).where(summary_table.c.metric == META, summary_table.c.key == "built")
+    ).first() is not None
+
+def _trade_rows(db: Session) -> List[Dict]:
+    notional = func.sum(Trade.quantity * Trade.price)
+    rows = [
+        {"metric": TRADES_BY_STATUS, "key": _key(status), "count": count, "amount": 0.0}
+        for status, count in db.execute(select(Trade.status, func.count(Trade.id)).group_by(Trade.status))
+    ]
+    for metric, column in ((TRADES_BY_TRADER, Trade.trader), (TRADES_BY_INSTRUMENT, Trade.instrument)):
+        rows.extend(
+            {"metric": metric, "key": _key(key), "count": count, "amount": amount or 0.0}
+            for key, count, amount in db.execute(select(column, func.count(Trade.id), notional).group_by(column))
+        )
+    return rows
+
+def _ledger_rows(db: Session) -> List[Dict]:
+    counts = dict(db.execute(
+        select(LedgerEntry.reconciled, func.count(LedgerEntry.id)).group_by(LedgerEntry.reconciled)
+    ).all())
+    return [
+        {"metric": LEDGER, "key": "reconciled", "count": counts.get(True, 0), "amount": 0.0},
+        {"metric": LEDGER, "key": "unreconciled", "count": counts.get(False, 0) + counts.get(None, 0),
+         "amount": 0.0},
+    ]
+
+def _issue_totals(db: Session, *conditions) -> Dict[Tuple[str, str], List]:
+    """OPEN_ISSUES and MISMATCHES totals of the open issues matching `conditions`, by (metric, key)"""
+    # Money at stake: the ledger shortfall or excess of each mismatched trade, the full notional of a missing one
+    ledger_total = (
+        select(func.sum(LedgerEntry.amount)).where(LedgerEntry.trade_id == Trade.trade_id).scalar_subquery()
+    )
+    expected = Trade.quantity * Trade.price
+    at_stake = case(
+        (ReconciliationIssue.issue_type == "AMOUNT_MISMATCH",
+         func.abs(expected - func.abs(func.coalesce(ledger_total, 0.0)))),
+        else_=expected,
+    )
+    totals: Dict[Tuple[str, str], List] = defaultdict(lambda: [0, 0.0])
+    rows = db.execute(
+        select(ReconciliationIssue.issue_type, ReconciliationIssue.severity, func.count(ReconciliationIssue.id),
+               func.count(Trade.id), func.sum(at_stake))
+        .outerjoin(Trade, (Trade.trade_id == ReconciliationIssue.trade_id)
+                   & ReconciliationIssue.issue_type.in_(MISMATCH_TYPES))
+        .where(ReconciliationIssue.resolved == False, *conditions)
+        .group_by(ReconciliationIssue.issue_type, ReconciliationIssue.severity)
+    )
+    for issue_type, severity, count, mismatched, amount in rows:
+        totals[(OPEN_ISSUES, f"{_key(issue_type)}|{_key(severity)}")][0] += count
+        if mismatched:
+            total = totals[(MISMATCHES, issue_type)]
+            total[0] += mismatched
+            total[1] += amount or 0.0
+    return totals
+
+def _issue_rows(db: Session) -> List[Dict]:
+    return [
+        {"metric": metric, "key": key, "count": count, "amount": amount}
+        for (metric, key), (count, amount) in _issue_totals(db).items()
+    ]
+
+def _in_chunks(column, values: Iterable) -> List:
+    """IN (...) conditions covering `values` in chunks, plus IS NULL when None is among them"""
+    values = list(dict.fromkeys(values))
+    conditions = [column.is_(None)] if None in values else []
+    values = [value for value in values if value is not None]
+    conditions.extend(column.in_(values[start:start + CHUNK_SIZE]) for start in range(0, len(values), CHUNK_SIZE))
+    return conditions
+
+class IssueDelta:
+    """Issue metric changes of one write, measured on the open issues it can touch.
+
+    Create it before the write with either the trade_ids whose issues, trades
+    or ledger rows are written, or the ids of the issues being resolved;
+    `apply` totals those issues again and adds the difference to the counters.
+    """
+
+    def __init__(self, db: Session, trade_ids: Iterable[Optional[str]] = (), issue_ids: Iterable[int] = ()):
+        self.db = db
+        self.conditions = (_in_chunks(ReconciliationIssue.trade_id, trade_ids)
+                           + _in_chunks(ReconciliationIssue.id, issue_ids))
+        self.built = bool(self.conditions) and is_built(db)
+        self.before = self._totals() if self.built else {}
+
+    def _totals(self) -> Dict[Tuple[str, str], List]:
+        totals: Dict[Tuple[str, str], List] = defaultdict(lambda: [0, 0.0])
+        for condition in self.conditions:
+            for key, (count, amount) in _issue_totals(self.db, condition).items():
+                totals[key][0] += count
+                totals[key][1] += amount
+        return totals
+
+    def apply(self):
+        """Add the change since construction to the counters (before the caller commits)"""
+        if not self.built:
+            return
+        delta = SummaryDelta()
+        for (metric, key), (count, amount) in self._totals().items():
+            delta.add(metric, key, count, amount)
+        for (metric, key), (count, amount) in self.before.items():
+            delta.add(metric, key, -count, -amount)
+        delta.apply(self.db)
+
+def rebuild(db: Session):
+    """Recompute every counter from the tables (one pass over each); the caller commits"""
+    rows = _trade_rows(db) + _ledger_rows(db) + _issue_rows(db)
+    rows.append({"metric": META, "key": "built", "count": 1, "amount": 0.0})
+    db.execute(delete(summary_table))
+    db.execute(insert(summary_table), rows)
+
+def _counters(db: Session, metrics: Optional[List[str]] = None) -> Dict[str, Dict[str, List]]:
+    query = select(summary_table.c.metric, summary_table.c.key, summary_table.c.count, summary_table.c.amount)
+    if metrics:
+        query = query.where(summary_table.c.metric.in_(metrics))
+    counters: Dict[str, Dict[str, List]] = defaultdict(dict)
+    for metric, key, count, amount in db.execute(query):
+        counters[metric][key] = [count, amount]
+    return counters
+
+def counts(db: Session) -> Optional[Dict[str, int]]:
+    """The copilot's headline counts, or None when the summary has not been built"""
+    counters = _counters(db, [TRADES_BY_STATUS, LEDGER, OPEN_ISSUES, META])
+    if "built" not in counters[META]:
+        return None
+    by_status = counters[TRADES_BY_STATUS]
+    return {
+        "total_trades": sum(count for count, _ in by_status.values()),
+        "pending_trades": by_status.get("pending", [0, 0.0])[0],
+        "total_ledger": sum(count for count, _ in counters[LEDGER].values()),
+        "open_issues": sum(count for count, _ in counters[OPEN_ISSUES].values()),
+    }
+
+def open_issues_by_type(db: Session) -> List[Dict]:
+    """Open issue counts per (issue_type, severity), largest first"""
+    rows = []
+    for key, (count, _) in _counters(db, [OPEN_ISSUES])[OPEN_ISSUES].items():
+        issue_type, severity = key.rsplit("|", 1)
+        rows.append({"issue_type": issue_type, "severity": severity, "count": count})
+    return sorted(rows, key=lambda row: -row["count"])
+
+def read(db: Session, top: int = 20) -> Optional[Dict]:
+    """The whole summary as a plain dict, or None when it has not been built"""
+    counters = _counters(db)
+    if "built" not in counters[META]:
+        return None
+
+    def ranked(metric: str, name: str) -> List[Dict]:
+        rows = [
+            {name: key, "trades": count, "notional": round(amount, 2)}
+            for key, (count, amount) in counters[metric].items() if count
+        ]
+        return sorted(rows, key=lambda row: -row["notional"])[:top]
+
+    by_status = {key: count for key, (count, _) in counters[TRADES_BY_STATUS].items() if count}
+    ledger = {key: count for key, (count, _) in counters[LEDGER].items()}
+    by_type, by_severity = defaultdict(int), defaultdict(int)
+    for key, (count, _) in counters[OPEN_ISSUES].items():
+        issue_type, severity = key.rsplit("|", 1)
+        by_type[issue_type] += count
+        by_severity[severity] += count
+
+    return {
+        "trades": {
+            "total": sum(by_status.values()),
+            "by_status": by_status,
+            "notional": round(sum(amount for _, amount in counters[TRADES_BY_TRADER].values()), 2),
+        },
+        "ledger": {
+            "total": sum(ledger.values()),
+            "unreconciled": ledger.get("unreconciled", 0),
+        },
+        "issues": {
+            "open": sum(by_type.values()),
+            "by_type": dict(by_type),
+            "by_severity": dict(by_severity),
+        },
+        "mismatches": {
+            issue_type: {"count": count, "amount": round(amount, 2)}
+            for issue_type, (count, amount) in counters[MISMATCHES].items()
+        },
+        "traders": ranked(TRADES_BY_TRADER, "trader"),
+        "instruments": ranked(TRADES_BY_INSTRUMENT, "instrument"),
+    }
+
+def ensure_built(db: Session) -> bool:
+    """Rebuild when the summary is missing or its totals disagree with the tables; returns True if rebuilt"""
+    stored = counts(db)
+    if stored is not None:
+        actual = db.execute(select(
+            select(func.count(Trade.id)).scalar_subquery(),
+            select(func.count(LedgerEntry.id)).scalar_subquery(),
+            select(func.count(ReconciliationIssue.id)).where(ReconciliationIssue.resolved == False)
+                .scalar_subquery(),
+        )).one()
+        if tuple(actual) == (stored["total_trades"], stored["total_ledger"], stored["open_issues"]):
+            return False
+    rebuild(db)
+    db.commit()
+    return True
+
+def main():
+    parser = argparse.ArgumentParser(description="Check or rebuild the maintained summary")
+    parser.add_argument("--rebuild", action="store_true", help="recompute every counter from the tables")
+    args = parser.parse_args()
+
+    from .database import WriteSessionLocal, init_db
+
+    init_db()
+    db = WriteSessionLocal()
+    try:
+        if args.rebuild:
+            rebuild(db)
+            db.commit()
+        print(read(db))
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
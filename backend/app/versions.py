@@ -0,0 +1,34 @@
+"""Change counters for the data tables, kept in the database.
+
+Write paths bump the tables they touch inside their own transaction, so a
+counter moves exactly when the change commits, whichever process made it (an
+API worker, the ingestion or archive CLI, a script). Caches fold the current
+versions into their keys so an entry stops matching as soon as its inputs may
+have changed.
+"""
+from sqlalchemy import insert, select, update
+from sqlalchemy.engine import Engine
+
+from .models import TableVersion
+
+TABLES = ("trades", "ledger", "issues")
+
+def bump(db, *tables: str):
+    """Increment the counters of `tables` in `db`'s open transaction; the caller commits"""
+    db.execute(
+        update(TableVersion)
+        .where(TableVersion.table_name.in_(tables))
+        .values(version=TableVersion.version + 1)
+    )
+
+def version_of(table: str):
+    """Scalar subquery for the current counter of `table`, to fold into a fingerprint query"""
+    return select(TableVersion.version).where(TableVersion.table_name == table).scalar_subquery()
+
+def ensure_counters(engine: Engine):
+    """Create the counter rows missing from a new or older database"""
+    with engine.begin() as conn:
+        existing = set(conn.execute(select(TableVersion.table_name)).scalars())
+        missing = [{"table_name": table, "version": 0} for table in TABLES if table not in existing]
+        if missing:
+            conn.execute(insert(TableVersion), missing)
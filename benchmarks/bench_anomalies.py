@@ -0,0 +1,44 @@
+"""Time the vectorized anomaly engine on synthetic trades.
+
+    python -m benchmarks.bench_anomalies --sizes 100000 1000000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from backend.app.anomaly import AnomalyEngine
+
+from .synthetic import build_database
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'trades':>10} {'load s':>8} {'rules s':>8} {'trades/s':>12} {'frame MB':>9} {'flagged':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            url = f"sqlite:///{os.path.join(tmp, f'bench_{size}.db')}"
+            engine, SessionLocal = build_database(url, size, seed=args.seed)
+            db = SessionLocal()
+            try:
+                anomaly_engine = AnomalyEngine(db)
+                start = time.perf_counter()
+                trades = anomaly_engine.load_trades()
+                loaded = time.perf_counter()
+                flagged = sum(len(rule.evaluate(trades)) for rule in anomaly_engine.rules)
+                done = time.perf_counter()
+            finally:
+                db.close()
+                engine.dispose()
+
+            frame_mb = trades.memory_usage(deep=True).sum() / 1e6
+            print(f"{size:>10} {loaded - start:>8.2f} {done - loaded:>8.2f} "
+                  f"{size / (done - start):>12,.0f} {frame_mb:>9.1f} {flagged:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Load-test the read endpoints with sync and async database sessions.
+
+    python -m benchmarks.bench_api --trades 200000 --concurrency 64 --seconds 15
+
+Starts one uvicorn server per mode (DB_ASYNC=0/1) on the same synthetic
+database and drives it with concurrent keep-alive clients.
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from backend.app.reconciliation import ReconciliationEngine
+
+from .synthetic import build_database
+
+PATHS = [
+    "/trades/?limit=100",
+    "/trades/?limit=100&order=desc&fields=trade_id,trader,status",
+    "/trades/?limit=50&trader=Alice&instrument=AAPL",
+    "/issues/?limit=100",
+    "/issues/?limit=100&severity=CRITICAL&fields=trade_id,description",
+]
+
+
+def start_server(database_url: str, port: int, **settings: str) -> subprocess.Popen:
+    """Run the API in a subprocess; `settings` are extra environment variables"""
+    env = dict(os.environ, DATABASE_URL=database_url, **settings)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "backend.app.main:app", "--port", str(port), "--log-level", "warning"],
+        env=env,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return server
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("server did not start")
+
+
+async def load(base_url: str, concurrency: int, seconds: float):
+    latencies, errors = [], 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(client: httpx.AsyncClient, offset: int):
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            response = await client.get(PATHS[i % len(PATHS)])
+            latencies.append(time.perf_counter() - start)
+            errors += response.status_code != 200
+            i += 1
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[worker(client, i) for i in range(concurrency)])
+        elapsed = time.perf_counter() - started
+    return elapsed, sorted(latencies), errors
+
+
+def percentile(ordered, p: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))] if ordered else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, default=200000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench_api.db')}"
+        engine, SessionLocal = build_database(url, args.trades, seed=args.seed)
+        db = SessionLocal()
+        try:
+            ReconciliationEngine(db).check_trade_ledger_match()
+        finally:
+            db.close()
+        engine.dispose()
+
+        print(f"{'mode':>6} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+        for db_async in (False, True):
+            server = start_server(url, args.port, DB_ASYNC="1" if db_async else "0")
+            try:
+                elapsed, latencies, errors = asyncio.run(
+                    load(f"http://127.0.0.1:{args.port}", args.concurrency, args.seconds)
+                )
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{'async' if db_async else 'sync':>6} {len(latencies):>9} {len(latencies) / elapsed:>9.1f} "
+                  f"{percentile(latencies, 0.50) * 1000:>8.1f} {percentile(latencies, 0.99) * 1000:>8.1f} "
+                  f"{errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""Copilot throughput and latency against the local stub model server.
+
+    python -m benchmarks.bench_copilot --issues 200 --concurrency 1 8 32 --first-token-ms 400
+
+Bulk explanations are timed at each concurrency limit; query answers compare
+full-response latency with time to first streamed chunk.
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from .stub_llm import StubServer
+from .synthetic import build_database
+
+
+def configure(base_url: str, concurrency: int):
+    from backend.app.config import get_settings
+
+    os.environ.update(ANTHROPIC_API_KEY="stub", ANTHROPIC_BASE_URL=base_url,
+                      LLM_CONCURRENCY=str(concurrency))
+    get_settings.cache_clear()
+
+
+def reset_explanations(SessionLocal):
+    from backend.app.ai_copilot import explanation_cache
+    from backend.app.models import ReconciliationIssue
+
+    explanation_cache.clear()
+    db = SessionLocal()
+    try:
+        db.query(ReconciliationIssue).update({ReconciliationIssue.ai_explanation: None})
+        db.commit()
+    finally:
+        db.close()
+
+
+async def explain_all(SessionLocal, issues: int):
+    from backend.app.ai_copilot import AICopilot
+    from backend.app.llm import close_llm_client
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        results = await AICopilot(db).explain_open_issues(issues)
+        return time.perf_counter() - start, results
+    finally:
+        db.close()
+        await close_llm_client()
+
+
+async def query_latency(SessionLocal, queries: int):
+    from backend.app.ai_copilot import AICopilot
+    from backend.app.llm import close_llm_client
+
+    db = SessionLocal()
+    full, first, streamed = [], [], []
+    try:
+        for i in range(queries):
+            copilot = AICopilot(db)
+            start = time.perf_counter()
+            await copilot.answer_query(f"benchmark question {i} (full)")
+            full.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            first_chunk = None
+            async for _ in await copilot.stream_query(f"benchmark question {i} (stream)"):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start
+            first.append(first_chunk)
+            streamed.append(time.perf_counter() - start)
+    finally:
+        db.close()
+        await close_llm_client()
+    return [sum(values) / len(values) for values in (full, first, streamed)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, default=20000)
+    parser.add_argument("--issues", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--queries", type=int, default=5)
+    parser.add_argument("--first-token-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    stub = StubServer(args.port, first_token_ms=args.first_token_ms, token_ms=args.token_ms)
+    with stub as base_url, tempfile.TemporaryDirectory() as tmp:
+        configure(base_url, args.concurrency[0])
+        from backend.app.reconciliation import ReconciliationEngine
+
+        url = f"sqlite:///{os.path.join(tmp, 'bench_copilot.db')}"
+        engine, SessionLocal = build_database(url, args.trades, seed=args.seed)
+        db = SessionLocal()
+        try:
+            ReconciliationEngine(db).check_trade_ledger_match()
+        finally:
+            db.close()
+
+        print(f"{'concurrency':>11} {'issues':>8} {'seconds':>10} {'issues/s':>10} {'max in flight':>14}")
+        for concurrency in args.concurrency:
+            configure(base_url, concurrency)
+            reset_explanations(SessionLocal)
+            stub.app.state.max_in_flight = 0
+            elapsed, results = asyncio.run(explain_all(SessionLocal, args.issues))
+            assert all(result["source"] == "model" for result in results), "stub call failed"
+            print(f"{concurrency:>11} {len(results):>8} {elapsed:>10.3f} {len(results) / elapsed:>10.1f} "
+                  f"{stub.app.state.max_in_flight:>14}")
+
+        full, first, streamed = asyncio.run(query_latency(SessionLocal, args.queries))
+        print(f"\nquery: full response {full:.3f}s, first streamed chunk {first:.3f}s, "
+              f"stream complete {streamed:.3f}s")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
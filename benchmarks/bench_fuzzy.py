@@ -0,0 +1,84 @@
+"""Second-pass fuzzy matching: sorted-amount index vs naive pairwise comparison.
+
+    python -m benchmarks.bench_fuzzy --sizes 10000 100000 1000000 --naive-max 100000
+
+Each database has mistyped ledger ids and orphan ledger rows; the naive pass
+(every unmatched trade against every orphan group) is run up to --naive-max
+trades and must produce the same pairs.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from backend.app.fuzzy_matching import FuzzyMatcher, id_similarity
+
+from .synthetic import build_database
+
+
+def naive_pairs(matcher: FuzzyMatcher):
+    """Same criteria and assignment as FuzzyMatcher.run, comparing every pair"""
+    trades = matcher.load_unmatched_trades()
+    orphans = matcher.load_orphan_groups()
+    scored = []
+    for orphan_index, orphan in enumerate(orphans):
+        target = abs(orphan.amount or 0.0)
+        tolerance = max(matcher.amount_tolerance, target * matcher.relative_tolerance)
+        for trade_index, trade in enumerate(trades):
+            difference = abs(abs(trade.expected or 0.0) - target)
+            if difference > tolerance:
+                continue
+            gap = abs(orphan.first_timestamp - trade.timestamp)
+            if gap > matcher.time_window:
+                continue
+            similarity = id_similarity(trade.trade_id, orphan.trade_id)
+            if similarity >= matcher.min_similarity:
+                scored.append((-similarity, difference, gap, orphan_index, trade_index))
+
+    pairs, paired_orphans, paired_trades = set(), set(), set()
+    for _, _, _, orphan_index, trade_index in sorted(scored):
+        if orphan_index in paired_orphans or trade_index in paired_trades:
+            continue
+        paired_orphans.add(orphan_index)
+        paired_trades.add(trade_index)
+        pairs.add((trades[trade_index].trade_id, orphans[orphan_index].trade_id))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--naive-max", type=int, default=100000)
+    parser.add_argument("--misid-rate", type=float, default=0.01)
+    parser.add_argument("--orphan-rate", type=float, default=0.005)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'trades':>10} {'pairs':>7} {'orphans':>8} {'indexed s':>10} {'naive s':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            url = f"sqlite:///{os.path.join(tmp, f'bench_fuzzy_{size}.db')}"
+            engine, SessionLocal = build_database(url, size, seed=args.seed, misid_rate=args.misid_rate,
+                                                  orphan_rate=args.orphan_rate)
+            db = SessionLocal()
+            try:
+                matcher = FuzzyMatcher(db)
+                start = time.perf_counter()
+                pairs, orphans = matcher.run()
+                indexed = time.perf_counter() - start
+
+                naive = "-"
+                if size <= args.naive_max:
+                    start = time.perf_counter()
+                    expected = naive_pairs(matcher)
+                    naive = f"{time.perf_counter() - start:.3f}"
+                    found = {(pair["trade_id"], pair["ledger_trade_id"]) for pair in pairs}
+                    assert found == expected, "indexed pairs differ from the naive pass"
+            finally:
+                db.close()
+                engine.dispose()
+            print(f"{size:>10} {len(pairs):>7} {len(orphans):>8} {indexed:>10.3f} {naive:>10}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare per-trade and set-based trade/ledger matching.
+
+    python -m benchmarks.bench_matching --sizes 10000 100000 1000000
+
+The per-trade path issues one ledger query per trade, so it is only run up to
+--per-trade-limit trades.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from backend.app.reconciliation import ReconciliationEngine
+
+from .synthetic import build_database, reset_reconciliation
+
+
+def run_once(SessionLocal, set_based: bool):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        results = ReconciliationEngine(db).check_trade_ledger_match(set_based=set_based)
+        elapsed = time.perf_counter() - start
+        return elapsed, results
+    finally:
+        db.close()
+        # Keep each run independent of the issues and statuses written by the previous one
+        reset_reconciliation(SessionLocal)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--per-trade-limit", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'trades':>10} {'mode':>10} {'seconds':>10} {'trades/s':>12} {'issues':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in args.sizes:
+            url = f"sqlite:///{os.path.join(tmp, f'bench_{size}.db')}"
+            engine, SessionLocal = build_database(url, size, seed=args.seed)
+
+            set_elapsed, set_results = run_once(SessionLocal, set_based=True)
+            print(f"{size:>10} {'set':>10} {set_elapsed:>10.3f} {size / set_elapsed:>12,.0f} {len(set_results):>8}")
+
+            if size <= args.per_trade_limit:
+                per_elapsed, per_results = run_once(SessionLocal, set_based=False)
+                assert per_results == set_results, "set-based results differ from per-trade results"
+                print(f"{size:>10} {'per-trade':>10} {per_elapsed:>10.3f} {size / per_elapsed:>12,.0f} {len(per_results):>8}")
+
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Mixed read/write load under each SQLite profile.
+
+    python -m benchmarks.bench_mixed --trades 200000 --readers 32 --writers 4 --seconds 15
+
+Readers page through trades and issues while writers create trades and one
+client runs incremental reconciliations back to back. Lock failures surface
+as 5xx responses and are counted as errors.
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import tempfile
+import time
+
+import httpx
+
+from backend.app.reconciliation import ReconciliationEngine
+
+from .bench_api import PATHS, percentile, start_server
+from .synthetic import build_database
+
+
+async def mixed_load(base_url: str, readers: int, writers: int, seconds: float, profile: str):
+    latencies = {"read": [], "write": [], "reconcile": []}
+    errors = {"read": 0, "write": 0, "reconcile": 0}
+    deadline = time.perf_counter() + seconds
+    ids = itertools.count()
+
+    async def timed(kind: str, request):
+        start = time.perf_counter()
+        try:
+            response = await request
+            failed = response.status_code >= 400
+        except httpx.HTTPError:
+            failed = True
+        latencies[kind].append(time.perf_counter() - start)
+        errors[kind] += failed
+
+    async def reader(client: httpx.AsyncClient, offset: int):
+        for i in itertools.count(offset):
+            if time.perf_counter() >= deadline:
+                return
+            await timed("read", client.get(PATHS[i % len(PATHS)]))
+
+    async def writer(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            trade_id = f"BENCH-{profile}-{next(ids)}"
+            await timed("write", client.post("/trades/", json={
+                "trade_id": trade_id, "trader": "Bench", "instrument": "AAPL",
+                "quantity": 100, "price": 190.0, "side": "BUY"
+            }))
+
+    async def reconciler(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            await timed("reconcile", client.post("/reconcile/?incremental=true"))
+
+    limits = httpx.Limits(max_connections=readers + writers + 1)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*[reader(client, i) for i in range(readers)],
+                             *[writer(client) for _ in range(writers)],
+                             reconciler(client))
+        elapsed = time.perf_counter() - started
+    return elapsed, {kind: sorted(values) for kind, values in latencies.items()}, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, default=200000)
+    parser.add_argument("--readers", type=int, default=32)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=15)
+    parser.add_argument("--profiles", nargs="+", default=["default", "performance"])
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'profile':>12} {'kind':>10} {'requests':>9} {'req/s':>9} {'p50 ms':>8} {'p99 ms':>9} {'errors':>7}")
+    for profile in args.profiles:
+        # A fresh database per profile: WAL mode persists in the file
+        with tempfile.TemporaryDirectory() as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench_mixed.db')}"
+            engine, SessionLocal = build_database(url, args.trades, seed=args.seed)
+            db = SessionLocal()
+            try:
+                ReconciliationEngine(db, incremental=True).check_trade_ledger_match()
+            finally:
+                db.close()
+            engine.dispose()
+
+            server = start_server(url, args.port, SQLITE_PROFILE=profile)
+            try:
+                elapsed, latencies, errors = asyncio.run(mixed_load(
+                    f"http://127.0.0.1:{args.port}", args.readers, args.writers, args.seconds, profile
+                ))
+            finally:
+                server.terminate()
+                server.wait()
+
+            for kind, values in latencies.items():
+                print(f"{profile:>12} {kind:>10} {len(values):>9} {len(values) / elapsed:>9.1f} "
+                      f"{percentile(values, 0.50) * 1000:>8.1f} {percentile(values, 0.99) * 1000:>9.1f} "
+                      f"{errors[kind]:>7}")
+
+
+if __name__ == "__main__":
+    main()
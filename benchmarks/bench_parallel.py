@@ -0,0 +1,54 @@
+"""Scale partitioned trade/ledger matching across worker processes.
+
+    python -m benchmarks.bench_parallel --trades 1000000 --workers 1 2 4 8
+
+Every multi-process run is checked against the single-process findings.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from backend.app.reconciliation import ReconciliationEngine
+
+from .synthetic import build_database, reset_reconciliation
+
+
+def run_once(SessionLocal, workers: int):
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        results = ReconciliationEngine(db, workers=workers).check_trade_ledger_match()
+        return time.perf_counter() - start, results
+    finally:
+        db.close()
+        reset_reconciliation(SessionLocal)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, default=1000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'workers':>8} {'seconds':>10} {'trades/s':>12} {'speedup':>8} {'issues':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench_parallel.db')}"
+        engine, SessionLocal = build_database(url, args.trades, seed=args.seed)
+
+        baseline_elapsed, baseline = run_once(SessionLocal, 1)
+        for workers in args.workers:
+            if workers == 1:
+                elapsed, results = baseline_elapsed, baseline
+            else:
+                elapsed, results = run_once(SessionLocal, workers)
+                assert results == baseline, f"{workers}-worker results differ from single-process results"
+            print(f"{workers:>8} {elapsed:>10.3f} {args.trades / elapsed:>12,.0f} "
+                  f"{baseline_elapsed / elapsed:>8.2f} {len(results):>8}")
+
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
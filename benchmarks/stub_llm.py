@@ -0,0 +1,119 @@
+"""Local stand-in for the Anthropic Messages API with simulated model latency.
+
+    python -m benchmarks.stub_llm --port 8001 --first-token-ms 400 --token-ms 20
+    ANTHROPIC_API_KEY=stub ANTHROPIC_BASE_URL=http://127.0.0.1:8001 python -m uvicorn backend.app.main:app
+
+Answers POST /v1/messages, streaming or not, with canned text. `--error-rate`
+makes a share of requests fail with 529 (overloaded) to exercise retries.
+"""
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+WORDS = ("the trade and its ledger entries disagree so check the booking amount "
+         "currency and settlement instructions before amending the record").split()
+
+
+def create_app(first_token_ms: float = 400, token_ms: float = 20, tokens: int = 60,
+               error_rate: float = 0.0, seed: int = 0) -> FastAPI:
+    app = FastAPI()
+    rng = random.Random(seed)
+    app.state.requests = 0
+    app.state.failures = 0
+    app.state.in_flight = 0
+    app.state.max_in_flight = 0
+
+    def reply(count: int):
+        return [WORDS[i % len(WORDS)] + " " for i in range(count)]
+
+    @app.post("/v1/messages")
+    async def messages(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        if rng.random() < error_rate:
+            app.state.failures += 1
+            return JSONResponse(status_code=529, content={
+                "type": "error", "error": {"type": "overloaded_error", "message": "Overloaded"}
+            })
+
+        count = min(tokens, body.get("max_tokens", tokens))
+        usage = {"input_tokens": len(json.dumps(body)) // 4, "output_tokens": count}
+        message = {"id": f"msg_stub_{app.state.requests}", "type": "message", "role": "assistant",
+                   "model": body["model"], "stop_reason": "end_turn", "stop_sequence": None}
+
+        app.state.in_flight += 1
+        app.state.max_in_flight = max(app.state.max_in_flight, app.state.in_flight)
+        if not body.get("stream"):
+            try:
+                await asyncio.sleep((first_token_ms + token_ms * count) / 1000)
+            finally:
+                app.state.in_flight -= 1
+            text = "".join(reply(count)).strip()
+            return dict(message, content=[{"type": "text", "text": text}], usage=usage)
+
+        def event(name, data):
+            return f"event: {name}\ndata: {json.dumps(dict(data, type=name))}\n\n"
+
+        async def events():
+            try:
+                yield event("message_start", {"message": dict(message, content=[], stop_reason=None,
+                                                              usage=dict(usage, output_tokens=0))})
+                yield event("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+                await asyncio.sleep(first_token_ms / 1000)
+                for word in reply(count):
+                    yield event("content_block_delta", {"index": 0, "delta": {"type": "text_delta", "text": word}})
+                    await asyncio.sleep(token_ms / 1000)
+                yield event("content_block_stop", {"index": 0})
+                yield event("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                                              "usage": {"output_tokens": count}})
+                yield event("message_stop", {})
+            finally:
+                app.state.in_flight -= 1
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+class StubServer:
+    """Run the stub in a background thread: `with StubServer(port=8001) as url: ...`"""
+
+    def __init__(self, port: int = 8001, **options):
+        self.app = create_app(**options)
+        self.url = f"http://127.0.0.1:{port}"
+        self._server = uvicorn.Server(uvicorn.Config(self.app, port=port, log_level="warning"))
+        self._thread = threading.Thread(target=self._server.run, daemon=True)
+
+    def __enter__(self) -> str:
+        self._thread.start()
+        while not self._server.started:
+            time.sleep(0.01)
+        return self.url
+
+    def __exit__(self, *exc):
+        self._server.should_exit = True
+        self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--first-token-ms", type=float, default=400)
+    parser.add_argument("--token-ms", type=float, default=20)
+    parser.add_argument("--tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    app = create_app(args.first_token_ms, args.token_ms, args.tokens, args.error_rate)
+    uvicorn.run(app, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
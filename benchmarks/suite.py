@@ -0,0 +1,336 @@
+"""Run the benchmark cases and write machine-readable results.
+
+    python -m benchmarks.suite --trades 100000 --output bench-results.json
+    python -m benchmarks.suite --trades 100000 --compare bench-results.json
+
+Every case runs in a fresh subprocess on its own copy of one seeded database,
+so cases never see each other's writes and peak RSS belongs to that case
+alone. Each result records the best time over `--repeat` runs, rows/s, peak
+RSS and the number of SQL statements executed; the file is tagged with the
+git commit so runs from two commits can be compared with `--compare`.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Sequence
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+CASES: Dict[str, Dict] = {}
+SINGLE_TRADE_ROWS = 2000  # POST /trades/ is timed on a prefix: one transaction per trade
+
+
+def case(name: str, template: str, imports: Sequence[str] = ()):
+    """Register a benchmark: `fn(db, workdir)` does the timed work and returns rows processed.
+
+    `template` names the starting database; `imports` are loaded before the
+    clock starts so module import and app startup are not timed.
+    """
+    def register(fn: Callable):
+        CASES[name] = {"fn": fn, "template": template, "imports": imports}
+        return fn
+    return register
+
+
+@case("match", template="raw", imports=["backend.app.reconciliation"])
+def bench_match(db, workdir: str) -> int:
+    from backend.app.models import Trade
+    from backend.app.reconciliation import ReconciliationEngine
+
+    ReconciliationEngine(db).check_trade_ledger_match()
+    return db.query(Trade).count()
+
+
+@case("anomalies", template="raw", imports=["backend.app.reconciliation"])
+def bench_anomalies(db, workdir: str) -> int:
+    from backend.app.models import Trade
+    from backend.app.reconciliation import ReconciliationEngine
+
+    ReconciliationEngine(db).detect_anomalies()
+    return db.query(Trade).count()
+
+
+@case("ingest_trades", template="empty", imports=["backend.app.ingestion"])
+def bench_ingest_trades(db, workdir: str) -> int:
+    from backend.app.ingestion import ingest
+
+    return ingest(db, "trades", os.path.join(workdir, "trades.csv"))["rows_read"]
+
+
+@case("ingest_ledger", template="empty", imports=["backend.app.ingestion"])
+def bench_ingest_ledger(db, workdir: str) -> int:
+    from backend.app.ingestion import ingest
+
+    return ingest(db, "ledger", os.path.join(workdir, "ledger.csv"))["rows_read"]
+
+
+def page_through(path: str, limit: int = 1000) -> int:
+    """Fetch every page of a list endpoint in-process; returns rows fetched"""
+    from fastapi.testclient import TestClient
+    from backend.app.main import app
+
+    rows, cursor = 0, None
+    with TestClient(app) as client:
+        while True:
+            params = {"limit": limit, "after": cursor} if cursor else {"limit": limit}
+            response = client.get(path, params=params)
+            response.raise_for_status()
+            page = response.json()
+            rows += len(page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return rows
+
+
+def submitted_trades(workdir: str, limit: Optional[int] = None) -> List[Dict]:
+    import pandas as pd
+
+    frame = pd.read_csv(os.path.join(workdir, "trades.csv"), nrows=limit)
+    return frame.drop(columns="timestamp").to_dict("records")
+
+
+@case("create_trades_single", template="empty", imports=["backend.app.main"])
+def bench_create_trades_single(db, workdir: str) -> int:
+    from fastapi.testclient import TestClient
+    from backend.app.main import app
+
+    trades = submitted_trades(workdir, SINGLE_TRADE_ROWS)
+    with TestClient(app) as client:
+        for trade in trades:
+            client.post("/trades/", json=trade).raise_for_status()
+    return len(trades)
+
+
+@case("create_trades_batch", template="empty", imports=["backend.app.main"])
+def bench_create_trades_batch(db, workdir: str) -> int:
+    from fastapi.testclient import TestClient
+    from backend.app.main import app
+
+    trades = submitted_trades(workdir)
+    body = "\n".join(json.dumps(trade) for trade in trades)
+    with TestClient(app) as client:
+        response = client.post("/trades/batch", content=body, headers={"Content-Type": "application/x-ndjson"})
+        response.raise_for_status()
+    return response.json()["rows_inserted"]
+
+
+@case("list_trades", template="reconciled", imports=["backend.app.main"])
+def bench_list_trades(db, workdir: str) -> int:
+    return page_through("/trades/")
+
+
+@case("list_issues", template="reconciled", imports=["backend.app.main"])
+def bench_list_issues(db, workdir: str) -> int:
+    return page_through("/issues/")
+
+
+def peak_rss_mb() -> float:
+    """High-water RSS of this process image.
+
+    ru_maxrss survives exec on Linux, so a child would report its parent's
+    peak; VmHWM is reset by exec and is used where available.
+    """
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+def run_case(name: str, workdir: str) -> Dict:
+    """Child side: time one case against DATABASE_URL and report its counters"""
+    from backend.app.database import SessionLocal
+
+    queries = 0
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        nonlocal queries
+        queries += 1
+
+    for module in CASES[name]["imports"]:
+        importlib.import_module(module)
+    baseline_rss = peak_rss_mb()
+    event.listen(Engine, "before_cursor_execute", count)
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        rows = CASES[name]["fn"](db, workdir)
+        seconds = time.perf_counter() - start
+    finally:
+        db.close()
+    peak_rss = peak_rss_mb()
+    return {
+        "rows": rows,
+        "seconds": seconds,
+        "peak_rss_mb": peak_rss,
+        "case_rss_mb": peak_rss - baseline_rss,
+        "queries": queries,
+    }
+
+
+def prepare(workdir: str, trades: int, seed: int, rates: Dict) -> Dict[str, str]:
+    """Build the template databases and ingestion files once per suite run"""
+    import pandas as pd
+    from backend.app.reconciliation import ReconciliationEngine
+
+    from .synthetic import build_database, generate
+
+    templates = {name: os.path.join(workdir, f"{name}.db") for name in ("empty", "raw", "reconciled")}
+    engine, _ = build_database(f"sqlite:///{templates['empty']}", 0)
+    engine.dispose()
+    engine, _ = build_database(f"sqlite:///{templates['raw']}", trades, seed=seed, **rates)
+    engine.dispose()
+
+    shutil.copy(templates["raw"], templates["reconciled"])
+    engine = create_engine(f"sqlite:///{templates['reconciled']}")
+    db = sessionmaker(bind=engine)()
+    try:
+        reconciler = ReconciliationEngine(db)
+        reconciler.check_trade_ledger_match()
+        reconciler.detect_anomalies()
+        reconciler.advance_watermark()
+    finally:
+        db.close()
+        engine.dispose()
+
+    trade_rows, ledger_rows = [], []
+    for trade, entries in generate(trades, seed=seed, **rates):
+        trade_rows.append(trade)
+        ledger_rows.extend(entries)
+    pd.DataFrame(trade_rows).drop(columns="status").to_csv(os.path.join(workdir, "trades.csv"), index=False)
+    pd.DataFrame(ledger_rows).drop(columns="reconciled").to_csv(os.path.join(workdir, "ledger.csv"), index=False)
+    return templates
+
+
+def spawn(name: str, template: str, workdir: str, run: int) -> Dict:
+    database = os.path.join(workdir, f"{name}-{run}.db")
+    shutil.copy(template, database)
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}")
+    env.pop("ANTHROPIC_API_KEY", None)
+    try:
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.suite", "--run-case", name, "--workdir", workdir],
+            env=env, check=True, capture_output=True, text=True,
+        ).stdout
+    finally:
+        os.remove(database)
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], check=True,
+                                capture_output=True, text=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], check=True,
+                               capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def run_suite(names: List[str], trades: int, seed: int, repeat: int, rates: Dict) -> Dict:
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        templates = prepare(workdir, trades, seed, rates)
+        for name in names:
+            runs = [spawn(name, templates[CASES[name]["template"]], workdir, run) for run in range(repeat)]
+            best = min(runs, key=lambda run: run["seconds"])
+            results.append({
+                "case": name,
+                "rows": best["rows"],
+                "seconds": round(best["seconds"], 4),
+                "rows_per_second": round(best["rows"] / best["seconds"], 1) if best["seconds"] else None,
+                "peak_rss_mb": round(max(run["peak_rss_mb"] for run in runs), 1),
+                "case_rss_mb": round(max(run["case_rss_mb"] for run in runs), 1),
+                "queries": best["queries"],
+                "runs": [round(run["seconds"], 4) for run in runs],
+            })
+            print_row(results[-1], file=sys.stderr)
+    return {
+        "commit": git_commit(),
+        "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "repeat": repeat,
+        "params": dict(trades=trades, seed=seed, **rates),
+        "results": results,
+    }
+
+
+def print_row(result: Dict, file=sys.stdout):
+    print(f"{result['case']:>18} {result['rows']:>10} {result['seconds']:>9.3f} "
+          f"{result['rows_per_second'] or 0:>12,.0f} {result['peak_rss_mb']:>8.1f} "
+          f"{result['case_rss_mb']:>8.1f} {result['queries']:>8}", file=file)
+
+
+def compare(baseline: Dict, current: Dict):
+    """Print per-case changes against a baseline; positive time change means slower"""
+    print(f"baseline {baseline.get('commit')} -> current {current.get('commit')}")
+    if baseline.get("params") != current.get("params"):
+        print(f"warning: parameters differ: {baseline.get('params')} vs {current.get('params')}")
+    before = {result["case"]: result for result in baseline["results"]}
+    print(f"{'case':>18} {'seconds':>17} {'change':>8} {'case MB':>15} {'queries':>15}")
+    for result in current["results"]:
+        old = before.get(result["case"])
+        if old is None:
+            print(f"{result['case']:>18} {'(new)':>17}")
+            continue
+        change = (result["seconds"] - old["seconds"]) / old["seconds"] * 100 if old["seconds"] else 0.0
+        print(f"{result['case']:>18} {old['seconds']:>8.3f}->{result['seconds']:<8.3f} {change:>+7.1f}% "
+              f"{old['case_rss_mb']:>7.1f}->{result['case_rss_mb']:<7.1f} "
+              f"{old['queries']:>7}->{result['queries']:<7}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--trades", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+    parser.add_argument("--missing-rate", type=float, default=0.02)
+    parser.add_argument("--mismatch-rate", type=float, default=0.01)
+    parser.add_argument("--misid-rate", type=float, default=0.002)
+    parser.add_argument("--orphan-rate", type=float, default=0.002)
+    parser.add_argument("--output", help="write results as JSON to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="baseline results file to compare against")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case, args.workdir)))
+        return
+
+    rates = {"missing_rate": args.missing_rate, "mismatch_rate": args.mismatch_rate,
+             "misid_rate": args.misid_rate, "orphan_rate": args.orphan_rate}
+    print(f"{'case':>18} {'rows':>10} {'seconds':>9} {'rows/s':>12} {'peak MB':>8} {'case MB':>8} {'queries':>8}",
+          file=sys.stderr)
+    report = run_suite(args.cases, args.trades, args.seed, args.repeat, rates)
+
+    if args.output == "-":
+        print(json.dumps(report, indent=2))
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
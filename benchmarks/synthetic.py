@@ -0,0 +1,115 @@
+import random
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple
+
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from backend.app.database import Base
+from backend.app.models import Trade, LedgerEntry, ReconciliationIssue, ReconciliationWatermark
+
+TRADERS = ["Alice", "Bob", "Charlie", "Dana", "Evan", "Fiona", "George", "Hana"]
+INSTRUMENTS = ["AAPL", "GOOGL", "TSLA", "MSFT", "AMZN", "NVDA", "META", "JPM"]
+
+
+def misspell(trade_id: str, rng: random.Random) -> str:
+    """A plausible keying error: a separator, lower case, or two adjacent digits swapped"""
+    style = rng.randrange(3)
+    if style == 0:
+        return f"{trade_id[0]}-{trade_id[1:]}"
+    if style == 1:
+        return trade_id.lower()
+    i = rng.randrange(1, len(trade_id) - 1)
+    return trade_id[:i] + trade_id[i + 1] + trade_id[i] + trade_id[i + 2:]
+
+
+def generate(n_trades: int, seed: int = 42, missing_rate: float = 0.02,
+             mismatch_rate: float = 0.01, misid_rate: float = 0.0, orphan_rate: float = 0.0,
+             start: datetime = datetime(2026, 1, 14, 9, 30)) -> Iterator[Tuple[Dict, List[Dict]]]:
+    """Yield (trade, ledger_entries) pairs with seeded ledger defects.
+
+    `misid_rate` books a trade's ledger row under a misspelled trade id;
+    `orphan_rate` adds a ledger row for a trade that does not exist.
+    """
+    rng = random.Random(seed)
+    reference_prices = {instrument: rng.uniform(10, 1000) for instrument in INSTRUMENTS}
+    for i in range(n_trades):
+        instrument = rng.choice(INSTRUMENTS)
+        quantity = float(rng.randint(1, 500))
+        price = round(reference_prices[instrument] * (1 + rng.gauss(0, 0.005)), 2)
+        side = rng.choice(("BUY", "SELL"))
+        timestamp = start + timedelta(seconds=i)
+        trade = {
+            "trade_id": f"T{i:09d}",
+            "trader": rng.choice(TRADERS),
+            "instrument": instrument,
+            "quantity": quantity,
+            "price": price,
+            "side": side,
+            "timestamp": timestamp,
+            "status": "pending",
+        }
+
+        roll = rng.random()
+        entries = []
+        if roll >= missing_rate:
+            amount = quantity * price
+            if roll < missing_rate + mismatch_rate:
+                amount *= rng.uniform(0.5, 1.5)
+            entries.append({
+                "trade_id": trade["trade_id"],
+                "amount": amount if side == "BUY" else -amount,
+                "currency": "USD",
+                "entry_type": "DEBIT" if side == "BUY" else "CREDIT",
+                "timestamp": timestamp + timedelta(minutes=1),
+                "reconciled": False,
+            })
+            if misid_rate and rng.random() < misid_rate:
+                entries[0]["trade_id"] = misspell(trade["trade_id"], rng)
+        if orphan_rate and rng.random() < orphan_rate:
+            amount = round(rng.uniform(100, 100000), 2)
+            entries.append({
+                "trade_id": f"X{i:09d}",
+                "amount": amount,
+                "currency": "USD",
+                "entry_type": "DEBIT",
+                "timestamp": timestamp,
+                "reconciled": False,
+            })
+        yield trade, entries
+
+
+def build_database(url: str, n_trades: int, seed: int = 42, chunk_size: int = 50000, **rates):
+    """Create a fresh database at `url` populated with synthetic trades and ledger rows"""
+    engine = create_engine(url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+    trades, ledger = [], []
+    with engine.begin() as conn:
+        for trade, entries in generate(n_trades, seed=seed, **rates):
+            trades.append(trade)
+            ledger.extend(entries)
+            if len(trades) >= chunk_size:
+                conn.execute(insert(Trade), trades)
+                conn.execute(insert(LedgerEntry), ledger)
+                trades, ledger = [], []
+        if trades:
+            conn.execute(insert(Trade), trades)
+        if ledger:
+            conn.execute(insert(LedgerEntry), ledger)
+
+    return engine, sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def reset_reconciliation(SessionLocal):
+    """Undo the writes of a reconciliation run so the next run starts from the same state"""
+    db = SessionLocal()
+    try:
+        db.query(ReconciliationIssue).delete()
+        db.query(ReconciliationWatermark).delete()
+        db.query(Trade).update({Trade.status: "pending"})
+        db.query(LedgerEntry).update({LedgerEntry.reconciled: False})
+        db.commit()
+    finally:
+        db.close()
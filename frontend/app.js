@@ -1,9 +1,10 @@
 const API_BASE = 'http://127.0.0.1:8000';
 
-// Load data on page load
+// Load data on page load, then keep it current from server-sent events
 document.addEventListener('DOMContentLoaded', () => {
     loadData();
     setupEventListeners();
+    connectEvents();
 });
 
 function setupEventListeners() {
@@ -12,34 +13,49 @@ function setupEventListeners() {
     document.getElementById('ask-copilot-btn').addEventListener('click', askCopilot);
 }
 
+// Dashboard shows the most recent page of each list
+const PAGE_SIZE = 100;
+const TRADE_FIELDS = 'trade_id,trader,instrument,quantity,price,side,status';
+const ISSUE_FIELDS = 'issue_type,description,severity,trade_id';
+
+// Loaded pages; events patch these in place instead of refetching
+const state = { trades: [], moreTrades: false, issues: [], moreIssues: false, summary: null };
+
 async function loadData() {
-    await loadTrades();
-    await loadIssues();
-    updateStats();
+    await Promise.all([loadTrades(), loadIssues(), loadSummary()]);
+}
+
+// Exact totals from the server's maintained counters
+async function loadSummary() {
+    try {
+        const response = await fetch(`${API_BASE}/summary?top=0`);
+        state.summary = response.ok ? await response.json() : null;
+        updateStats();
+    } catch (error) {
+        console.error('Error loading summary:', error);
+    }
+}
+
+// ETag of the last page each list URL returned
+const etags = new Map();
+
+// The page at `url`, or null when the server answers 304: nothing changed since the page we hold
+async function fetchIfChanged(url) {
+    const headers = etags.has(url) ? { 'If-None-Match': etags.get(url) } : {};
+    const response = await fetch(url, { headers, cache: 'no-store' });
+    if (response.status === 304) return null;
+    const etag = response.headers.get('ETag');
+    if (etag) etags.set(url, etag); else etags.delete(url);
+    return response.json();
 }
 
 async function loadTrades() {
     try {
-        const response = await fetch(`${API_BASE}/trades/`);
-        const trades = await response.json();
-        
-        const tbody = document.getElementById('trades-body');
-        tbody.innerHTML = '';
-        
-        trades.forEach(trade => {
-            const row = `
-                <tr>
-                    <td>${trade.trade_id}</td>
-                    <td>${trade.trader}</td>
-                    <td>${trade.instrument}</td>
-                    <td>${trade.quantity}</td>
-                    <td>$${trade.price.toFixed(2)}</td>
-                    <td><span class="badge badge-${trade.side.toLowerCase()}">${trade.side}</span></td>
-                    <td><span class="badge badge-${trade.status.toLowerCase()}">${trade.status}</span></td>
-                </tr>
-            `;
-            tbody.innerHTML += row;
-        });
+        const page = await fetchIfChanged(`${API_BASE}/trades/?order=desc&limit=${PAGE_SIZE}&fields=${TRADE_FIELDS}`);
+        if (!page) return;
+        state.trades = page.items;
+        state.moreTrades = page.next_cursor !== null;
+        renderTrades();
     } catch (error) {
         console.error('Error loading trades:', error);
     }
@@ -47,54 +63,177 @@ async function loadTrades() {
 
 async function loadIssues() {
     try {
-        const response = await fetch(`${API_BASE}/issues/`);
-        const issues = await response.json();
-        
-        const tbody = document.getElementById('issues-body');
-        tbody.innerHTML = '';
-        
-        if (issues.length === 0) {
-            tbody.innerHTML = '<tr><td colspan="6" style="text-align:center;">No issues detected ✅</td></tr>';
-            return;
-        }
-        
-        issues.forEach(issue => {
-            const row = `
-                <tr>
-                    <td>${issue.id}</td>
-                    <td>${issue.issue_type}</td>
-                    <td>${issue.description}</td>
-                    <td><span class="badge badge-${issue.severity.toLowerCase()}">${issue.severity}</span></td>
-                    <td>${issue.trade_id || 'N/A'}</td>
-                    <td>
-                        <button class="btn btn-primary explain-btn" onclick="explainIssue(${issue.id})">
-                            Explain
-                        </button>
-                    </td>
-                </tr>
-            `;
-            tbody.innerHTML += row;
-        });
+        const page = await fetchIfChanged(`${API_BASE}/issues/?order=desc&limit=${PAGE_SIZE}&fields=${ISSUE_FIELDS}`);
+        if (!page) return;
+        state.issues = page.items;
+        state.moreIssues = page.next_cursor !== null;
+        renderIssues();
     } catch (error) {
         console.error('Error loading issues:', error);
     }
 }
 
-async function updateStats() {
-    try {
-        const tradesResponse = await fetch(`${API_BASE}/trades/`);
-        const trades = await tradesResponse.json();
-        
-        const issuesResponse = await fetch(`${API_BASE}/issues/`);
-        const issues = await issuesResponse.json();
-        
-        document.getElementById('total-trades').textContent = trades.length;
-        document.getElementById('pending-trades').textContent = 
-            trades.filter(t => t.status === 'pending').length;
-        document.getElementById('total-issues').textContent = issues.length;
-    } catch (error) {
-        console.error('Error updating stats:', error);
+function renderTrades() {
+    const tbody = document.getElementById('trades-body');
+    tbody.innerHTML = state.trades.map(trade => `
+            <tr>
+                <td>${trade.trade_id}</td>
+                <td>${trade.trader}</td>
+                <td>${trade.instrument}</td>
+                <td>${trade.quantity}</td>
+                <td>$${trade.price.toFixed(2)}</td>
+                <td><span class="badge badge-${trade.side.toLowerCase()}">${trade.side}</span></td>
+                <td><span class="badge badge-${trade.status.toLowerCase()}">${trade.status}</span></td>
+            </tr>
+        `).join('');
+    updateStats();
+}
+
+function renderIssues() {
+    const tbody = document.getElementById('issues-body');
+    updateStats();
+    
+    if (state.issues.length === 0) {
+        tbody.innerHTML = '<tr><td colspan="6" style="text-align:center;">No issues detected ✅</td></tr>';
+        return;
+    }
+    
+    tbody.innerHTML = state.issues.map(issue => `
+            <tr>
+                <td>${issue.id}</td>
+                <td>${issue.issue_type}</td>
+                <td>${issue.description}</td>
+                <td><span class="badge badge-${issue.severity.toLowerCase()}">${issue.severity}</span></td>
+                <td>${issue.trade_id || 'N/A'}</td>
+                <td>
+                    <button class="btn btn-primary explain-btn" onclick="explainIssue(${issue.id})">
+                        Explain
+                    </button>
+                </td>
+            </tr>
+        `).join('');
+}
+
+// Without a summary, counts come from the loaded pages; a trailing "+" means more pages exist
+function pageCount(items, more, predicate = () => true) {
+    const count = items.filter(predicate).length;
+    return more ? `${count}+` : `${count}`;
+}
+
+function updateStats() {
+    const summary = state.summary;
+    if (summary) {
+        document.getElementById('total-trades').textContent = summary.trades.total.toLocaleString();
+        document.getElementById('pending-trades').textContent =
+            (summary.trades.by_status.pending || 0).toLocaleString();
+        document.getElementById('total-issues').textContent = summary.issues.open.toLocaleString();
+        return;
+    }
+    document.getElementById('total-trades').textContent = pageCount(state.trades, state.moreTrades);
+    document.getElementById('pending-trades').textContent =
+        pageCount(state.trades, state.moreTrades, t => t.status === 'pending');
+    document.getElementById('total-issues').textContent = pageCount(state.issues, state.moreIssues);
+}
+
+// Put a created or changed row at its place in a newest-first page
+function mergeNewest(items, row) {
+    const merged = items.filter(item => item.id !== row.id);
+    merged.push(row);
+    merged.sort((a, b) => b.id - a.id);
+    return merged.slice(0, PAGE_SIZE);
+}
+
+const REFETCH_DELAY_MS = 500;  // coalesces bursts of bulk-change events
+const refetchTimers = {};
+
+function scheduleRefetch(name, load) {
+    clearTimeout(refetchTimers[name]);
+    refetchTimers[name] = setTimeout(load, REFETCH_DELAY_MS);
+}
+
+let events = null;
+const jobWaiters = new Map();
+
+function connectEvents() {
+    // EventSource reconnects on its own and resumes after the last event id it saw
+    events = new EventSource(`${API_BASE}/events`);
+    const on = (type, handler) => events.addEventListener(type, event => handler(JSON.parse(event.data)));
+    
+    on('trade.created', trade => {
+        state.trades = mergeNewest(state.trades, trade);
+        renderTrades();
+        scheduleRefetch('summary', loadSummary);
+    });
+    on('issue.upserted', issue => {
+        state.issues = mergeNewest(state.issues, issue);
+        renderIssues();
+        scheduleRefetch('summary', loadSummary);
+    });
+    on('issue.resolved', ({ ids }) => {
+        const resolved = new Set(ids);
+        state.issues = state.issues.filter(issue => !resolved.has(issue.id));
+        renderIssues();
+        scheduleRefetch('summary', loadSummary);
+    });
+    on('trades.changed', () => {
+        scheduleRefetch('trades', loadTrades);
+        scheduleRefetch('summary', loadSummary);
+    });
+    on('issues.changed', () => {
+        scheduleRefetch('issues', loadIssues);
+        scheduleRefetch('summary', loadSummary);
+    });
+    on('ledger.changed', () => scheduleRefetch('summary', loadSummary));
+    on('resync', loadData);
+    on('reconcile.progress', progress => {
+        if (jobWaiters.has(progress.job_id)) {
+            showJobProgress(progress);
+        }
+    });
+    on('reconcile.job', job => {
+        const resolve = jobWaiters.get(job.job_id);
+        if (resolve && ['succeeded', 'partial', 'failed', 'cancelled'].includes(job.status)) {
+            jobWaiters.delete(job.job_id);
+            resolve(job);
+        }
+    });
+}
+
+function showJobProgress(progress) {
+    document.getElementById('reconcile-btn').textContent =
+        `⏳ ${progress.stage}: ${progress.rows_processed.toLocaleString()} rows`;
+}
+
+const JOB_POLL_MS = 500;
+
+function isFinished(job) {
+    return !(job.status === 'queued' || job.status === 'running');
+}
+
+// Wait for a job via its events, polling only when the event stream is down
+async function waitForJob(job) {
+    if (events && events.readyState === EventSource.OPEN) {
+        const finished = new Promise(resolve => jobWaiters.set(job.job_id, resolve));
+        // The job may have finished before the waiter was registered
+        const statusResponse = await fetch(`${API_BASE}/reconcile/jobs/${job.job_id}`);
+        const current = await statusResponse.json();
+        if (!isFinished(current)) {
+            return finished;
+        }
+        jobWaiters.delete(job.job_id);
+        return current;
     }
+    
+    while (!isFinished(job)) {
+        await new Promise(resolve => setTimeout(resolve, JOB_POLL_MS));
+        const statusResponse = await fetch(`${API_BASE}/reconcile/jobs/${job.job_id}`);
+        job = await statusResponse.json();
+        if (job.stage) {
+            showJobProgress(job);
+        }
+    }
+    await loadData();
+    return job;
 }
 
 async function runReconciliation() {
@@ -103,14 +242,21 @@ async function runReconciliation() {
     btn.textContent = '⏳ Running...';
     
     try {
-        const response = await fetch(`${API_BASE}/reconcile/`, {
+        const submitResponse = await fetch(`${API_BASE}/reconcile/jobs`, {
             method: 'POST'
         });
-        const result = await response.json();
+        const job = await waitForJob(await submitResponse.json());
+        
+        // A run cancelled after matching committed is partial: its match results stand
+        if (job.status !== 'succeeded' && job.status !== 'partial') {
+            throw new Error(job.error || `Reconciliation ${job.status}`);
+        }
         
-        alert(`Reconciliation complete!\n\nIssues found: ${result.total}\n- Trade/Ledger mismatches: ${result.issues.length}\n- Anomalies: ${result.anomalies.length}`);
+        const resultResponse = await fetch(`${API_BASE}/reconcile/jobs/${job.job_id}/result`);
+        const result = await resultResponse.json();
         
-        await loadData();
+        const heading = job.status === 'partial' ? 'Reconciliation cancelled after matching.' : 'Reconciliation complete!';
+        alert(`${heading}\n\nIssues found: ${result.total}\n- Trade/Ledger mismatches: ${result.issues.length}\n- Anomalies: ${result.anomalies.length}`);
     } catch (error) {
         console.error('Error running reconciliation:', error);
         alert('Error running reconciliation');
@@ -148,15 +294,34 @@ async function askCopilot() {
     responseDiv.textContent = 'Thinking...';
     
     try {
-        const response = await fetch(`${API_BASE}/copilot/query`, {
+        const response = await fetch(`${API_BASE}/copilot/query/stream`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
             },
             body: JSON.stringify({ query })
         });
-        const data = await response.json();
-        responseDiv.textContent = data.answer;
+        
+        // Server-sent events: show each chunk as soon as it arrives
+        const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+        let buffer = '';
+        let answer = '';
+        while (true) {
+            const { value, done } = await reader.read();
+            if (done) break;
+            buffer += value;
+            const events = buffer.split('\n\n');
+            buffer = events.pop();
+            for (const event of events) {
+                if (event.startsWith('data: ')) {
+                    const data = JSON.parse(event.slice(6));
+                    if (data.text) {
+                        answer += data.text;
+                        responseDiv.textContent = answer;
+                    }
+                }
+            }
+        }
     } catch (error) {
         console.error('Error asking copilot:', error);
         responseDiv.textContent = 'Error getting response';